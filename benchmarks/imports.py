@@ -0,0 +1,131 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+"""Plugin import time benchmark.
+
+Every operation runs in a fresh agent process, which imports the plugin
+modules first. Each module is imported in a new interpreter, after the
+cloudify modules every plugin imports, and timed; the heavy dependencies
+it pulled in with it are listed too.
+
+    python -m benchmarks.imports            # print the results
+    python -m benchmarks.imports --check    # fail on regressions
+    python -m benchmarks.imports --save     # record new baselines
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+from benchmarks import render
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINES = os.path.join(BENCHMARKS_DIR, 'baselines', 'imports.json')
+MODULES = ('filebeat_plugin.tasks', 'filebeat_plugin.workflows')
+# Imported by cloudify anyway, so they cost the plugin nothing.
+PRELOADED = ('cloudify', 'cloudify.context', 'cloudify.decorators',
+             'cloudify.exceptions', 'cloudify.workflows')
+# Only the code paths which use them may import these.
+DEFERRED = ('distro', 'jinja2', 'pkg_resources', 'requests', 'yaml')
+REPEATS = 5
+TOLERANCE = 1.5
+# Imports faster than this are too quick to compare reliably.
+MIN_SECONDS = 0.01
+
+
+def run_case(name):
+    """Import module name in this process.
+
+    Returns the seconds it took and the deferred modules it loaded.
+    """
+    for module in PRELOADED:
+        __import__(module)
+    loaded = set(sys.modules)
+    started = time.time()
+    __import__(name)
+    seconds = time.time() - started
+    return {'seconds': seconds,
+            'deferred': sorted(module for module in DEFERRED
+                               if module in sys.modules and
+                               module not in loaded)}
+
+
+def run_all():
+    """Import every module REPEATS times, each time in a new process."""
+    calibration = min(render.calibrate() for _ in range(REPEATS))
+    results = {}
+    for name in MODULES:
+        runs = []
+        for _ in range(REPEATS):
+            output = subprocess.check_output(
+                [sys.executable, '-m', 'benchmarks.imports', '--case', name])
+            runs.append(json.loads(output.decode('utf-8')))
+        result = min(runs, key=lambda run: run['seconds'])
+        result['relative'] = result['seconds'] / calibration
+        results[name] = result
+    return results
+
+
+def regressions(results, baselines, tolerance=TOLERANCE):
+    """Return a description of every module slower to import than before,
+    or importing a deferred dependency.
+    """
+    found = []
+    for name, result in sorted(results.items()):
+        if result['deferred']:
+            found.append('{0}: imports {1} at load time'.format(
+                name, ', '.join(result['deferred'])))
+        baseline = baselines.get(name)
+        if baseline and result['seconds'] > MIN_SECONDS and \
+                result['relative'] > baseline['relative'] * tolerance:
+            found.append('{0}: {1:.1f}x slower than its baseline'.format(
+                name, result['relative'] / baseline['relative']))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--check', action='store_true',
+                        help='exit with 1 when an import regressed')
+    parser.add_argument('--save', action='store_true',
+                        help='save the results as the new baselines')
+    args = parser.parse_args(argv)
+
+    if args.case:
+        sys.stdout.write(json.dumps(run_case(args.case)) + '\n')
+        return 0
+    results = run_all()
+    for name, result in sorted(results.items()):
+        sys.stdout.write('{0:32} {1:9.4f}s {2}\n'.format(
+            name, result['seconds'], ' '.join(result['deferred'])))
+    if args.save:
+        with open(BASELINES, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True,
+                      separators=(',', ': '))
+            f.write('\n')
+    if args.check:
+        with open(BASELINES) as f:
+            found = regressions(results, json.load(f))
+        for regression in found:
+            sys.stderr.write(regression + '\n')
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+import os
+import re
+import time
+import threading
+
+# Every line starts with the time it was written and its sequence number.
+LINE_PATTERN = re.compile(r'^(\d+\.\d+) (\d+) ')
+ROTATIONS_KEPT = 5
+# Lines are written in batches this many times a second.
+TICKS_PER_SECOND = 20
+
+
+def make_line(sequence, size, now=None):
+    """Return a log line of size bytes, newline included."""
+    head = '{0:.6f} {1} '.format(now or time.time(), sequence)
+    return head + 'x' * max(0, size - len(head) - 1) + '\n'
+
+
+def parse_line(line):
+    """Return (written at, sequence) of a generated line, or None."""
+    match = LINE_PATTERN.match(line or '')
+    if not match:
+        return None
+    return float(match.group(1)), int(match.group(2))
+
+
+class LogGenerator(object):
+    """Append lines to files under directory at a steady rate.
+
+    Every file is rotated, the way logrotate does, once it grows over
+    rotate_bytes: app.log is renamed to app.log.1 and a new app.log is
+    started. Only the last ROTATIONS_KEPT rotations are kept.
+    """
+
+    def __init__(self, directory, rate, line_size=200, files=1,
+                 rotate_bytes=0):
+        self.directory = directory
+        self.rate = rate
+        self.line_size = line_size
+        self.rotate_bytes = rotate_bytes
+        self.paths = [os.path.join(directory, 'app{0}.log'.format(index))
+                      for index in range(files)]
+        self.written = 0
+        self.rotations = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def pattern(self):
+        return os.path.join(self.directory, 'app*.log')
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def write(self, count):
+        """Write count lines spread round robin over the files."""
+        handles = [open(path, 'a') for path in self.paths]
+        try:
+            for _ in range(count):
+                index = self.written % len(handles)
+                handles[index].write(make_line(self.written, self.line_size))
+                self.written += 1
+        finally:
+            for handle in handles:
+                handle.close()
+        if self.rotate_bytes:
+            for path in self.paths:
+                if os.path.getsize(path) > self.rotate_bytes:
+                    self._rotate(path)
+
+    def _rotate(self, path):
+        for index in range(ROTATIONS_KEPT - 1, 0, -1):
+            if os.path.exists('{0}.{1}'.format(path, index)):
+                os.rename('{0}.{1}'.format(path, index),
+                          '{0}.{1}'.format(path, index + 1))
+        os.rename(path, path + '.1')
+        open(path, 'a').close()
+        self.rotations += 1
+
+    def _loop(self):
+        started = time.time()
+        while not self._stop.is_set():
+            due = int((time.time() - started) * self.rate) - self.written
+            if due > 0:
+                self.write(due)
+            self._stop.wait(1.0 / TICKS_PER_SECOND)
@@ -0,0 +1,205 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+import io
+import gzip
+import json
+import time
+import zlib
+import struct
+import threading
+
+try:
+    import socketserver
+    from http.server import BaseHTTPRequestHandler
+except ImportError:
+    import SocketServer as socketserver
+    from BaseHTTPServer import BaseHTTPRequestHandler
+
+from benchmarks import loggen
+
+ELASTICSEARCH_VERSION = '5.6.0'
+
+
+class Recorder(object):
+    """Thread safe record of the events an output stand-in received."""
+
+    def __init__(self):
+        self.events = 0
+        self.bytes = 0
+        self.latencies = []
+        self.first = None
+        self.last = None
+        self._lock = threading.Lock()
+
+    def add(self, message):
+        received = time.time()
+        parsed = loggen.parse_line(message)
+        with self._lock:
+            self.events += 1
+            self.bytes += len(message)
+            self.first = self.first or received
+            self.last = received
+            if parsed:
+                self.latencies.append(received - parsed[0])
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _StandIn(object):
+    handler = None
+
+    def __init__(self, recorder=None):
+        self.recorder = recorder or Recorder()
+        self.server = _Server(('127.0.0.1', 0), self.handler)
+        self.server.recorder = self.recorder
+        self._thread = None
+
+    @property
+    def address(self):
+        return '{0}:{1}'.format(*self.server.server_address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _read(stream, size):
+    data = stream.read(size)
+    if len(data) < size:
+        raise EOFError()
+    return data
+
+
+def read_frames(stream):
+    """Yield (version, type, body) for the lumberjack frames in stream.
+
+    body is the sequence number and the message for data frames ('D' of
+    protocol 1, 'J' of protocol 2), the window size for 'W' frames.
+    Compressed frames are unpacked in place.
+    """
+    while True:
+        try:
+            version, kind = struct.unpack('!cc', _read(stream, 2))
+        except EOFError:
+            return
+        if kind == b'W':
+            yield version, kind, struct.unpack('!I', _read(stream, 4))[0]
+        elif kind == b'C':
+            size = struct.unpack('!I', _read(stream, 4))[0]
+            inner = io.BytesIO(zlib.decompress(_read(stream, size)))
+            for frame in read_frames(inner):
+                yield frame
+        elif kind == b'J':
+            sequence, size = struct.unpack('!II', _read(stream, 8))
+            event = json.loads(_read(stream, size).decode('utf-8'))
+            yield version, kind, (sequence, event.get('message', ''))
+        elif kind == b'D':
+            sequence, pairs = struct.unpack('!II', _read(stream, 8))
+            fields = {}
+            for _ in range(pairs):
+                key = _read(stream, struct.unpack('!I', _read(stream, 4))[0])
+                value = _read(stream,
+                              struct.unpack('!I', _read(stream, 4))[0])
+                fields[key.decode('utf-8')] = value.decode('utf-8')
+            yield version, kind, (sequence, fields.get('line',
+                                                       fields.get('message',
+                                                                  '')))
+        else:
+            raise ValueError('unknown lumberjack frame {0!r}'.format(kind))
+
+
+class _LumberjackHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        window, received = 0, 0
+        for version, kind, body in read_frames(self.rfile):
+            if kind == b'W':
+                window, received = body, 0
+                continue
+            sequence, message = body
+            self.server.recorder.add(message)
+            received += 1
+            if received >= window:
+                self.wfile.write(struct.pack('!ccI', version, b'A', sequence))
+                self.wfile.flush()
+
+
+class LogstashStandIn(_StandIn):
+    """Beats (lumberjack) listener acknowledging every window it gets."""
+    handler = _LumberjackHandler
+
+
+class _BulkHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body, status=200):
+        body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=io.BytesIO(body)).read()
+        return body.decode('utf-8')
+
+    def do_GET(self):
+        self._reply({'name': 'stand-in', 'tagline': 'You Know, for Search',
+                     'version': {'number': ELASTICSEARCH_VERSION}})
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_PUT(self):
+        self._body()
+        self._reply({'acknowledged': True})
+
+    def do_POST(self):
+        body = self._body()
+        if '_bulk' not in self.path:
+            return self._reply({'acknowledged': True})
+        lines = [line for line in body.split('\n') if line.strip()]
+        items = []
+        # Every document is an action line followed by its source line.
+        for action, source in zip(lines[::2], lines[1::2]):
+            self.server.recorder.add(json.loads(source).get('message', ''))
+            items.append({list(json.loads(action))[0]: {'status': 201}})
+        self._reply({'took': 1, 'errors': False, 'items': items})
+
+
+class ElasticsearchStandIn(_StandIn):
+    """Elasticsearch HTTP endpoint accepting every _bulk document."""
+    handler = _BulkHandler
+
+
+STAND_INS = {'logstash': LogstashStandIn,
+             'elasticsearch': ElasticsearchStandIn}
@@ -0,0 +1,244 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+"""Configuration rendering micro-benchmarks.
+
+Times and memory-profiles rendering filebeat.yml, both the default way,
+from the configuration model, and through a user template fetched with
+ctx.get_resource, for growing prospector counts and output host lists.
+Every case is built and run in its own process, so the memory it
+needs is its own.
+
+    python -m benchmarks.render            # print the results
+    python -m benchmarks.render --check    # fail on regressions
+    python -m benchmarks.render --save     # record new baselines
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINES = os.path.join(BENCHMARKS_DIR, 'baselines', 'render.json')
+# The template the bundled configuration used to be rendered with.
+USER_TEMPLATE = os.path.join(BENCHMARKS_DIR, 'resources', 'filebeat.yml')
+PROSPECTOR_COUNTS = (10, 1000, 50000)
+HOST_COUNT = 10000
+REPEATS = 5
+# A case regresses when it is this much slower, or uses this much more
+# memory, than its baseline.
+TOLERANCE = 1.5
+# Renders faster than this, and memory growth below MEMORY_SLACK, are
+# too small to compare reliably.
+MIN_SECONDS = 0.05
+MEMORY_SLACK = 8 * 1024 * 1024
+# Seconds are compared relative to this fixed workload, which makes
+# baselines recorded on one machine usable on another.
+CALIBRATION_LOOPS = 2000000
+
+
+def case_names():
+    """Return the name of every case."""
+    names = []
+    for template in ('default', 'user'):
+        names.extend('{0}-{1}-prospectors'.format(template, count)
+                     for count in PROSPECTOR_COUNTS)
+        names.append('{0}-{1}-hosts'.format(template, HOST_COUNT))
+    return sorted(names)
+
+
+def build_case(name):
+    """Return (template, filebeat_config) of case name, and only of it."""
+    if name not in case_names():
+        raise ValueError('Unknown case {0}'.format(name))
+    template, count, kind = name.split('-')
+    count = int(count)
+    if kind == 'prospectors':
+        return template, {
+            'inputs': {'shipper': None},
+            'outputs': {'logstash': {'hosts': ['localhost:5044']}},
+            'paths': dict(
+                ('service{0}'.format(index),
+                 ['/var/log/service{0}/*.log'.format(index),
+                  '/var/log/service{0}/current'.format(index)])
+                for index in range(count))}
+    hosts = ['logstash{0}.example.com:5044'.format(index)
+             for index in range(count)]
+    return template, {
+        'inputs': {'shipper': None},
+        'outputs': {'logstash': {'hosts': hosts, 'loadbalance': True},
+                    'elasticsearch': {'hosts': hosts}},
+        'paths': {'syslog': ['/var/log/syslog']}}
+
+
+def calibrate():
+    started = time.time()
+    total = 0
+    for index in range(CALIBRATION_LOOPS):
+        total += index % 7
+    return time.time() - started
+
+
+def _status(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def _reset_peak_rss():
+    """Reset VmHWM to the current RSS; return whether the kernel let us."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def peak_memory(render):
+    """Call render; return how many bytes it needed at its peak.
+
+    Python allocations are traced with tracemalloc where there is one. On
+    Python 2 the growth of the resident memory is read from /proc, from
+    its peak when the kernel lets us reset that, else from after render.
+    """
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+    if tracemalloc:
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            render()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return max(peak - before, 0)
+    before = _status('VmRSS')
+    field = 'VmHWM' if _reset_peak_rss() else 'VmRSS'
+    render()
+    return max(_status(field) - before, 0)
+
+
+def run_case(name):
+    """Render case name REPEATS times in this process.
+
+    Returns the fastest render's seconds and the memory the first render
+    needs at its peak, measured apart so tracing does not slow the timing.
+    """
+    from cloudify.mocks import MockCloudifyContext
+    from cloudify.state import current_ctx
+    from filebeat_plugin import tasks
+
+    template, config = build_case(name)
+    with open(USER_TEMPLATE) as f:
+        source = f.read()
+
+    class Context(MockCloudifyContext):
+        def get_resource(self, resource_path):
+            return source
+
+    work_dir = tempfile.mkdtemp(prefix='filebeat-render-')
+    tasks.FILEBEAT_STATE_DIR_DEFAULT = work_dir
+    current_ctx.set(Context(node_id='benchmark'))
+    config_file = 'filebeat.yml' if template == 'user' else ''
+    variables = dict(config, config_dir='', config_reload=False,
+                     prospector_options={})
+    dest_file = os.path.join(work_dir, 'rendered.yml')
+    try:
+        peak_bytes = peak_memory(
+            lambda: tasks._render_config(config_file, variables, dest_file))
+        timings = []
+        for _ in range(REPEATS):
+            started = time.time()
+            tasks._render_config(config_file, variables, dest_file)
+            timings.append(time.time() - started)
+    finally:
+        current_ctx.clear()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {'seconds': min(timings), 'peak_bytes': peak_bytes}
+
+
+def run_all():
+    """Run every case in a child process; return {name: result}."""
+    calibration = min(calibrate() for _ in range(REPEATS))
+    results = {}
+    for name in case_names():
+        output = subprocess.check_output(
+            [sys.executable, '-m', 'benchmarks.render', '--case', name])
+        result = json.loads(output.decode('utf-8'))
+        result['relative'] = result['seconds'] / calibration
+        results[name] = result
+    return results
+
+
+def regressions(results, baselines, tolerance=TOLERANCE):
+    """Return a description of every case slower or bigger than before."""
+    found = []
+    for name, result in sorted(results.items()):
+        baseline = baselines.get(name)
+        if not baseline:
+            continue
+        if result['seconds'] > MIN_SECONDS and \
+                result['relative'] > baseline['relative'] * tolerance:
+            found.append('{0}: {1:.1f}x slower than its baseline'.format(
+                name, result['relative'] / baseline['relative']))
+        if result['peak_bytes'] > \
+                baseline['peak_bytes'] * tolerance + MEMORY_SLACK:
+            found.append('{0}: peak memory grew by {1} bytes, {2} in its '
+                         'baseline'.format(name, result['peak_bytes'],
+                                           baseline['peak_bytes']))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--check', action='store_true',
+                        help='exit with 1 when a case regressed')
+    parser.add_argument('--save', action='store_true',
+                        help='save the results as the new baselines')
+    args = parser.parse_args(argv)
+
+    if args.case:
+        sys.stdout.write(json.dumps(run_case(args.case)) + '\n')
+        return 0
+    results = run_all()
+    for name, result in sorted(results.items()):
+        sys.stdout.write('{0:32} {1:9.4f}s {2:12d} bytes\n'.format(
+            name, result['seconds'], result['peak_bytes']))
+    if args.save:
+        with open(BASELINES, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True,
+                      separators=(',', ': '))
+            f.write('\n')
+    if args.check:
+        with open(BASELINES) as f:
+            found = regressions(results, json.load(f))
+        for regression in found:
+            sys.stderr.write(regression + '\n')
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
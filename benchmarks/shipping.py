@@ -0,0 +1,232 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+"""End to end shipping benchmark.
+
+Generates logs at a set rate, ships them with the local filebeat through a
+config rendered by the configure operation to a local Logstash or
+Elasticsearch stand-in, and reports throughput, ship latency and filebeat's
+CPU and memory use. Needs filebeat on the PATH and sudo, like configure:
+
+    python -m benchmarks.shipping --output logstash --rate 5000 \\
+        --output-options '{"worker": 2}' --auto-tune
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+
+from cloudify.mocks import MockCloudifyContext
+from cloudify.state import current_ctx
+
+from filebeat_plugin import tasks
+from benchmarks import loggen
+from benchmarks import outputs
+
+DRAIN_TIMEOUT = 30
+SAMPLE_INTERVAL = 0.5
+
+
+def percentile(values, share):
+    """Nearest rank percentile of values, share between 0 and 1."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def render_config(work_dir, filebeat_config, auto_tune=False,
+                  plan_paths=False):
+    """Render filebeat_config with the configure operation.
+
+    Returns (config file, runtime properties configure set).
+    """
+    config_file = os.path.join(work_dir, 'filebeat.yml')
+    context = MockCloudifyContext(node_id='benchmark')
+    saved = (tasks.FILEBEAT_CONFIG_FILE_DEFAULT,
+             tasks.FILEBEAT_STATE_DIR_DEFAULT)
+    tasks.FILEBEAT_CONFIG_FILE_DEFAULT = config_file
+    tasks.FILEBEAT_STATE_DIR_DEFAULT = work_dir
+    current_ctx.set(context)
+    try:
+        # Not the registry of the filebeat service of this host.
+        tasks.configure('', filebeat_config, auto_tune=auto_tune,
+                        plan_paths=plan_paths,
+                        registry_file=os.path.join(work_dir, 'registry'))
+    finally:
+        current_ctx.clear()
+        tasks.FILEBEAT_CONFIG_FILE_DEFAULT, \
+            tasks.FILEBEAT_STATE_DIR_DEFAULT = saved
+    return config_file, dict(context.instance.runtime_properties)
+
+
+class ProcessSampler(object):
+    """Samples the CPU time and resident memory of a process from /proc."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.rss_peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop)
+        self._thread.daemon = True
+
+    def cpu_seconds(self):
+        with open('/proc/{0}/stat'.format(self.pid)) as f:
+            # The command name may hold spaces, fields follow its ')'.
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / \
+            float(os.sysconf('SC_CLK_TCK'))
+
+    def rss(self):
+        with open('/proc/{0}/status'.format(self.pid)) as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    def start(self):
+        self.started = time.time()
+        self.cpu_started = self.cpu_seconds()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.cpu_percent = 100 * (self.cpu_seconds() - self.cpu_started) / \
+            max(time.time() - self.started, 1e-6)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.rss_peak = max(self.rss_peak, self.rss())
+            except (IOError, OSError):
+                return
+            self._stop.wait(SAMPLE_INTERVAL)
+
+
+def _filebeat_command(config_file, work_dir):
+    command = ['filebeat', '-e', '-c', config_file]
+    version = tasks._filebeat_version()
+    if version and version[0] >= 5:
+        command += ['-path.data', os.path.join(work_dir, 'data'),
+                    '-path.logs', os.path.join(work_dir, 'logs')]
+    if version and version[0] >= 6:
+        # configure leaves the config owned by root.
+        command += ['-strict.perms=false']
+    return command
+
+
+def run(output='logstash', rate=1000, line_size=200, files=1,
+        rotate_bytes=0, duration=30, output_options=None, auto_tune=False,
+        plan_paths=False, work_dir=None):
+    """Run one benchmark and return its report as a dict."""
+    work_dir = work_dir or tempfile.mkdtemp(prefix='filebeat-bench-')
+    log_dir = os.path.join(work_dir, 'logs-in')
+    os.makedirs(log_dir)
+    stand_in = outputs.STAND_INS[output]().start()
+    generator = loggen.LogGenerator(log_dir, rate, line_size, files,
+                                    rotate_bytes)
+    generator.write(files)
+    filebeat = None
+    try:
+        config_file, properties = render_config(
+            work_dir,
+            {'inputs': {},
+             'outputs': {output: dict(output_options or {},
+                                      hosts=[stand_in.address])},
+             'paths': {'benchmark': [generator.pattern]}},
+            auto_tune, plan_paths)
+        with open(os.path.join(work_dir, 'filebeat.out'), 'w') as log:
+            filebeat = subprocess.Popen(
+                _filebeat_command(config_file, work_dir), cwd=work_dir,
+                stdout=log, stderr=subprocess.STDOUT)
+        sampler = ProcessSampler(filebeat.pid)
+        sampler.start()
+        generator.start()
+        time.sleep(duration)
+        generator.stop()
+        deadline = time.time() + DRAIN_TIMEOUT
+        while stand_in.recorder.events < generator.written and \
+                time.time() < deadline and filebeat.poll() is None:
+            time.sleep(SAMPLE_INTERVAL)
+        sampler.stop()
+    finally:
+        if filebeat and filebeat.poll() is None:
+            filebeat.terminate()
+            filebeat.wait()
+        stand_in.stop()
+
+    recorder = stand_in.recorder
+    elapsed = max((recorder.last or 0) - (recorder.first or 0), 1e-6)
+    return {
+        'parameters': {'output': output, 'rate': rate,
+                       'line_size': line_size, 'files': files,
+                       'rotate_bytes': rotate_bytes, 'duration': duration,
+                       'output_options': output_options or {},
+                       'auto_tune': auto_tune, 'plan_paths': plan_paths},
+        'written': generator.written,
+        'rotations': generator.rotations,
+        'shipped': recorder.events,
+        'events_per_second': recorder.events / elapsed,
+        'bytes_per_second': recorder.bytes / elapsed,
+        'latency_seconds': dict(
+            (name, percentile(recorder.latencies, share))
+            for name, share in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99),
+                                ('max', 1.0))),
+        'cpu_percent': sampler.cpu_percent,
+        'rss_peak_bytes': sampler.rss_peak,
+        'runtime_properties': properties,
+        'work_dir': work_dir}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--output', choices=sorted(outputs.STAND_INS),
+                        default='logstash')
+    parser.add_argument('--rate', type=int, default=1000,
+                        help='lines written per second')
+    parser.add_argument('--line-size', type=int, default=200)
+    parser.add_argument('--files', type=int, default=1)
+    parser.add_argument('--rotate-bytes', type=int, default=0,
+                        help='rotate files over this size, 0 never rotates')
+    parser.add_argument('--duration', type=int, default=30)
+    parser.add_argument('--output-options', type=json.loads, default={},
+                        help='JSON options of the output, e.g. worker')
+    parser.add_argument('--auto-tune', action='store_true')
+    parser.add_argument('--plan-paths', action='store_true')
+    parser.add_argument('--report', help='also write the report here')
+    parser.add_argument('--keep', action='store_true',
+                        help='keep the work directory')
+    args = parser.parse_args(argv)
+
+    report = run(args.output, args.rate, args.line_size, args.files,
+                 args.rotate_bytes, args.duration, args.output_options,
+                 args.auto_tune, args.plan_paths)
+    text = json.dumps(report, indent=2, sort_keys=True, default=str)
+    if args.report:
+        with open(args.report, 'w') as f:
+            f.write(text + '\n')
+    if not args.keep:
+        shutil.rmtree(report['work_dir'], ignore_errors=True)
+    sys.stdout.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import os
+import json
+import time
+import zlib
+import shutil
+import socket
+import struct
+import unittest
+import tempfile
+
+import requests
+
+from .. import imports
+from .. import loggen
+from .. import outputs
+from .. import render
+from .. import shipping
+
+
+TEMP_BENCH = os.path.join(tempfile.gettempdir(), 'filebeat_bench')
+
+
+def json_frame(sequence, message):
+    payload = json.dumps({'message': message}).encode('utf-8')
+    return struct.pack('!ccII', b'2', b'J', sequence, len(payload)) + payload
+
+
+def data_frame(sequence, message):
+    pairs = b''
+    for key, value in ((b'line', message.encode('utf-8')), (b'host', b'a')):
+        pairs += struct.pack('!I', len(key)) + key + \
+            struct.pack('!I', len(value)) + value
+    return struct.pack('!ccII', b'1', b'D', sequence, 2) + pairs
+
+
+def compressed(frames, version=b'2'):
+    payload = zlib.compress(frames)
+    return struct.pack('!ccI', version, b'C', len(payload)) + payload
+
+
+def window(size, version=b'2'):
+    return struct.pack('!ccI', version, b'W', size)
+
+
+class TestLogGenerator(unittest.TestCase):
+
+    def setUp(self):
+        os.mkdir(TEMP_BENCH)
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_BENCH)
+
+    def test_line(self):
+        line = loggen.make_line(7, 100, now=12.5)
+        self.assertEqual(len(line), 100)
+        self.assertEqual(loggen.parse_line(line), (12.5, 7))
+        self.assertIsNone(loggen.parse_line('free text'))
+
+    def test_rotation(self):
+        generator = loggen.LogGenerator(TEMP_BENCH, 0, line_size=100,
+                                        files=2, rotate_bytes=999)
+        for _ in range(4):
+            generator.write(20)
+        self.assertEqual(generator.written, 80)
+        self.assertEqual(generator.rotations, 8)
+        self.assertEqual(
+            sorted(os.listdir(TEMP_BENCH)),
+            ['app0.log', 'app0.log.1', 'app0.log.2', 'app0.log.3',
+             'app0.log.4', 'app1.log', 'app1.log.1', 'app1.log.2',
+             'app1.log.3', 'app1.log.4'])
+
+    def test_percentile(self):
+        values = list(range(100, 0, -1))
+        self.assertEqual(shipping.percentile(values, 0.5), 51)
+        self.assertEqual(shipping.percentile(values, 1.0), 100)
+        self.assertIsNone(shipping.percentile([], 0.5))
+
+
+class TestOutputStandIns(unittest.TestCase):
+
+    def _send(self, stand_in, payload, acks):
+        connection = socket.create_connection(
+            stand_in.server.server_address)
+        try:
+            connection.sendall(payload)
+            received = b''
+            while len(received) < 6 * acks:
+                received += connection.recv(1024)
+        finally:
+            connection.close()
+        return [struct.unpack('!ccI', received[i:i + 6])
+                for i in range(0, len(received), 6)]
+
+    def test_logstash_protocol_2(self):
+        stand_in = outputs.LogstashStandIn().start()
+        try:
+            line = loggen.make_line(1, 50, now=time.time() - 1)
+            acks = self._send(stand_in, window(2) + compressed(
+                json_frame(1, line) + json_frame(2, line)), 1)
+        finally:
+            stand_in.stop()
+        self.assertEqual(acks, [(b'2', b'A', 2)])
+        self.assertEqual(stand_in.recorder.events, 2)
+        self.assertEqual(stand_in.recorder.bytes, 100)
+        self.assertTrue(stand_in.recorder.latencies[0] >= 1)
+
+    def test_logstash_protocol_1(self):
+        stand_in = outputs.LogstashStandIn().start()
+        try:
+            acks = self._send(stand_in, window(1, b'1') + data_frame(
+                5, 'hello') + window(1, b'1') + compressed(
+                data_frame(6, 'world'), b'1'), 2)
+        finally:
+            stand_in.stop()
+        self.assertEqual(acks, [(b'1', b'A', 5), (b'1', b'A', 6)])
+        self.assertEqual(stand_in.recorder.events, 2)
+        self.assertEqual(stand_in.recorder.latencies, [])
+
+    def test_elasticsearch_bulk(self):
+        stand_in = outputs.ElasticsearchStandIn().start()
+        try:
+            url = 'http://{0}'.format(stand_in.address)
+            self.assertEqual(requests.get(url).json()['version']['number'],
+                             outputs.ELASTICSEARCH_VERSION)
+            body = ''.join(
+                json.dumps(line) + '\n' for line in (
+                    {'index': {'_index': 'filebeat'}}, {'message': 'a'},
+                    {'create': {'_index': 'filebeat'}}, {'message': 'bc'}))
+            reply = requests.post(url + '/_bulk', data=body).json()
+        finally:
+            stand_in.stop()
+        self.assertFalse(reply['errors'])
+        self.assertEqual([list(item) for item in reply['items']],
+                         [['index'], ['create']])
+        self.assertEqual(stand_in.recorder.events, 2)
+        self.assertEqual(stand_in.recorder.bytes, 3)
+
+
+class TestRenderBenchmark(unittest.TestCase):
+
+    def test_cases(self):
+        names = render.case_names()
+        self.assertEqual(len(names), 2 * (len(render.PROSPECTOR_COUNTS) + 1))
+        template, config = render.build_case('user-1000-prospectors')
+        self.assertEqual(template, 'user')
+        self.assertEqual(len(config['paths']), 1000)
+        template, config = render.build_case('default-10000-hosts')
+        self.assertEqual(template, 'default')
+        self.assertEqual(len(config['outputs']['logstash']['hosts']), 10000)
+        self.assertRaises(ValueError, render.build_case, 'user-5-hosts')
+
+    def test_peak_memory(self):
+        def allocate():
+            block = bytearray(32 * 1024 * 1024)
+            block[::4096] = b'x' * len(block[::4096])
+            del block
+        self.assertGreaterEqual(render.peak_memory(allocate),
+                                16 * 1024 * 1024)
+
+    def test_regressions(self):
+        baselines = {'a': {'seconds': 1.0, 'relative': 10.0,
+                           'peak_bytes': 100 * 1024 ** 2},
+                     'b': {'seconds': 0.001, 'relative': 0.01,
+                           'peak_bytes': 0}}
+        results = {'a': {'seconds': 1.2, 'relative': 12.0,
+                         'peak_bytes': 110 * 1024 ** 2},
+                   'b': {'seconds': 0.004, 'relative': 0.04,
+                         'peak_bytes': 1024},
+                   'new': {'seconds': 9.0, 'relative': 90.0,
+                           'peak_bytes': 0}}
+        self.assertEqual(render.regressions(results, baselines), [])
+        results['a'].update(relative=20.0, peak_bytes=200 * 1024 ** 2)
+        self.assertEqual(len(render.regressions(results, baselines)), 2)
+
+
+class TestImportsBenchmark(unittest.TestCase):
+
+    def test_run_case(self):
+        result = imports.run_case('filebeat_plugin.versions')
+        self.assertEqual(result['deferred'], [])
+
+    def test_regressions(self):
+        baselines = {'a': {'seconds': 0.05, 'relative': 1.0,
+                           'deferred': []}}
+        results = {'a': {'seconds': 0.06, 'relative': 1.2, 'deferred': []},
+                   'new': {'seconds': 0.001, 'relative': 0.02,
+                           'deferred': []}}
+        self.assertEqual(imports.regressions(results, baselines), [])
+        results['a'].update(relative=2.0, deferred=['pkg_resources'])
+        self.assertEqual(imports.regressions(results, baselines), [
+            'a: imports pkg_resources at load time',
+            'a: 2.0x slower than its baseline'])
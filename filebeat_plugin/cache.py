@@ -0,0 +1,158 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+import os
+import json
+import time
+import fcntl
+import errno
+import hashlib
+import tempfile
+import contextlib
+
+INDEX_FILE = 'index.json'
+LOCK_FILE = '.lock'
+BLOBS_DIR = 'blobs'
+CACHE_SIZE_DEFAULT = 512 * 1024 * 1024
+
+
+class ChecksumMismatch(ValueError):
+    pass
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """Return the sha256 hex digest of a local file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PackageCache(object):
+    """Content-addressed on-host store for downloaded filebeat packages.
+
+    Blobs are kept under <root>/blobs/<sha256>. The index maps each source
+    url to the digest of its content and to the last time it was used, so
+    that a lookup never touches the network and eviction can drop the
+    least recently used blobs once the byte budget is exceeded.
+    """
+
+    def __init__(self, root, max_bytes=CACHE_SIZE_DEFAULT):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.blobs_dir = os.path.join(root, BLOBS_DIR)
+        if not os.path.isdir(self.blobs_dir):
+            try:
+                os.makedirs(self.blobs_dir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def blob_path(self, digest):
+        return os.path.join(self.blobs_dir, digest)
+
+    def lookup(self, url, sha256=None):
+        """Return the cached file for url, or None on a miss.
+
+        When sha256 is given the cached content must carry that digest.
+        """
+        with self._locked_index() as index:
+            entry = index.get(url)
+            if not entry:
+                return None
+            if sha256 and entry['sha256'] != sha256.lower():
+                return None
+            path = self.blob_path(entry['sha256'])
+            if not os.path.isfile(path) or \
+                    os.path.getsize(path) != entry['size']:
+                del index[url]
+                return None
+            entry['last_used'] = time.time()
+            return path
+
+    def partial_path(self, url):
+        """Return a stable download location for url inside the cache.
+
+        Keeping it stable lets an interrupted download resume on retry.
+        """
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, key + '.partial')
+
+    def store_file(self, url, path, sha256=None):
+        """Move an already downloaded file into the cache.
+
+        The file is consumed. Returns the path of the cached blob. Raises
+        ChecksumMismatch, and keeps nothing, when the content does not
+        match sha256.
+        """
+        return self._commit(url, path, file_digest(path), sha256)
+
+    def _commit(self, url, partial, actual, sha256):
+        if sha256 and actual != sha256.lower():
+            os.remove(partial)
+            raise ChecksumMismatch(
+                'Checksum mismatch for {0}: expected {1}, got {2}'.format(
+                    url, sha256, actual))
+        path = self.blob_path(actual)
+        size = os.path.getsize(partial)
+        os.rename(partial, path)
+        with self._locked_index() as index:
+            index[url] = {'sha256': actual,
+                          'size': size,
+                          'filename': url.split('/')[-1],
+                          'last_used': time.time()}
+            self._evict(index, keep=actual)
+        return path
+
+    def _evict(self, index, keep=None):
+        blobs = {}
+        for url, entry in index.items():
+            used = blobs.get(entry['sha256'], (0, 0))[1]
+            blobs[entry['sha256']] = (entry['size'],
+                                      max(used, entry['last_used']))
+        total = sum(size for size, _ in blobs.values())
+        by_age = sorted(blobs.items(), key=lambda item: item[1][1])
+        for digest, (size, _) in by_age:
+            if total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            for url in [u for u, e in index.items() if e['sha256'] == digest]:
+                del index[url]
+            if os.path.exists(self.blob_path(digest)):
+                os.remove(self.blob_path(digest))
+            total -= size
+
+    @contextlib.contextmanager
+    def _locked_index(self):
+        index_path = os.path.join(self.root, INDEX_FILE)
+        with open(os.path.join(self.root, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                index = {}
+                if os.path.isfile(index_path):
+                    with open(index_path) as f:
+                        try:
+                            index = json.load(f)
+                        except ValueError:
+                            index = {}
+                yield index
+                fd, temp_index = tempfile.mkstemp(dir=self.root)
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(index, f)
+                os.rename(temp_index, index_path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
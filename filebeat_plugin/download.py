@@ -0,0 +1,202 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+import os
+import json
+import threading
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+CHUNK_SIZE = 1024 * 1024
+# Segments are read in smaller chunks, since a connection closed early
+# loses the chunk being read.
+SEGMENT_CHUNK_SIZE = 64 * 1024
+SEGMENTS_DEFAULT = 4
+SEGMENT_MIN_SIZE = 4 * 1024 * 1024
+TIMEOUT_DEFAULT = 60
+RETRIES_DEFAULT = 3
+PROGRESS_SUFFIX = '.progress'
+RETRIABLE_ERRORS = (requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout)
+
+
+class DownloadError(IOError):
+    pass
+
+
+class _ShortRead(DownloadError):
+    pass
+
+
+def session(pool_size=SEGMENTS_DEFAULT):
+    """Return a requests session whose connection pool fits all segments."""
+    http = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                            pool_maxsize=pool_size)
+    http.mount('http://', adapter)
+    http.mount('https://', adapter)
+    return http
+
+
+def fetch(url,
+          target,
+          segments=SEGMENTS_DEFAULT,
+          timeout=TIMEOUT_DEFAULT,
+          retries=RETRIES_DEFAULT,
+          http=None):
+    """Download url into target, resuming whatever a previous call left.
+
+    Large artifacts served with Range support are split into `segments`
+    concurrent ranges written in place into a preallocated file. Progress
+    is journaled next to target, so a call that follows a timeout or a
+    dropped connection only fetches the missing bytes. A url which
+    rejects HEAD is fetched with a single GET.
+    Returns the size of the downloaded file.
+    """
+    http = http or session(segments)
+    head = http.head(url, allow_redirects=True, timeout=timeout)
+    try:
+        head.raise_for_status()
+    except requests.exceptions.HTTPError:
+        # Some servers, such as presigned object store urls, only
+        # answer GET.
+        return _fetch_single(http, url, target, timeout, retries)
+    size = int(head.headers.get('Content-Length') or 0)
+    ranges = head.headers.get('Accept-Ranges', '').lower() == 'bytes'
+    if not (size and ranges):
+        return _fetch_single(http, url, target, timeout, retries)
+
+    validator = head.headers.get('ETag') or \
+        head.headers.get('Last-Modified') or ''
+    progress = _load_progress(target, size, validator)
+    if progress is None:
+        count = max(1, min(segments, size // SEGMENT_MIN_SIZE))
+        step = -(-size // count)
+        progress = {'size': size,
+                    'validator': validator,
+                    'segments': [[start, min(start + step, size), 0]
+                                 for start in range(0, size, step)]}
+        with open(target, 'wb') as f:
+            f.truncate(size)
+    _save_progress(target, progress)
+
+    lock = threading.Lock()
+
+    def run_segment(segment):
+        _fetch_segment(http, url, target, segment, lock, progress,
+                       timeout, retries)
+
+    pending = [s for s in progress['segments'] if s[0] + s[2] < s[1]]
+    if len(pending) > 1:
+        pool = ThreadPool(len(pending))
+        try:
+            pool.map(run_segment, pending)
+        finally:
+            pool.close()
+            pool.join()
+    elif pending:
+        run_segment(pending[0])
+    os.remove(target + PROGRESS_SUFFIX)
+    return size
+
+
+def _fetch_segment(http, url, target, segment, lock, progress,
+                   timeout, retries):
+    start, end, _ = segment
+    attempt = 0
+    while start + segment[2] < end:
+        offset = start + segment[2]
+        headers = {'Range': 'bytes={0}-{1}'.format(offset, end - 1)}
+        try:
+            response = http.get(url, headers=headers, stream=True,
+                                timeout=timeout)
+            response.raise_for_status()
+        except RETRIABLE_ERRORS:
+            attempt += 1
+            if attempt > retries:
+                raise
+            continue
+        if response.status_code != 206:
+            raise DownloadError(
+                'Range request ignored by server for {0}'.format(url))
+        try:
+            with open(target, 'r+b') as f:
+                f.seek(offset)
+                for chunk in response.iter_content(
+                        chunk_size=SEGMENT_CHUNK_SIZE):
+                    chunk = chunk[:end - start - segment[2]]
+                    if not chunk:
+                        continue
+                    f.write(chunk)
+                    f.flush()
+                    with lock:
+                        segment[2] += len(chunk)
+                        _save_progress(target, progress)
+            if start + segment[2] < end:
+                raise _ShortRead('Connection closed early for {0}'.format(
+                    url))
+        except RETRIABLE_ERRORS + (_ShortRead,) as e:
+            # urllib3 1.x ends the content early, 2.x raises; either way
+            # the bytes written are kept and the rest is asked for again.
+            attempt += 1
+            if attempt > retries:
+                if isinstance(e, DownloadError):
+                    raise
+                raise DownloadError(
+                    'Connection closed early for {0}: {1}'.format(url, e))
+
+
+def _fetch_single(http, url, target, timeout, retries):
+    attempt = 0
+    while True:
+        try:
+            response = http.get(url, stream=True, timeout=timeout)
+            response.raise_for_status()
+            size = 0
+            with open(target, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    if chunk:
+                        f.write(chunk)
+                        size += len(chunk)
+            return size
+        except RETRIABLE_ERRORS:
+            attempt += 1
+            if attempt > retries:
+                raise
+
+
+def _load_progress(target, size, validator):
+    progress_file = target + PROGRESS_SUFFIX
+    if not (os.path.isfile(target) and os.path.isfile(progress_file)):
+        return None
+    try:
+        with open(progress_file) as f:
+            progress = json.load(f)
+    except ValueError:
+        return None
+    if progress.get('size') != size or \
+            progress.get('validator') != validator or \
+            os.path.getsize(target) != size:
+        return None
+    return progress
+
+
+def _save_progress(target, progress):
+    progress_file = target + PROGRESS_SUFFIX
+    with open(progress_file + '.tmp', 'w') as f:
+        json.dump(progress, f)
+    os.rename(progress_file + '.tmp', progress_file)
@@ -0,0 +1,119 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+import os
+import re
+import json
+
+from filebeat_plugin import model
+
+FRAGMENT_SUFFIX = '.yml'
+# filebeat watches and reloads prospector files by itself from 5.3 on.
+RELOAD_MIN_VERSION = (5, 3)
+
+
+def supports_reload(version):
+    return version is not None and tuple(version[:2]) >= RELOAD_MIN_VERSION
+
+
+def fragment_name(document_type):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', document_type) + FRAGMENT_SUFFIX
+
+
+def render(paths, reload, options=None, version=None):
+    """Return {fragment file name: content}, one per document_type.
+
+    options maps a document_type to extra prospector options, version is
+    the filebeat version the prospectors are written for.
+
+    Older filebeat versions expect a full filebeat config in every file of
+    config_dir; with reload support a file holds a bare prospector list.
+    JSON is emitted since it is valid YAML and serializes deterministically.
+    Raises ValueError when two document_types get the same file name.
+    """
+    fragments = {}
+    document_types = {}
+    for document_type, globs in sorted((paths or {}).items()):
+        name = fragment_name(document_type)
+        if name in document_types:
+            raise ValueError(
+                'paths {0} and {1} would both be written to {2}, rename '
+                'one of them'.format(document_types[name], document_type,
+                                     name))
+        document_types[name] = document_type
+        prospector = model.Prospector(
+            document_type, globs,
+            (options or {}).get(document_type), version).to_dict()
+        if reload:
+            content = [prospector]
+        else:
+            content = {'filebeat': {'prospectors': [prospector]}}
+        fragments[name] = json.dumps(content, indent=2, sort_keys=True) + '\n'
+    return fragments
+
+
+class Manifest(object):
+    """The fragment files written to each directory, kept in a file.
+
+    Only files named here are ever removed, so prospector files put in
+    the directory by anything else are left alone.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        if os.path.isfile(path):
+            try:
+                with open(path) as f:
+                    self.files = json.load(f)
+            except ValueError:
+                self.files = {}
+
+    def written(self, directory):
+        return set(self.files.get(os.path.abspath(directory), []))
+
+    def record(self, directory, names):
+        self.files[os.path.abspath(directory)] = sorted(names)
+        parent = os.path.dirname(self.path)
+        if parent and not os.path.isdir(parent):
+            os.makedirs(parent)
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(self.files, f)
+        os.rename(self.path + '.tmp', self.path)
+
+
+def plan(directory, fragments, written=()):
+    """Compare fragments with the files under directory.
+
+    written holds the names of the fragments written there before.
+    Returns (fragments to write, file names to remove); fragments whose
+    content is already in place are left out, and only written files
+    are removed.
+    """
+    existing = []
+    if os.path.isdir(directory):
+        existing = [name for name in os.listdir(directory)
+                    if name.endswith(FRAGMENT_SUFFIX)]
+    write = {}
+    for name, content in fragments.items():
+        path = os.path.join(directory, name)
+        if name in existing:
+            with open(path) as f:
+                if f.read() == content:
+                    continue
+        write[name] = content
+    remove = sorted(name for name in existing
+                    if name in written and name not in fragments)
+    return write, remove
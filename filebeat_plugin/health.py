@@ -0,0 +1,95 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+import os
+import re
+
+from filebeat_plugin import registry
+
+# Where the filebeat packages write filebeat's own log.
+LOG_FILE_DEFAULT = os.path.join('/', 'var', 'log', 'filebeat', 'filebeat')
+ERROR_PATTERN = re.compile(
+    r'\b(?:ERR|ERROR|CRIT|FATAL)\b|failed to (?:publish|connect)|'
+    r'connection refused', re.IGNORECASE)
+ERRORS_KEPT = 10
+# Files whose lag stays above this without any progress are stalled.
+STALLED_LAG_BYTES = 1
+# An upgraded filebeat shipping below this share of the rate before is
+# a regression.
+MIN_THROUGHPUT_RATIO = 0.5
+
+
+def measure(before, after, seconds):
+    """Compare two reads of the registry, seconds apart.
+
+    Returns the bytes shipped in between, the rate, and the lag: how many
+    bytes of the harvested files are still to be shipped. Files which lag
+    and did not advance are listed as stalled. Nothing shipped while
+    nothing lags is healthy too.
+    """
+    offsets = dict((registry.file_id(state), state.get('offset', 0))
+                   for state in before)
+    shipped = lag = 0
+    stalled = []
+    for state in after:
+        offset = state.get('offset', 0)
+        advanced = max(offset - offsets.get(registry.file_id(state), 0), 0)
+        try:
+            size = os.path.getsize(state['source'])
+        except (OSError, KeyError):
+            continue
+        behind = max(size - offset, 0)
+        shipped += advanced
+        lag += behind
+        if behind >= STALLED_LAG_BYTES and not advanced:
+            stalled.append(state['source'])
+    return {'seconds': seconds,
+            'shipped_bytes': shipped,
+            'bytes_per_second': int(shipped / seconds) if seconds else None,
+            'lag_bytes': lag,
+            'files': len(after),
+            'stalled': sorted(stalled),
+            'shipping': bool(shipped or not lag)}
+
+
+def errors(log_text):
+    """Return the last error lines of a piece of filebeat's log."""
+    found = [line.strip() for line in (log_text or '').splitlines()
+             if ERROR_PATTERN.search(line)]
+    return found[-ERRORS_KEPT:]
+
+
+def regressed(before, after, min_ratio=MIN_THROUGHPUT_RATIO):
+    """Return why the measure after an upgrade is worse than before, or
+    None.
+
+    When files were harvested before, a registry without files after,
+    such as one the new version keeps elsewhere, gives no evidence and
+    counts as worse. The rate only counts while logs wait to be shipped,
+    since a filebeat which caught up ships no faster than the logs are
+    written.
+    """
+    if (before or {}).get('files') and not after['files']:
+        return 'no harvested files found in the registry, so shipping ' \
+            'could not be verified'
+    if not after['shipping']:
+        return 'nothing shipped in {0} seconds while {1} bytes wait to ' \
+            'be shipped'.format(after['seconds'], after['lag_bytes'])
+    expected = (before or {}).get('bytes_per_second')
+    if expected and after['lag_bytes'] and \
+            after['bytes_per_second'] < expected * min_ratio:
+        return 'shipped {0} bytes/sec, below {1} of the {2} bytes/sec ' \
+            'before'.format(after['bytes_per_second'], min_ratio, expected)
+    return None
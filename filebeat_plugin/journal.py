@@ -0,0 +1,87 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+import os
+import json
+import errno
+import hashlib
+
+from filebeat_plugin import cache
+
+
+def inputs_key(*inputs):
+    """Return a digest identifying a set of operation inputs."""
+    serialized = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+class StepJournal(object):
+    """Persistent record of the completed steps of a multi-step operation.
+
+    Each step is stored with the digest of the file it produced. The
+    journal belongs to one set of inputs: when the key changes, every
+    recorded step is forgotten. Completing a step again forgets all the
+    steps recorded after it, since they were built on its old output.
+    """
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self.steps = []
+        if os.path.isfile(path):
+            try:
+                with open(path) as f:
+                    state = json.load(f)
+            except ValueError:
+                state = {}
+            if state.get('key') == key:
+                self.steps = state.get('steps', [])
+
+    def completed(self, step, produced=None):
+        """Return the record of step when it is still valid, else None.
+
+        When produced is given, the file must still exist with the digest
+        recorded for the step.
+        """
+        for record in self.steps:
+            if record['step'] != step:
+                continue
+            if produced is not None and not (
+                    os.path.isfile(produced) and
+                    cache.file_digest(produced) == record['digest']):
+                return None
+            return record
+        return None
+
+    def complete(self, step, produced=None, **details):
+        names = [record['step'] for record in self.steps]
+        if step in names:
+            del self.steps[names.index(step):]
+        record = dict(details, step=step)
+        record['digest'] = cache.file_digest(produced) if produced else None
+        self.steps.append(record)
+        self._save()
+        return record
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump({'key': self.key, 'steps': self.steps}, f)
+        os.rename(self.path + '.tmp', self.path)
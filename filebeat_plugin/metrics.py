@@ -0,0 +1,124 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+import json
+import time
+import threading
+import contextlib
+
+# Only the last commands of an operation are kept.
+COMMANDS_KEPT = 50
+# Log lines carrying an operation's measurements start with this, and
+# are followed by a JSON document.
+EVENT_PREFIX = 'filebeat-metrics '
+
+_local = threading.local()
+
+
+class Recorder(object):
+    """Timings of one operation, its phases and the commands it ran.
+
+    Phases are listed in the order they ended; a phase carries its
+    seconds, whether it succeeded and any fields it was given, such as
+    bytes. Phases with bytes also get bytes_per_second.
+    """
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.started = time.time()
+        self.phases = []
+        self.commands = []
+
+    @contextlib.contextmanager
+    def phase(self, name, **fields):
+        """Time the block as phase name; the yielded fields may be added
+        to while it runs.
+        """
+        started = time.time()
+        fields = dict(fields, name=name, ok=False)
+        try:
+            yield fields
+            fields['ok'] = True
+        finally:
+            fields['seconds'] = round(time.time() - started, 6)
+            if fields.get('bytes') and fields['seconds'] > 0:
+                fields['bytes_per_second'] = int(
+                    fields['bytes'] / fields['seconds'])
+            self.phases.append(fields)
+
+    def command(self, command, seconds, returncode):
+        self.commands.append({'command': command,
+                              'seconds': round(seconds, 6),
+                              'returncode': returncode})
+        del self.commands[:-COMMANDS_KEPT]
+
+    def summary(self, ok):
+        return {'operation': self.operation, 'ok': ok,
+                'started': self.started,
+                'seconds': round(time.time() - self.started, 6),
+                'phases': self.phases, 'commands': self.commands}
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def current():
+    """Return the recorder of the running operation, or None."""
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+@contextlib.contextmanager
+def operation(name):
+    """Record the block as operation name and yield its recorder.
+
+    Within another operation, as when install calls configure, the block
+    is recorded as one of its phases instead, and None is yielded.
+    """
+    if current():
+        with current().phase(name):
+            yield None
+        return
+    recorder = Recorder(name)
+    _stack().append(recorder)
+    try:
+        yield recorder
+    finally:
+        _stack().pop()
+
+
+@contextlib.contextmanager
+def phase(name, **fields):
+    """Record the block as a phase of the running operation, if any."""
+    recorder = current()
+    if recorder is None:
+        yield dict(fields)
+        return
+    with recorder.phase(name, **fields) as fields:
+        yield fields
+
+
+def command(command, seconds, returncode):
+    recorder = current()
+    if recorder is not None:
+        recorder.command(command, seconds, returncode)
+
+
+def event(summary):
+    """Return summary as a structured log line."""
+    return EVENT_PREFIX + json.dumps(summary, sort_keys=True)
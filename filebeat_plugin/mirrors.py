@@ -0,0 +1,111 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+import os
+import json
+import time
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+FILE_SCHEME = 'file://'
+# manager://<path> mirrors point at the blueprint resources on the manager.
+MANAGER_SCHEME = 'manager://'
+PROBE_TIMEOUT = 5
+INDEX_TTL = 3600
+# The manager resource store can not be probed without downloading, it is
+# ranked after the mirrors which answered faster than this.
+MANAGER_LATENCY = 1.0
+
+
+def artifact_url(mirror, filename):
+    return mirror.rstrip('/') + '/' + filename
+
+
+def probe(mirror, filename, timeout=PROBE_TIMEOUT):
+    """Return the seconds mirror took to confirm it has filename.
+
+    Returns None when the mirror does not carry it or did not answer.
+    """
+    url = artifact_url(mirror, filename)
+    if mirror.startswith(FILE_SCHEME):
+        return 0.0 if os.path.isfile(url[len(FILE_SCHEME):]) else None
+    if mirror.startswith(MANAGER_SCHEME):
+        return MANAGER_LATENCY
+    started = time.time()
+    try:
+        response = requests.head(url, allow_redirects=True, timeout=timeout)
+    except requests.exceptions.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
+    return time.time() - started
+
+
+class MirrorIndex(object):
+    """Persistent record of which artifacts each mirror carries and how
+    fast it answered, so mirrors are not probed on every download.
+    """
+
+    def __init__(self, path, ttl=INDEX_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.mirrors = {}
+        if os.path.isfile(path):
+            try:
+                with open(path) as f:
+                    self.mirrors = json.load(f)
+            except ValueError:
+                self.mirrors = {}
+
+    def lookup(self, mirror, filename):
+        """Return (known, latency) for filename on mirror."""
+        record = self.mirrors.get(mirror, {}).get(filename)
+        if not record or time.time() - record['checked'] > self.ttl:
+            return False, None
+        return True, record['latency']
+
+    def record(self, mirror, filename, latency):
+        self.mirrors.setdefault(mirror, {})[filename] = {
+            'latency': latency, 'checked': time.time()}
+
+    def save(self):
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(self.mirrors, f)
+        os.rename(self.path + '.tmp', self.path)
+
+    def rank(self, mirrors, filename, timeout=PROBE_TIMEOUT):
+        """Return the mirrors carrying filename, fastest first.
+
+        Mirrors without a fresh index record are probed concurrently.
+        """
+        stale = [m for m in mirrors if not self.lookup(m, filename)[0]]
+        if stale:
+            pool = ThreadPool(len(stale))
+            try:
+                latencies = pool.map(
+                    lambda mirror: probe(mirror, filename, timeout), stale)
+            finally:
+                pool.close()
+                pool.join()
+            for mirror, latency in zip(stale, latencies):
+                self.record(mirror, filename, latency)
+        latencies = [(self.lookup(m, filename)[1], position, m)
+                     for position, m in enumerate(mirrors)]
+        # Mirrors without the file have no latency, and None does not
+        # compare with numbers on python 3.
+        available = [latency for latency in latencies
+                     if latency[0] is not None]
+        return [m for _, _, m in sorted(available)]
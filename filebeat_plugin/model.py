@@ -0,0 +1,362 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+import re
+import json
+
+# str and, on python 2, unicode; int, float and, on python 2, long.
+STRING_TYPES = (str, type(u''))
+NUMBER_TYPES = (int, float, type(2 ** 64))
+
+HEADER = '# Generated by cloudify-filebeat-plugin, changes are overwritten.\n'
+# Sections the model itself owns; inputs may not set them.
+RESERVED_SECTIONS = ('filebeat', 'output')
+# Strings made of these are written unquoted, unless YAML would read them
+# as something else than a string, such as 1.0, yes or null.
+PLAIN_PATTERN = re.compile(r'^[A-Za-z0-9_/][A-Za-z0-9_./:-]*(?<!:)$')
+NOT_STRING_PATTERN = re.compile(
+    r'^(?:[-+]?[0-9_.]+(?:[eE][-+]?[0-9]+)?|0[xXoObB][0-9a-fA-F_]+|'
+    r'[0-9][0-9_]*(?::[0-9_.]+)+|[0-9]{4}-[0-9].*|'
+    r'y|yes|n|no|true|false|on|off|null)$',
+    re.IGNORECASE)
+
+# The first filebeat versions of the layout changes the model follows.
+# Without a version the 1.x layout is written.
+# shipper options moved to the top level.
+TOP_LEVEL_SHIPPER_VERSION = (5, 0)
+# Prospector options renamed by the close_* options, which replace the old
+# names altogether from 6.0 on.
+CLOSE_OPTIONS_VERSION = (5, 0)
+# Output options the outputs of older versions do not have.
+OUTPUT_OPTION_VERSIONS = {('logstash', 'pipelining'): (5, 0),
+                          ('elasticsearch', 'compression_level'): (5, 0)}
+# Prospectors have a type and no document_type, and the memory queue
+# replaced the spooler.
+QUEUE_VERSION = (6, 0)
+# Prospectors were renamed to inputs.
+INPUTS_VERSION = (6, 3)
+# The registry became a directory, set as registry.path.
+REGISTRY_PATH_VERSION = (7, 0)
+
+
+def at_least(version, minimum):
+    """Whether version, a tuple or None, is minimum or later."""
+    return version is not None and tuple(version[:len(minimum)]) >= minimum
+
+
+class Prospector(object):
+    """The prospector, or input from filebeat 6.3 on, of a document_type.
+
+    From filebeat 6.0 on, which dropped document_type, it is kept as
+    fields.document_type.
+    """
+    __slots__ = ('document_type', 'paths', 'options', 'version')
+
+    def __init__(self, document_type, paths, options=None, version=None):
+        self.document_type = document_type
+        self.paths = paths
+        # None rather than a dict of its own, there may be many thousands.
+        self.options = options or None
+        self.version = version
+
+    def to_dict(self):
+        prospector = dict(self.options or {})
+        prospector['paths'] = list(self.paths)
+        if at_least(self.version, CLOSE_OPTIONS_VERSION):
+            _rename_close_options(prospector)
+        if at_least(self.version, QUEUE_VERSION):
+            prospector.setdefault('type', 'log')
+            prospector['fields'] = dict(prospector.get('fields') or {},
+                                        document_type=self.document_type)
+        else:
+            prospector['document_type'] = self.document_type
+        return prospector
+
+    def emit(self, lead, indent, write):
+        """Write the prospector as an item of a YAML list."""
+        if self.options:
+            return _emit(self.to_dict(), indent, write, lead)
+        # The common case, spelled out since there may be many thousands.
+        typed = at_least(self.version, QUEUE_VERSION)
+        if typed:
+            write(lead + 'fields:\n' + indent + '  document_type: ' +
+                  _scalar(self.document_type) + '\n')
+        else:
+            write(lead + 'document_type: ' + _scalar(self.document_type) +
+                  '\n')
+        if not self.paths:
+            write(indent + 'paths: []\n')
+        else:
+            write(indent + 'paths:\n')
+            item = indent + '  - '
+            for path in self.paths:
+                write(item + _string(path) + '\n')
+        if typed:
+            write(indent + 'type: log\n')
+
+
+class Output(object):
+    __slots__ = ('name', 'options')
+
+    def __init__(self, name, options=None):
+        self.name = name
+        self.options = options or {}
+
+
+class FilebeatConfig(object):
+    """A complete filebeat configuration.
+
+    sections holds the other top level sections, such as shipper or
+    logging, and general the filebeat options such as spool_size.
+    The layout follows the filebeat version, a tuple; see at_least.
+    """
+    __slots__ = ('prospectors', 'outputs', 'sections', 'general',
+                 'config_dir', 'config_reload', 'version')
+
+    def __init__(self, prospectors, outputs, sections=None, general=None,
+                 config_dir='', config_reload=False, version=None):
+        self.prospectors = prospectors
+        self.outputs = outputs
+        self.sections = sections or {}
+        self.general = general or {}
+        self.config_dir = config_dir
+        self.config_reload = config_reload
+        self.version = version
+
+    def to_dict(self):
+        config = self._data()
+        key = self._prospectors_key()
+        config['filebeat'][key] = [prospector.to_dict()
+                                   for prospector in config['filebeat'][key]]
+        return config
+
+    def _prospectors_key(self):
+        if at_least(self.version, INPUTS_VERSION):
+            return 'inputs'
+        return 'prospectors'
+
+    def _data(self):
+        key = self._prospectors_key()
+        filebeat = dict(self.general)
+        config = {}
+        if at_least(self.version, QUEUE_VERSION):
+            config['queue'] = _memory_queue(filebeat)
+        if at_least(self.version, REGISTRY_PATH_VERSION):
+            filebeat.pop('registry_file', None)
+        if self.config_dir:
+            # Prospectors are kept one per document_type under config_dir.
+            filebeat[key] = []
+            if self.config_reload:
+                filebeat['config'] = {key: {
+                    'path': '{0}/*.yml'.format(self.config_dir),
+                    'reload.enabled': True}}
+            else:
+                filebeat['config_dir'] = self.config_dir
+        else:
+            filebeat[key] = sorted(
+                self.prospectors, key=lambda p: p.document_type)
+        sections = dict(self.sections)
+        if at_least(self.version, TOP_LEVEL_SHIPPER_VERSION) and \
+                'shipper' in sections:
+            config.update(sections.pop('shipper'))
+        config.update(sections)
+        if not config.get('queue'):
+            config.pop('queue', None)
+        config.update(filebeat=filebeat,
+                      output=dict((output.name, self._output_options(output))
+                                  for output in self.outputs))
+        return config
+
+    def _output_options(self, output):
+        options = dict(output.options)
+        if output.name == 'logstash' and 'loadbalance' not in options and \
+                len(options.get('hosts') or []) > 1:
+            options['loadbalance'] = True
+        # Without a version, as for the 1.x layout, 1.x options are kept.
+        for option in list(options):
+            minimum = OUTPUT_OPTION_VERSIONS.get((output.name, option))
+            if minimum and not at_least(self.version, minimum):
+                del options[option]
+        return options
+
+    def write(self, write):
+        """Pass the configuration as YAML text to write, line by line.
+
+        Keys are sorted, so equal configurations give equal bytes.
+        """
+        write(HEADER)
+        _emit(self._data(), '', write)
+
+    def dumps(self):
+        parts = []
+        self.write(parts.append)
+        return ''.join(parts)
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            self.write(f.write)
+
+
+CONTAINERS = (dict, list, tuple)
+
+
+def _rename_close_options(prospector):
+    """Replace the 1.x close_older and force_close_files options."""
+    if 'close_older' in prospector:
+        prospector.setdefault('close_inactive', prospector.pop('close_older'))
+    if 'force_close_files' in prospector:
+        force = prospector.pop('force_close_files')
+        prospector.setdefault('close_renamed', force)
+        prospector.setdefault('close_removed', force)
+
+
+def _memory_queue(general):
+    """Move the spooler options out of general, as a queue section.
+
+    The memory queue buffers two spools, so one is filled while the
+    previous one is published.
+    """
+    spool_size = general.pop('spool_size', None)
+    idle_timeout = general.pop('idle_timeout', None)
+    general.pop('publish_async', None)
+    flush = {}
+    if spool_size:
+        flush['min_events'] = spool_size
+    if idle_timeout:
+        flush['timeout'] = idle_timeout
+    if not flush:
+        return {}
+    queue = {'flush': flush}
+    if spool_size:
+        queue['events'] = 2 * spool_size
+    return {'mem': queue}
+
+
+def _string(value):
+    if PLAIN_PATTERN.match(value) and not NOT_STRING_PATTERN.match(value):
+        return str(value)
+    # JSON strings are valid double quoted YAML scalars.
+    return json.dumps(value)
+
+
+def _key(key, cache={}):
+    # The same few keys repeat in every prospector and output.
+    if key not in cache:
+        cache[key] = _scalar(key)
+    return cache[key]
+
+
+def _scalar(value):
+    if isinstance(value, STRING_TYPES):
+        return _string(value)
+    if value is None:
+        return 'null'
+    if value is True or value is False:
+        return 'true' if value else 'false'
+    if isinstance(value, NUMBER_TYPES):
+        return json.dumps(value)
+    raise ValueError('{0!r} can not be written to the configuration'.format(
+        value))
+
+
+def _emit(value, indent, write, lead=None):
+    """Write value as block style YAML indented by indent.
+
+    lead replaces the indentation of the first line, it holds the dash
+    when value is an item of a list.
+    """
+    nested = indent + '  '
+    if isinstance(value, dict):
+        for key in sorted(value):
+            item = value[key]
+            start = lead or indent
+            lead = None
+            if isinstance(item, CONTAINERS) and item:
+                write(start + _key(key) + ':\n')
+                _emit(item, nested, write)
+            else:
+                write(start + _key(key) + ': ' + _empty(item) + '\n')
+    else:
+        for item in value:
+            start = (lead or indent) + '- '
+            lead = None
+            if isinstance(item, Prospector):
+                item.emit(start, nested, write)
+            elif isinstance(item, CONTAINERS) and item:
+                _emit(item, nested, write, start)
+            else:
+                write(start + _empty(item) + '\n')
+
+
+def _empty(value):
+    if isinstance(value, STRING_TYPES):
+        return _string(value)
+    if isinstance(value, dict):
+        return '{}'
+    if isinstance(value, (list, tuple)):
+        return '[]'
+    return _scalar(value)
+
+
+def _mapping(value, name):
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise ValueError('{0} should be a dictionary, got: {1!r}'.format(
+            name, value))
+    return value
+
+
+def from_inputs(filebeat_config):
+    """Build a FilebeatConfig from the filebeat_config_inputs input.
+
+    Besides paths, outputs and inputs, the variables configure adds are
+    read: config_dir, config_reload, prospector_options, registry_file,
+    tuning and filebeat_version.
+    Raises ValueError for inputs of the wrong shape.
+    """
+    filebeat_config = filebeat_config or {}
+    version = filebeat_config.get('filebeat_version')
+    version = tuple(version) if version else None
+    options = _mapping(filebeat_config.get('prospector_options'),
+                       'prospector_options')
+    prospectors = []
+    for document_type, paths in \
+            _mapping(filebeat_config.get('paths'), 'paths').items():
+        if not isinstance(paths, (list, tuple)) or not all(
+                isinstance(path, STRING_TYPES) for path in paths):
+            raise ValueError(
+                'paths of {0} should be a list of globs, got: {1!r}'.format(
+                    document_type, paths))
+        prospectors.append(Prospector(document_type, paths,
+                                      options.get(document_type), version))
+    outputs = [Output(name, _mapping(output, 'output {0}'.format(name)))
+               for name, output in
+               _mapping(filebeat_config.get('outputs'), 'outputs').items()]
+    sections = {}
+    for name, section in \
+            _mapping(filebeat_config.get('inputs'), 'inputs').items():
+        if name in RESERVED_SECTIONS:
+            raise ValueError(
+                '{0} can not be set through inputs'.format(name))
+        if section is not None:
+            sections[name] = _mapping(section, 'input {0}'.format(name))
+    general = dict(_mapping(filebeat_config.get('tuning'), 'tuning'))
+    if filebeat_config.get('registry_file'):
+        general['registry_file'] = filebeat_config['registry_file']
+    return FilebeatConfig(
+        prospectors, outputs, sections, general,
+        filebeat_config.get('config_dir') or '',
+        bool(filebeat_config.get('config_reload')), version)
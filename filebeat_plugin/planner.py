@@ -0,0 +1,132 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+import os
+import glob
+import time
+import resource
+import collections
+
+# Descriptors filebeat needs besides its harvesters: registry, output
+# connections, its own log and libraries.
+FD_RESERVE = 64
+# Files written to within this window count as actively written.
+ACTIVE_AGE = 24 * 3600
+IGNORE_OLDER_MIN = 3600
+IGNORE_OLDER_MAX = 24 * 3600
+CLOSE_OLDER_MIN = 5 * 60
+CLOSE_OLDER_MAX = 3600
+SCAN_FREQUENCY_MIN = 10
+SCAN_FREQUENCY_MAX = 60
+# One more second between directory scans per this many matched files.
+FILES_PER_SCAN_SECOND = 100
+
+FileEntry = collections.namedtuple('FileEntry', ['path', 'size', 'mtime'])
+
+
+def expand(paths):
+    """Expand the {document_type: [globs]} input once.
+
+    Returns {document_type: [FileEntry]}; files matched by several globs
+    of a document_type are listed once.
+    """
+    index = {}
+    for document_type, globs in (paths or {}).items():
+        entries = {}
+        for pattern in globs:
+            for path in glob.glob(pattern):
+                if path in entries:
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries[path] = FileEntry(path, stat.st_size, stat.st_mtime)
+        index[document_type] = sorted(entries.values())
+    return index
+
+
+def duration(seconds):
+    """Format seconds the way filebeat durations are written."""
+    seconds = int(seconds)
+    for unit, size in (('h', 3600), ('m', 60)):
+        if seconds >= size and seconds % size == 0:
+            return '{0}{1}'.format(seconds // size, unit)
+    return '{0}s'.format(seconds)
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def prospector_options(entries, now):
+    """Derive ignore_older, close_older and scan_frequency for a prospector.
+
+    The options use the 1.x names; the model renames close_older for the
+    filebeat version. Returns (options, harvesters) where harvesters is
+    the number of files which are young enough to be harvested with
+    these options.
+    """
+    ages = sorted(max(0, now - entry.mtime) for entry in entries)
+    active = [age for age in ages if age < ACTIVE_AGE]
+    if active:
+        # Keep twice the age of the stalest active file, rounded to hours.
+        ignore_older = _clamp(-(-2 * active[-1] // 3600) * 3600,
+                              IGNORE_OLDER_MIN, IGNORE_OLDER_MAX)
+        # Release idle files after twice the typical write interval.
+        close_older = _clamp(-(-2 * active[len(active) // 2] // 60) * 60,
+                             CLOSE_OLDER_MIN, CLOSE_OLDER_MAX)
+    else:
+        ignore_older, close_older = IGNORE_OLDER_MAX, CLOSE_OLDER_MIN
+    scan_frequency = _clamp(
+        SCAN_FREQUENCY_MIN + len(ages) // FILES_PER_SCAN_SECOND,
+        SCAN_FREQUENCY_MIN, SCAN_FREQUENCY_MAX)
+    options = {'ignore_older': duration(ignore_older),
+               'close_older': duration(close_older),
+               'scan_frequency': duration(scan_frequency)}
+    return options, len([age for age in ages if age < ignore_older])
+
+
+def fd_limit():
+    """Return the soft open files limit, or None when unlimited."""
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    return None if soft == resource.RLIM_INFINITY else soft
+
+
+def plan(paths, now=None):
+    """Plan the prospectors of the paths input.
+
+    Returns (options, summary): options maps every document_type to its
+    prospector options; summary holds the matched file count, their bytes
+    and the expected harvesters per document_type.
+    """
+    now = now or time.time()
+    options, summary = {}, {}
+    for document_type, entries in expand(paths).items():
+        options[document_type], harvesters = \
+            prospector_options(entries, now)
+        summary[document_type] = {
+            'files': len(entries),
+            'bytes': sum(entry.size for entry in entries),
+            'harvesters': harvesters}
+    return options, summary
+
+
+def harvester_overflow(summary, limit):
+    """Return by how many descriptors the harvesters exceed limit."""
+    if limit is None:
+        return 0
+    harvesters = sum(item['harvesters'] for item in summary.values())
+    return max(0, harvesters + FD_RESERVE - limit)
@@ -0,0 +1,418 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+# This module is also run as the root helper process, by path and with
+# sudo's environment, so it only imports the standard library.
+import os
+import sys
+import grp
+import pwd
+import json
+import time
+import errno
+import shutil
+import signal
+import threading
+import itertools
+import traceback
+import contextlib
+import subprocess
+import collections
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+SUDO = 'sudo'
+# Fail rather than prompt for a password, which nobody would answer and
+# would leave the operation waiting for the helper forever.
+SUDO_FLAGS = ('-n',)
+OUTPUT_TAIL_LINES = 50
+KILL_GRACE_PERIOD = 5
+# How long output is still read once a command exited.
+READER_GRACE_PERIOD = 5
+READY = {'ready': True}
+
+_local = threading.local()
+
+
+def action_for(argv):
+    """Return the typed action doing what the command argv does.
+
+    argv is a command as run with sudo, such as ['mv', source, target];
+    commands the helper has no action for are run as they are.
+    """
+    name, args = argv[0], argv[1:]
+    flags = [arg for arg in args if arg.startswith('-')]
+    operands = [arg for arg in args if not arg.startswith('-')]
+    if name == 'mv' and flags in ([], ['-T']) and len(operands) == 2:
+        return {'action': 'move', 'source': operands[0],
+                'target': operands[1], 'into': not flags}
+    if name == 'cp' and not flags and len(operands) == 2:
+        return {'action': 'copy', 'source': operands[0],
+                'target': operands[1]}
+    if name == 'mkdir' and flags == ['-p'] and operands:
+        return {'action': 'mkdir', 'paths': operands}
+    if name == 'rm' and flags in (['-f'], ['-rf']) and operands:
+        return {'action': 'remove', 'paths': operands,
+                'recursive': flags == ['-rf']}
+    if name == 'ln' and flags == ['-sfn'] and len(operands) == 2:
+        return {'action': 'symlink', 'source': operands[0],
+                'link': operands[1]}
+    if name == 'chmod' and not flags and len(operands) == 2 and \
+            operands[0].isdigit():
+        return {'action': 'chmod', 'mode': operands[0], 'path': operands[1]}
+    if name == 'chown' and not flags and len(operands) == 2:
+        return {'action': 'chown', 'owner': operands[0],
+                'path': operands[1]}
+    return {'action': 'exec', 'argv': list(argv)}
+
+
+class Helper(object):
+    """A root process running the privileged actions of one operation.
+
+    It is started with a single sudo -n, which never prompts for a
+    password, when the first action is called, and takes actions as JSON
+    lines on its stdin. Actions run concurrently, so call may be used
+    from several threads; the lines a command writes come back as they
+    are written, ahead of the line holding its returncode, stdout, stderr
+    and seconds. When the helper can not be started or dies, call returns
+    None and the caller runs the command with sudo itself.
+    """
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.proc = None
+        self.failed = False
+        # Whether it died once started, maybe in the middle of an action.
+        self.exited = False
+        self.closing = False
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.ids = itertools.count(1)
+        self.reader = None
+
+    def call(self, action, timeout=None, output=None):
+        """Run action and return its response, or None when the helper
+        could not run it.
+
+        output, when given, is called with the stream name and every line
+        a command writes, as it writes it.
+        """
+        answers = queue.Queue()
+        with self.lock:
+            if self.failed or (self.proc is None and not self._start()):
+                return None
+            request_id = next(self.ids)
+            self.pending[request_id] = answers
+            self.logger.debug('Running privileged: {0}'.format(action))
+            try:
+                self.proc.stdin.write((json.dumps(dict(
+                    action, id=request_id, timeout=timeout)) + '\n').encode(
+                        'utf-8'))
+                self.proc.stdin.flush()
+            except (IOError, OSError) as e:
+                self.pending.pop(request_id, None)
+                self._exited(e)
+                answers.put(None)
+        while True:
+            message = answers.get()
+            if message is None:
+                return None
+            if 'stream' not in message:
+                return message
+            if output:
+                output(message['stream'], message['line'])
+
+    def close(self):
+        if self.proc is None:
+            return
+        self.closing = True
+        try:
+            self.proc.stdin.close()
+        except (IOError, OSError):
+            pass
+        self.proc.wait()
+        if self.reader is not None:
+            self.reader.join()
+        self.proc = None
+
+    def _start(self):
+        script = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+        try:
+            with open(os.devnull, 'w') as devnull:
+                self.proc = subprocess.Popen(
+                    [SUDO] + list(SUDO_FLAGS) + [sys.executable, script],
+                    stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                    stderr=devnull)
+            ready = json.loads(self.proc.stdout.readline().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            ready = None
+        if ready != READY:
+            self.failed = True
+            self.logger.warning('The privileged helper could not be '
+                                'started, running sudo per command.')
+            self.close()
+            return False
+        self.reader = threading.Thread(target=self._read)
+        self.reader.daemon = True
+        self.reader.start()
+        return True
+
+    def _read(self):
+        """Hand every line of the helper to the call waiting for it."""
+        error = 'end of output'
+        try:
+            for line in iter(self.proc.stdout.readline, b''):
+                message = json.loads(line.decode('utf-8'))
+                with self.lock:
+                    answers = self.pending.get(message.get('id'))
+                    if 'stream' not in message:
+                        self.pending.pop(message.get('id'), None)
+                if answers is not None:
+                    answers.put(message)
+        except (IOError, OSError, ValueError) as e:
+            error = e
+        # Under the lock, so no call can start waiting for an answer
+        # which never comes.
+        with self.lock:
+            if not self.closing:
+                self._exited(error)
+            self.failed = True
+            for answers in self.pending.values():
+                answers.put(None)
+            self.pending.clear()
+
+    def _exited(self, error):
+        if not self.failed:
+            self.failed = True
+            self.exited = True
+            self.logger.warning(
+                'The privileged helper exited: {0}'.format(error))
+
+
+def completed(action):
+    """Whether action, which a helper may have run before it died, is
+    done already.
+
+    Only moves can not simply be run again.
+    """
+    if action['action'] != 'move':
+        return False
+    target = action['target']
+    if action['into'] and os.path.isdir(target) and \
+            not os.path.islink(target):
+        target = os.path.join(target, os.path.basename(action['source']))
+    return not os.path.lexists(action['source']) and \
+        os.path.lexists(target)
+
+
+def current():
+    """Return the helper of the running operation, or None."""
+    return getattr(_local, 'helper', None)
+
+
+@contextlib.contextmanager
+def session(logger):
+    """Run the privileged actions of the block through one helper."""
+    if current() is not None:
+        yield current()
+        return
+    _local.helper = Helper(logger)
+    try:
+        yield _local.helper
+    finally:
+        helper, _local.helper = _local.helper, None
+        helper.close()
+
+
+def _move(source, target, into):
+    if into and os.path.isdir(target) and not os.path.islink(target):
+        target = os.path.join(target, os.path.basename(source))
+    try:
+        os.rename(source, target)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(source, target)
+
+
+def _copy(source, target):
+    shutil.copy(source, target)
+
+
+def _mkdir(paths):
+    for path in paths:
+        try:
+            os.makedirs(path)
+        except OSError as e:
+            if e.errno != errno.EEXIST or not os.path.isdir(path):
+                raise
+
+
+def _remove(paths, recursive):
+    for path in paths:
+        if os.path.isdir(path) and not os.path.islink(path):
+            if not recursive:
+                raise OSError(errno.EISDIR, 'Is a directory', path)
+            shutil.rmtree(path)
+        elif os.path.lexists(path):
+            os.remove(path)
+
+
+def _symlink(source, link):
+    if os.path.isdir(link) and not os.path.islink(link):
+        link = os.path.join(link, os.path.basename(source))
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(source, link)
+
+
+def _chmod(mode, path):
+    os.chmod(path, int(mode, 8))
+
+
+def _chown(owner, path):
+    user, _, group = owner.partition(':')
+    uid = int(user) if user.isdigit() else pwd.getpwnam(user).pw_uid
+    gid = -1
+    if group:
+        gid = int(group) if group.isdigit() else grp.getgrnam(group).gr_gid
+    os.chown(path, uid, gid)
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return {'stdout': f.read().decode('utf-8', 'replace')}
+
+
+def _exec(argv, timeout=None, output=None):
+    proc = subprocess.Popen(argv, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, preexec_fn=os.setsid)
+    tails = {'stdout': collections.deque(maxlen=OUTPUT_TAIL_LINES),
+             'stderr': collections.deque(maxlen=OUTPUT_TAIL_LINES)}
+    readers = [threading.Thread(target=_stream,
+                                args=(pipe, name, tails[name], output))
+               for pipe, name in ((proc.stdout, 'stdout'),
+                                  (proc.stderr, 'stderr'))]
+    for reader in readers:
+        reader.daemon = True
+        reader.start()
+    timed_out = threading.Event()
+    killer = None
+    if timeout:
+        killer = threading.Timer(timeout, _kill, args=(proc, timed_out))
+        killer.daemon = True
+        killer.start()
+    try:
+        proc.wait()
+    finally:
+        if killer:
+            killer.cancel()
+    for reader in readers:
+        # A daemon the command started may hold its pipes open.
+        reader.join(READER_GRACE_PERIOD)
+    return {'returncode': proc.returncode, 'timed_out': timed_out.is_set(),
+            'stdout': ''.join(tails['stdout']),
+            'stderr': ''.join(tails['stderr'])}
+
+
+def _stream(pipe, name, tail, output):
+    for line in iter(pipe.readline, b''):
+        line = line.decode('utf-8', 'replace')
+        tail.append(line)
+        if output:
+            output(name, line)
+    pipe.close()
+
+
+def _kill(proc, timed_out):
+    if proc.returncode is not None:
+        return
+    timed_out.set()
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except OSError:
+            return
+        for _ in range(KILL_GRACE_PERIOD * 10):
+            if proc.poll() is not None:
+                return
+            time.sleep(0.1)
+
+
+ACTIONS = {'move': _move, 'copy': _copy, 'mkdir': _mkdir,
+           'remove': _remove, 'symlink': _symlink, 'chmod': _chmod,
+           'chown': _chown, 'read': _read, 'exec': _exec}
+
+
+def handle(action, output=None):
+    """Run action and return its response.
+
+    output, when given, is called with the stream name and every line an
+    exec'd command writes.
+    """
+    action = dict(action)
+    started = time.time()
+    name = action.pop('action')
+    timeout = action.pop('timeout', None)
+    if name == 'exec':
+        action.update(timeout=timeout, output=output)
+    try:
+        response = ACTIONS[name](**action) or {}
+    except Exception as e:
+        response = {'returncode': getattr(e, 'errno', None) or 1,
+                    'stderr': '{0}: {1}'.format(type(e).__name__, e)}
+        if not isinstance(e, (OSError, IOError, KeyError)):
+            response['stderr'] = traceback.format_exc()
+    response.setdefault('returncode', 0)
+    response.setdefault('stdout', '')
+    response.setdefault('stderr', '')
+    response['seconds'] = time.time() - started
+    return response
+
+
+def serve(requests, responses):
+    """Answer the actions read from requests until it is closed.
+
+    Every action runs in a thread of its own; the lines its command
+    writes and then its response are sent tagged with the action's id.
+    """
+    lock = threading.Lock()
+
+    def send(message):
+        with lock:
+            responses.write(json.dumps(message) + '\n')
+            responses.flush()
+
+    def answer(action):
+        request_id = action.pop('id', None)
+        response = handle(action, lambda stream, line: send(
+            {'id': request_id, 'stream': stream, 'line': line}))
+        response['id'] = request_id
+        send(response)
+
+    send(READY)
+    workers = []
+    for line in iter(requests.readline, ''):
+        worker = threading.Thread(target=answer, args=(json.loads(line),))
+        worker.start()
+        workers.append(worker)
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == '__main__':
+    serve(sys.stdin, sys.stdout)
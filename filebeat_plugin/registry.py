@@ -0,0 +1,144 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+import os
+import re
+import json
+import time
+
+from filebeat_plugin import planner
+
+# Where the generated configuration keeps the registry.
+REGISTRY_FILE_DEFAULT = os.path.join('/', 'var', 'lib', 'filebeat',
+                                     'registry')
+# Where earlier installations may have kept it: filebeat 1.x defaults to
+# .filebeat in its working directory, the 5.x and 6.x packages to their
+# data path.
+REGISTRY_CANDIDATES = (
+    REGISTRY_FILE_DEFAULT,
+    os.path.join('/', '.filebeat'),
+    os.path.join('/', 'usr', 'share', 'filebeat', 'bin', '.filebeat'),
+    os.path.join('/', 'usr', 'share', 'filebeat', 'data', 'registry'))
+REGISTRY_FILE_PATTERN = re.compile(
+    r'^\s*(?:filebeat\.)?registry_file:\s*["\']?([^"\'\s#]+)', re.MULTILINE)
+# filebeat 5.0 turned the registry from a mapping of source paths into a
+# list of states, which carry a timestamp and a ttl.
+LIST_MIN_VERSION = (5,)
+# filebeat 6.0 added the input type to every state.
+TYPE_MIN_VERSION = (6,)
+
+
+def configured_registry(config_text):
+    """Return the registry_file set in a configuration's text, or None."""
+    match = REGISTRY_FILE_PATTERN.search(config_text or '')
+    return match.group(1) if match else None
+
+
+def locate(candidates):
+    """Return the most recently written registry file of candidates.
+
+    Registries kept as directories, as filebeat 7 does, are not handled.
+    """
+    found = [path for path in candidates if path and os.path.isfile(path)]
+    if not found:
+        return None
+    return max(found, key=os.path.getmtime)
+
+
+def load(text):
+    """Return the states of registry text as a list, whatever its version.
+
+    A 1.x registry maps every source path to its state.
+    """
+    data = json.loads(text) if text.strip() else []
+    if isinstance(data, dict):
+        data = [dict(state, source=source)
+                for source, state in sorted(data.items())]
+    if not isinstance(data, list):
+        raise ValueError('unexpected registry content: {0!r}'.format(data))
+    return [state for state in data
+            if isinstance(state, dict) and file_id(state)]
+
+
+def file_id(state):
+    file_state = state.get('FileStateOS') or {}
+    if 'inode' not in file_state or 'device' not in file_state:
+        return None
+    return file_state['inode'], file_state['device']
+
+
+def _files(paths):
+    """Return {(inode, device): (path, size)} of the files paths match."""
+    files = {}
+    for entries in planner.expand(paths).values():
+        for entry in entries:
+            try:
+                stat = os.stat(entry.path)
+            except OSError:
+                continue
+            files[(stat.st_ino, stat.st_dev)] = (entry.path, stat.st_size)
+    return files
+
+
+def migrate(states, paths):
+    """Return states with sources updated to where their files are now.
+
+    Files are matched by inode and device among the files the paths globs
+    match, so a moved or renamed log keeps its offset. States of files
+    which are not found are kept as they are.
+    """
+    files = _files(paths)
+    migrated = []
+    for state in states:
+        state = dict(state)
+        found = files.get(file_id(state))
+        if found:
+            state['source'] = found[0]
+            if state.get('offset', 0) > found[1]:
+                # The inode was reused by a shorter file.
+                state['offset'] = 0
+        migrated.append(state)
+    return migrated
+
+
+def merge(current, restored):
+    """Return the states of current, completed with those of restored.
+
+    The states of current, written by the running filebeat, are newer.
+    """
+    known = set(file_id(state) for state in current)
+    return list(current) + [state for state in restored
+                            if file_id(state) not in known]
+
+
+def dumps(states, version):
+    """Return states serialized the way filebeat version reads them."""
+    if version and tuple(version[:1]) < LIST_MIN_VERSION:
+        return json.dumps(dict(
+            (state['source'], {'source': state['source'],
+                               'offset': state.get('offset', 0),
+                               'FileStateOS': state['FileStateOS']})
+            for state in states), sort_keys=True)
+    now = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    written = []
+    for state in states:
+        state = dict(state)
+        state.setdefault('offset', 0)
+        state.setdefault('timestamp', now)
+        state.setdefault('ttl', -1)
+        if version and tuple(version[:1]) >= TYPE_MIN_VERSION:
+            state.setdefault('type', 'log')
+        written.append(state)
+    return json.dumps(written, sort_keys=True)
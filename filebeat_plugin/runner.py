@@ -0,0 +1,161 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+import os
+import time
+import shlex
+import signal
+import threading
+import subprocess
+import collections
+from multiprocessing.pool import ThreadPool
+
+from cloudify import exceptions
+
+TIMEOUT_DEFAULT = 600
+KILL_GRACE_PERIOD = 5
+# How long output is still read once a command exited.
+READER_GRACE_PERIOD = 5
+OUTPUT_TAIL_LINES = 50
+
+
+class CommandFailed(exceptions.CommandExecutionException):
+    """A command exited with a non-zero code.
+
+    error and output hold the last lines the command wrote to stderr and
+    stdout, duration the seconds it ran for.
+    """
+
+    def __init__(self, command, error, output, code, duration):
+        self.duration = duration
+        super(CommandFailed, self).__init__(command, error, output, code)
+
+
+class CommandTimeout(CommandFailed):
+    """A command was killed after running longer than its timeout."""
+
+
+class Result(object):
+
+    def __init__(self, command, returncode, stdout, stderr, duration):
+        self.command = command
+        self.returncode = returncode
+        self.aggr_stdout = stdout
+        self.aggr_stderr = stderr
+        self.duration = duration
+
+
+def run(command, logger, timeout=TIMEOUT_DEFAULT):
+    """Run command, streaming its output line by line to logger.debug.
+
+    Only the last OUTPUT_TAIL_LINES lines of each stream are kept. The
+    command runs in its own process group, which is killed as a whole once
+    timeout seconds have passed. Raises CommandTimeout or CommandFailed.
+    """
+    if not isinstance(command, (list, tuple)):
+        command = shlex.split(command)
+    command_str = ' '.join(command)
+    logger.debug('Running: {0}'.format(command))
+    started = time.time()
+    proc = subprocess.Popen(command,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            preexec_fn=os.setsid)
+    stdout = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+    stderr = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+    readers = [threading.Thread(target=_stream,
+                                args=(proc.stdout, stdout, logger)),
+               threading.Thread(target=_stream,
+                                args=(proc.stderr, stderr, logger))]
+    for reader in readers:
+        reader.daemon = True
+        reader.start()
+
+    timed_out = threading.Event()
+    killer = threading.Timer(timeout, _kill, args=(proc, timed_out))
+    killer.daemon = True
+    killer.start()
+    try:
+        proc.wait()
+    finally:
+        killer.cancel()
+    for reader in readers:
+        # A daemon the command started may hold its pipes open. The reader
+        # closes its pipe once that daemon does.
+        reader.join(READER_GRACE_PERIOD)
+    duration = time.time() - started
+
+    stdout, stderr = ''.join(stdout), ''.join(stderr)
+    if timed_out.is_set():
+        logger.error('Command timed out after {0} seconds: {1}'.format(
+            timeout, command_str))
+        raise CommandTimeout(command_str, stderr, stdout, proc.returncode,
+                             duration)
+    if proc.returncode != 0:
+        logger.error('Failed running command: {0} ({1}).'.format(
+            command_str, stderr))
+        raise CommandFailed(command_str, stderr, stdout, proc.returncode,
+                            duration)
+    return Result(command_str, proc.returncode, stdout, stderr, duration)
+
+
+def run_all(commands, logger, timeout=TIMEOUT_DEFAULT):
+    """Run independent commands concurrently.
+
+    Waits for all of them and returns their results in order; the first
+    failure, if any, is raised once every command finished.
+    """
+    if len(commands) < 2:
+        return [run(command, logger, timeout) for command in commands]
+    pool = ThreadPool(len(commands))
+    try:
+        pending = [pool.apply_async(run, (command, logger, timeout))
+                   for command in commands]
+        outcomes = []
+        for result in pending:
+            try:
+                outcomes.append((result.get(), None))
+            except Exception as e:
+                outcomes.append((None, e))
+    finally:
+        pool.close()
+        pool.join()
+    for _, error in outcomes:
+        if error is not None:
+            raise error
+    return [result for result, _ in outcomes]
+
+
+def _stream(pipe, tail, logger):
+    for line in iter(pipe.readline, b''):
+        line = line.decode('utf-8', 'replace')
+        tail.append(line)
+        logger.debug(line.rstrip())
+    pipe.close()
+
+
+def _kill(proc, timed_out):
+    if proc.returncode is not None:
+        return
+    timed_out.set()
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except OSError:
+            return
+        for _ in range(KILL_GRACE_PERIOD * 10):
+            if proc.returncode is not None:
+                return
+            time.sleep(0.1)
@@ -0,0 +1,263 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+import os
+import json
+
+# Value specs: a dict lists the known keys of a mapping, a one item list
+# is a list of that spec, a tuple holds the accepted python types.
+STRING = (str, type(u''))
+INT = (int, type(2 ** 64))
+NUMBER = INT + (float,)
+BOOL = (bool,)
+# Durations such as 5s, or seconds.
+DURATION = STRING + NUMBER
+STRINGS = [STRING]
+ANY = (object,)
+RESULTS_KEPT = 100
+
+_TLS = {'certificate_authorities': STRINGS, 'certificate': STRING,
+        'certificate_key': STRING, 'insecure': BOOL,
+        'cipher_suites': STRINGS, 'curve_types': STRINGS,
+        'min_version': STRING, 'max_version': STRING}
+
+_PROSPECTOR_1 = {
+    'paths': STRINGS, 'encoding': STRING, 'input_type': STRING,
+    'exclude_lines': STRINGS, 'include_lines': STRINGS,
+    'exclude_files': STRINGS, 'fields': ANY, 'fields_under_root': BOOL,
+    'ignore_older': DURATION, 'close_older': DURATION,
+    'document_type': STRING, 'scan_frequency': DURATION,
+    'harvester_buffer_size': INT, 'max_bytes': INT, 'multiline': ANY,
+    'tail_files': BOOL, 'backoff': DURATION, 'max_backoff': DURATION,
+    'backoff_factor': INT, 'force_close_files': BOOL}
+
+_LOGSTASH_1 = {
+    'hosts': STRINGS, 'worker': INT, 'loadbalance': BOOL, 'port': INT,
+    'index': STRING, 'bulk_max_size': INT, 'timeout': DURATION,
+    'compression_level': INT, 'max_retries': INT, 'tls': _TLS}
+
+_ELASTICSEARCH_1 = {
+    'hosts': STRINGS, 'protocol': STRING, 'username': STRING,
+    'password': STRING, 'worker': INT, 'index': STRING, 'path': STRING,
+    'template': ANY, 'proxy_url': STRING, 'max_retries': INT,
+    'bulk_max_size': INT, 'timeout': DURATION, 'flush_interval': DURATION,
+    'save_topology': BOOL, 'topology_expire': INT, 'tls': _TLS}
+
+_LOGGING = {'to_syslog': BOOL, 'to_files': BOOL, 'to_stderr': BOOL,
+            'level': STRING, 'selectors': STRINGS, 'metrics': ANY,
+            'files': {'path': STRING, 'name': STRING,
+                      'rotateeverybytes': INT, 'keepfiles': INT,
+                      'permissions': NUMBER + STRING}}
+
+_OUTPUTS_1 = {'logstash': _LOGSTASH_1, 'elasticsearch': _ELASTICSEARCH_1,
+              'file': {'path': STRING, 'filename': STRING,
+                       'rotate_every_kb': INT, 'number_of_files': INT},
+              'console': {'pretty': BOOL}, 'redis': ANY, 'kafka': ANY}
+
+SCHEMA_1 = {
+    'filebeat': {'prospectors': [_PROSPECTOR_1], 'spool_size': INT,
+                 'publish_async': BOOL, 'idle_timeout': DURATION,
+                 'registry_file': STRING, 'config_dir': STRING},
+    'output': _OUTPUTS_1,
+    'shipper': {'name': STRING, 'tags': STRINGS, 'ignore_outgoing': BOOL,
+                'refresh_topology_freq': DURATION,
+                'topology_expire': INT, 'queue_size': INT,
+                'bulk_queue_size': INT, 'geoip': ANY},
+    'logging': _LOGGING}
+
+_PROSPECTOR_5 = dict(
+    _PROSPECTOR_1, type=STRING, close_inactive=DURATION,
+    close_renamed=BOOL, close_removed=BOOL, close_eof=BOOL,
+    close_timeout=DURATION, clean_inactive=DURATION, clean_removed=BOOL,
+    harvester_limit=INT, json=ANY, pipeline=STRING, symlinks=BOOL,
+    tags=STRINGS, processors=ANY, enabled=BOOL)
+
+_SSL = dict(_TLS, enabled=BOOL, verification_mode=STRING,
+            supported_protocols=STRINGS, key=STRING,
+            key_passphrase=STRING, renegotiation=STRING)
+
+_OUTPUTS_5 = dict(
+    _OUTPUTS_1,
+    logstash=dict(_LOGSTASH_1, ssl=_SSL, pipelining=INT,
+                  proxy_url=STRING, proxy_use_local_resolver=BOOL,
+                  slow_start=BOOL, ttl=DURATION, escape_html=BOOL,
+                  enabled=BOOL),
+    elasticsearch=dict(_ELASTICSEARCH_1, ssl=_SSL, headers=ANY,
+                       parameters=ANY, pipeline=STRING, pipelines=ANY,
+                       compression_level=INT, template=ANY,
+                       escape_html=BOOL, enabled=BOOL,
+                       loadbalance=BOOL))
+
+SCHEMA_5 = {
+    'filebeat': {'prospectors': [_PROSPECTOR_5], 'spool_size': INT,
+                 'publish_async': BOOL, 'idle_timeout': DURATION,
+                 'registry_file': STRING, 'config_dir': STRING,
+                 'shutdown_timeout': DURATION,
+                 'config': {'prospectors': {'path': STRING,
+                                            'reload.enabled': BOOL,
+                                            'reload.period': DURATION},
+                            'modules': ANY},
+                 'modules': ANY},
+    'output': _OUTPUTS_5,
+    'logging': _LOGGING,
+    'name': STRING, 'tags': STRINGS, 'fields': ANY,
+    'fields_under_root': BOOL, 'queue_size': INT,
+    'bulk_queue_size': INT, 'max_procs': INT, 'processors': ANY,
+    'path': ANY, 'setup': ANY, 'xpack': ANY, 'monitoring': ANY,
+    'http': ANY, 'queue': ANY, 'dashboards': ANY, 'shipper': ANY}
+
+_PROSPECTOR_6 = dict(_PROSPECTOR_5)
+del _PROSPECTOR_6['document_type']
+del _PROSPECTOR_6['input_type']
+del _PROSPECTOR_6['close_older']
+del _PROSPECTOR_6['force_close_files']
+
+_QUEUE = {'mem': {'events': INT,
+                  'flush': {'min_events': INT, 'timeout': DURATION}},
+          'spool': ANY}
+
+_OUTPUTS_6 = dict(
+    _OUTPUTS_5,
+    logstash=dict(_OUTPUTS_5['logstash'], backoff=ANY),
+    elasticsearch=dict(_OUTPUTS_5['elasticsearch'], backoff=ANY))
+
+_FILEBEAT_6 = {'prospectors': [_PROSPECTOR_6], 'registry_file': STRING,
+               'registry_file_permissions': NUMBER + STRING,
+               'registry_flush': DURATION, 'config_dir': STRING,
+               'shutdown_timeout': DURATION,
+               'config': {'prospectors': {'path': STRING,
+                                          'reload.enabled': BOOL,
+                                          'reload.period': DURATION},
+                          'modules': ANY},
+               'modules': ANY, 'autodiscover': ANY}
+
+SCHEMA_6 = dict(SCHEMA_5, filebeat=_FILEBEAT_6, output=_OUTPUTS_6,
+                queue=_QUEUE)
+del SCHEMA_6['queue_size']
+del SCHEMA_6['bulk_queue_size']
+
+_FILEBEAT_6_3 = dict(_FILEBEAT_6, inputs=[_PROSPECTOR_6],
+                     config=dict(_FILEBEAT_6['config'],
+                                 inputs=_FILEBEAT_6['config']['prospectors']))
+
+SCHEMA_6_3 = dict(SCHEMA_6, filebeat=_FILEBEAT_6_3)
+
+_FILEBEAT_7 = dict(_FILEBEAT_6_3, registry=ANY)
+for _removed in ('prospectors', 'registry_file', 'registry_file_permissions',
+                 'registry_flush', 'config_dir'):
+    del _FILEBEAT_7[_removed]
+
+SCHEMA_7 = dict(SCHEMA_6_3, filebeat=_FILEBEAT_7)
+
+# Schemas by the first filebeat version they describe.
+SCHEMAS = {(1, 0): SCHEMA_1, (5, 0): SCHEMA_5, (6, 0): SCHEMA_6,
+           (6, 3): SCHEMA_6_3, (7, 0): SCHEMA_7}
+
+
+def for_version(version):
+    """Return the schema of filebeat version, or None when unknown."""
+    if not version:
+        return None
+    known = [first for first in SCHEMAS if first <= tuple(version[:2])]
+    return SCHEMAS[max(known)] if known else None
+
+
+def validate(value, spec, path='', unknown=None):
+    """Return the errors found checking value against spec.
+
+    filebeat ignores settings it does not know, so those are not errors;
+    their paths are appended to unknown when it is given.
+    """
+    if value is None:
+        # An empty section or option, which filebeat ignores.
+        return []
+    if isinstance(spec, dict):
+        if not isinstance(value, dict):
+            return ['{0}: expected a mapping'.format(path or '<root>')]
+        errors = []
+        for key, item in value.items():
+            key_path = '{0}.{1}'.format(path, key) if path else str(key)
+            if key in spec:
+                errors.extend(validate(item, spec[key], key_path, unknown))
+                continue
+            head, _, rest = str(key).partition('.')
+            if rest and isinstance(spec.get(head), dict):
+                # Dotted keys, such as output.logstash.hosts, nest.
+                errors.extend(validate(
+                    {rest: item}, spec[head],
+                    '{0}.{1}'.format(path, head) if path else head,
+                    unknown))
+            elif unknown is not None:
+                unknown.append(key_path)
+        return errors
+    if isinstance(spec, list):
+        if not isinstance(value, list):
+            return ['{0}: expected a list'.format(path)]
+        errors = []
+        for index, item in enumerate(value):
+            errors.extend(validate(item, spec[0],
+                                   '{0}[{1}]'.format(path, index), unknown))
+        return errors
+    if isinstance(value, bool) and BOOL != spec and spec != ANY:
+        return ['{0}: expected {1}, got a boolean'.format(
+            path, _names(spec))]
+    if not isinstance(value, spec):
+        return ['{0}: expected {1}, got {2!r}'.format(
+            path, _names(spec), value)]
+    return []
+
+
+def _names(spec):
+    if spec == BOOL:
+        return 'a boolean'
+    if spec == STRING:
+        return 'a string'
+    if spec == INT:
+        return 'an integer'
+    if spec == DURATION:
+        return 'a duration'
+    return 'one of {0}'.format(', '.join(t.__name__ for t in spec))
+
+
+class ResultCache(object):
+    """Keys of the configurations which passed validation, kept in a file.
+
+    Only the last kept keys are remembered.
+    """
+
+    def __init__(self, path, kept=RESULTS_KEPT):
+        self.path = path
+        self.kept = kept
+        self.keys = []
+        if os.path.isfile(path):
+            try:
+                with open(path) as f:
+                    self.keys = json.load(f)
+            except ValueError:
+                self.keys = []
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def add(self, key):
+        if key in self.keys:
+            self.keys.remove(key)
+        self.keys = (self.keys + [key])[-self.kept:]
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(self.keys, f)
+        os.rename(self.path + '.tmp', self.path)
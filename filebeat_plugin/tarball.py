@@ -0,0 +1,175 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+import os
+import platform
+
+from filebeat_plugin import versions
+
+SUFFIXES = ('.tar.gz', '.tgz')
+CURRENT_LINK = 'current'
+VERSION_DIR_PREFIX = 'filebeat-'
+# The current version and the ones before it, to switch back to.
+VERSIONS_KEPT = 3
+DATA_DIR = os.path.join('/', 'var', 'lib', 'filebeat')
+LOGS_DIR = os.path.join('/', 'var', 'log', 'filebeat')
+BINARY_LINK = os.path.join('/', 'usr', 'bin', 'filebeat')
+SYSTEMD_UNIT_FILE = os.path.join('/', 'etc', 'systemd', 'system',
+                                 'filebeat.service')
+INIT_SCRIPT_FILE = os.path.join('/', 'etc', 'init.d', 'filebeat')
+PID_FILE = os.path.join('/', 'var', 'run', 'filebeat.pid')
+# filebeat takes -path.* flags from 5.0 on.
+PATH_FLAGS_VERSION = (5,)
+ARCHITECTURES = {'x86_64': 'x86_64', 'amd64': 'x86_64',
+                 'aarch64': 'arm64', 'arm64': 'arm64'}
+
+SYSTEMD_UNIT = """\
+[Unit]
+Description=filebeat
+Documentation=https://www.elastic.co/products/beats/filebeat
+Wants=network-online.target
+After=network-online.target
+
+[Service]
+WorkingDirectory={data_dir}
+ExecStart={command}
+Restart=always
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+INIT_SCRIPT = """\
+#!/bin/sh
+### BEGIN INIT INFO
+# Provides:          filebeat
+# Required-Start:    $local_fs $network $syslog
+# Required-Stop:     $local_fs $network $syslog
+# Default-Start:     2 3 4 5
+# Default-Stop:      0 1 6
+# Short-Description: filebeat ships log files
+### END INIT INFO
+
+PIDFILE={pid_file}
+
+running() {{
+    [ -f $PIDFILE ] && kill -0 $(cat $PIDFILE) 2>/dev/null
+}}
+
+start() {{
+    running && return 0
+    cd {data_dir} || return 1
+    nohup {command} >/dev/null 2>&1 &
+    echo $! > $PIDFILE
+}}
+
+stop() {{
+    if running; then
+        kill $(cat $PIDFILE)
+        while running; do sleep 1; done
+    fi
+    rm -f $PIDFILE
+}}
+
+case "$1" in
+    start) start ;;
+    stop) stop ;;
+    restart) stop; start ;;
+    status)
+        if running; then
+            echo "filebeat is running"
+        else
+            echo "filebeat is stopped"
+            exit 3
+        fi
+        ;;
+    *)
+        echo "Usage: $0 {{start|stop|restart|status}}"
+        exit 2
+        ;;
+esac
+"""
+
+
+def is_tarball(filename):
+    return filename.endswith(SUFFIXES)
+
+
+def download_url(version):
+    """Return the url of the official linux tarball of version."""
+    machine = ARCHITECTURES.get(platform.machine(), 'x86_64')
+    text = versions.to_string(version)
+    if version[0] < 5:
+        return 'https://download.elastic.co/beats/filebeat/' \
+            'filebeat-{0}-{1}.tar.gz'.format(text, machine)
+    return 'https://artifacts.elastic.co/downloads/beats/filebeat/' \
+        'filebeat-{0}-linux-{1}.tar.gz'.format(text, machine)
+
+
+def version_dir(install_path, version):
+    return os.path.join(install_path,
+                        VERSION_DIR_PREFIX + versions.to_string(version))
+
+
+def current_link(install_path):
+    return os.path.join(install_path, CURRENT_LINK)
+
+
+def current_version(install_path):
+    """Return the version the current link points at, or None."""
+    link = current_link(install_path)
+    if not os.path.islink(link):
+        return None
+    return versions.parse(os.path.basename(os.readlink(link)))
+
+
+def stale_dirs(install_path, kept=VERSIONS_KEPT):
+    """Return the version directories beyond the kept newest ones.
+
+    The directory current points at is always kept.
+    """
+    current = current_link(install_path)
+    current = os.path.realpath(current) if os.path.islink(current) else None
+    found = []
+    for name in os.listdir(install_path):
+        path = os.path.join(install_path, name)
+        version = versions.parse(name)
+        if version and name == VERSION_DIR_PREFIX + versions.to_string(
+                version) and os.path.isdir(path) and \
+                not os.path.islink(path):
+            found.append((version, path))
+    found.sort(key=lambda item: versions.sort_key(item[0]), reverse=True)
+    return [stale for _, stale in found[kept:]
+            if os.path.realpath(stale) != current]
+
+
+def command(home, config_file, version):
+    """Return the command line the service runs filebeat with."""
+    parts = [os.path.join(home, 'filebeat'), '-c', config_file]
+    if version and tuple(version[:1]) >= PATH_FLAGS_VERSION:
+        parts += ['-path.home', home,
+                  '-path.config', os.path.dirname(config_file),
+                  '-path.data', DATA_DIR, '-path.logs', LOGS_DIR]
+    return ' '.join(parts)
+
+
+def systemd_unit(home, config_file, version):
+    return SYSTEMD_UNIT.format(data_dir=DATA_DIR,
+                               command=command(home, config_file, version))
+
+
+def init_script(home, config_file, version):
+    return INIT_SCRIPT.format(pid_file=PID_FILE, data_dir=DATA_DIR,
+                              command=command(home, config_file, version))
@@ -27,72 +27,281 @@
 ########
 import os
 import sys
+import json
+import time
 import shlex
+import shutil
+import functools
 import tempfile
 import subprocess
-import pkg_resources
-
-import jinja2
-import distro
-import requests
+from multiprocessing.pool import ThreadPool
+try:
+    from shutil import which
+except ImportError:
+    from distutils.spawn import find_executable as which
 
 from cloudify import ctx
+from cloudify import context
 from cloudify import exceptions
 from cloudify.decorators import operation
 
-import filebeat_plugin
+from filebeat_plugin import cache
+from filebeat_plugin import download
+from filebeat_plugin import fragments
+from filebeat_plugin import health
+from filebeat_plugin import journal
+from filebeat_plugin import metrics
+from filebeat_plugin import mirrors
+from filebeat_plugin import model
+from filebeat_plugin import planner
+from filebeat_plugin import privileged
+from filebeat_plugin import registry
+from filebeat_plugin import runner
+from filebeat_plugin import schema
+from filebeat_plugin import tarball
+from filebeat_plugin import templates
+from filebeat_plugin import tuning
+from filebeat_plugin import versions
 
-distro = distro.id()
 FILEBEAT_CONFIG_FILE_DEFAULT = os.path.join(
     '/', 'etc', 'filebeat', 'filebeat.yml')
 FILEBEAT_PATH_DEFAULT = os.path.join('/', 'opt', 'filebeat')
+FILEBEAT_STATE_DIR_DEFAULT = os.path.join(
+    os.path.expanduser('~'), '.cloudify-filebeat')
+FILEBEAT_CACHE_DIR_DEFAULT = os.path.join(
+    FILEBEAT_STATE_DIR_DEFAULT, 'packages')
+CONFIG_UNCHANGED_PROPERTY = 'filebeat_config_unchanged'
+TUNING_PROPERTY = 'filebeat_tuning'
+PATH_PLAN_PROPERTY = 'filebeat_path_plan'
+VALIDATED_CONFIGS_FILE = 'validated.json'
+FRAGMENTS_MANIFEST_FILE = 'fragments.json'
+VERSION_FILE = 'version.json'
+REGISTRY_BACKUP_FILE = 'registry.json'
+REGISTRY_PROPERTY = 'filebeat_registry'
+METRICS_PROPERTY = 'filebeat_metrics'
+HEALTH_PROPERTY = 'filebeat_health'
+UPGRADE_PROPERTY = 'filebeat_upgrade'
+UPGRADE_CONFIG_BACKUP_FILE = 'filebeat.yml.previous'
+UPGRADE_VERIFY_SECONDS_DEFAULT = 30
+CONFIGTEST_COMMAND_VERSION = (6, 0)
+INSTALL_METHODS = ('package', 'tarball')
+TARBALL_VERSION_DEFAULT = (1, 2, 3)
+ROOT_FILE_MODE = 0o644
+
+_distro_id = None
+
+
+def _distro():
+    """Return the id of the linux distribution, detected once."""
+    global _distro_id
+    if _distro_id is None:
+        import distro
+        _distro_id = distro.id()
+    return _distro_id
+
+
+def _instrumented(func):
+    """Record how long func and its phases and commands take.
+
+    Called from another instrumented function, func is one of its phases.
+    Otherwise the measurements are kept in the filebeat_metrics runtime
+    property, under the name of func, and logged as a structured event.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with metrics.operation(func.__name__) as recorder:
+            if recorder is None:
+                return func(*args, **kwargs)
+            ok = False
+            try:
+                result = func(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                _publish_metrics(recorder.summary(ok))
+    return wrapper
+
+
+def _privileged_session(func):
+    """Run the sudo commands of func through one privileged helper."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with privileged.session(ctx.logger):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _publish_metrics(summary):
+    properties = _runtime_properties()
+    measured = dict(properties.get(METRICS_PROPERTY) or {})
+    measured[summary['operation']] = summary
+    properties[METRICS_PROPERTY] = measured
+    ctx.logger.info(metrics.event(summary))
 
 
 @operation
+@_instrumented
+@_privileged_session
 def install(filebeat_config_inputs,
             filebeat_config_file='',
             filebeat_install_path='',
             download_url='',
+            download_checksum='',
+            download_mirrors=None,
+            filebeat_version='',
+            filebeat_config_dir='',
+            package_cache_dir='',
+            package_cache_size=cache.CACHE_SIZE_DEFAULT,
+            auto_tune=False,
+            plan_paths=False,
+            strict_validation=False,
+            install_method='package',
             **kwargs):
     """Installation operation.
 
     Downloading and installing filebeat packacge - default version is 0.12.0.
     Default installation dir is set to /opt/filebeat.
+    Downloaded packages are kept in a local cache (by default under
+    ~/.cloudify-filebeat/packages) and reused on reinstall or heal.
+    Download and install are journaled, so a retried install resumes at
+    the first step which did not complete; configure always runs. When
+    the requested version (from filebeat_version or download_url) is
+    already installed, only the configuration is applied.
+    The registry of an installed filebeat is backed up before the package
+    is installed and restored by start, so logs are not shipped again.
+    With install_method 'tarball', the official tarball is unpacked into
+    a directory per version under filebeat_install_path instead of using
+    the package manager; see _install_tarball.
     Only linux distributions are supported.
     """
     if 'linux' not in sys.platform:
         raise exceptions.NonRecoverableError(
             'Error! filebeat-plugin is available on linux distribution only')
+    if install_method not in INSTALL_METHODS:
+        raise ValueError('install_method should be one of: {0}'.format(
+            ', '.join(INSTALL_METHODS)))
     if not filebeat_install_path:
         filebeat_install_path = FILEBEAT_PATH_DEFAULT
     if os.path.isfile(filebeat_install_path):
         raise ValueError(
             format("Error! {0} file already exists, can't create dir.",
                    filebeat_install_path))
+    version = _parse_filebeat_version(filebeat_version)
+
+    package_cache = None
+    if package_cache_size:
+        package_cache = cache.PackageCache(
+            package_cache_dir or FILEBEAT_CACHE_DIR_DEFAULT,
+            package_cache_size)
+
+    # The url resolved from filebeat_version is part of the key, so a
+    # new version is not taken for the one installed before.
+    download_url = download_url or _default_download_url(
+        install_method, version)
+    if install_method == 'tarball':
+        _check_tarball(download_url)
+    steps = journal.StepJournal(
+        os.path.join(FILEBEAT_STATE_DIR_DEFAULT, 'install.json'),
+        journal.inputs_key(filebeat_config_inputs, filebeat_config_file,
+                           filebeat_install_path, download_url,
+                           download_checksum, filebeat_config_dir,
+                           auto_tune, plan_paths, install_method))
 
-    installation_file = download_filebeat(download_url, filebeat_install_path)
-    install_filebeat(installation_file, filebeat_install_path)
-    configure(filebeat_config_file, filebeat_config_inputs)
+    requested_version = version or versions.from_url(download_url)
+    installed_version = _probe_version(install_method, filebeat_install_path)
+    if requested_version and requested_version == installed_version:
+        ctx.logger.info(
+            'filebeat {0} is already installed, skipping download and '
+            'install.'.format(versions.to_string(installed_version)))
+    else:
+        _backup_registry((filebeat_config_inputs or {}).get('paths'))
+        _download_and_install(steps, download_url, filebeat_install_path,
+                              download_checksum, package_cache,
+                              download_mirrors, install_method,
+                              installed_version)
+
+    # Not journaled: the template may have changed on the manager, and an
+    # unchanged configuration is cheap to render again.
+    configure(filebeat_config_file, filebeat_config_inputs,
+              filebeat_config_dir, auto_tune, plan_paths,
+              strict_validation)
+
+
+def _probe_version(install_method, filebeat_install_path):
+    if install_method == 'tarball':
+        return tarball.current_version(filebeat_install_path)
+    return _installed_version()
+
+
+def _download_and_install(steps, download_url, filebeat_install_path,
+                          download_checksum, package_cache, download_mirrors,
+                          install_method='package', installed_version=None):
+    """Download and install, skipping the steps journaled as completed.
+
+    A journaled install only counts while the version it installed is
+    still the installed one.
+    """
+    downloaded = steps.completed('download')
+    if downloaded and steps.completed('download', os.path.join(
+            filebeat_install_path, downloaded['installation_file'])):
+        installation_file = downloaded['installation_file']
+        ctx.logger.info('filebeat already downloaded, skipping download.')
+    else:
+        installation_file = download_filebeat(download_url,
+                                              filebeat_install_path,
+                                              download_checksum,
+                                              package_cache,
+                                              download_mirrors)
+        steps.complete('download',
+                       os.path.join(filebeat_install_path, installation_file),
+                       installation_file=installation_file)
+
+    installed = steps.completed('install')
+    if installed and installed.get('version') and \
+            installed['version'] == versions.to_string(installed_version):
+        ctx.logger.info('filebeat already installed, skipping install.')
+    else:
+        install_filebeat(installation_file, filebeat_install_path)
+        steps.complete('install', version=versions.to_string(
+            _probe_version(install_method, filebeat_install_path)))
 
 
 @operation
-def start(**kwargs):
+@_instrumented
+@_privileged_session
+def start(health_check_seconds=0, fail_when_not_shipping=False, **kwargs):
     """Start operation call for filebeat service,
     with filebeat_plugin configuration file.
 
     If filebeat service was already running -
     it will restart it and will use updated configuration file.
+    The restart is skipped when configure left the configuration
+    unchanged and the service is already running.
+    A registry backed up by install or configure is restored first, with
+    filebeat stopped; see _restore_registry.
+    With health_check_seconds, filebeat is watched for that long to check
+    it ships, whether it was restarted or not; see _check_shipping.
     """
     ctx.logger.info('Starting filebeat service...')
     filebeat_config_file = FILEBEAT_CONFIG_FILE_DEFAULT
     if not os.path.isfile(filebeat_config_file):
         raise ValueError(
             "Can't start the service. Wrong config file provided")
+    _restore_registry()
 
-    if os.path.exists('/usr/bin/systemctl'):
-        proc = _run('sudo systemctl restart filebeat')
-    else:
-        proc = _run('sudo service filebeat restart')
+    if _runtime_properties().get(CONFIG_UNCHANGED_PROPERTY) and \
+            _service_running():
+        ctx.logger.info(
+            'filebeat configuration is unchanged and the service is running,'
+            ' skipping restart.')
+        if health_check_seconds:
+            _check_shipping(health_check_seconds, fail_when_not_shipping)
+        return ''
+
+    with metrics.phase('restart'):
+        proc = _restart_service()
+    if health_check_seconds:
+        _check_shipping(health_check_seconds, fail_when_not_shipping)
 
     ctx.logger.info(
         'Good Luck! filebeat service is up!'
@@ -100,11 +309,176 @@ def start(**kwargs):
     return proc.aggr_stdout
 
 
-def download_filebeat(download_url='', filebeat_install_path='', **kwargs):
+@operation
+@_instrumented
+@_privileged_session
+def upgrade(download_url='',
+            filebeat_version='',
+            filebeat_install_path='',
+            download_checksum='',
+            download_mirrors=None,
+            filebeat_config_file='',
+            filebeat_config_inputs=None,
+            filebeat_config_dir='',
+            verify_seconds=UPGRADE_VERIFY_SECONDS_DEFAULT,
+            min_throughput_ratio=health.MIN_THROUGHPUT_RATIO,
+            **kwargs):
+    """Upgrade operation for filebeat installed from a tarball.
+
+    The new version is unpacked next to the running one, which is watched
+    for verify_seconds to measure its shipping rate. The configuration,
+    rendered again for the new version when filebeat_config_inputs or
+    filebeat_config_file are given, is tested with the new filebeat; only
+    then is the current link switched and filebeat restarted and watched
+    as long. When the test fails, filebeat does not keep running, the
+    registry shows no files to verify shipping with while it had some
+    before, or it ships below min_throughput_ratio of the rate before
+    while logs wait to be shipped, the previous version, configuration
+    and prospector files are switched back and NonRecoverableError is
+    raised, which also stops a filebeat_rollout.
+    Other errors are raised as they are, after the same roll back.
+    filebeat 7 and later are refused, see _check_upgradable.
+    The outcome is kept in the filebeat_upgrade runtime property.
+    """
+    install_path = filebeat_install_path or FILEBEAT_PATH_DEFAULT
+    previous = tarball.current_version(install_path)
+    if not previous:
+        raise exceptions.NonRecoverableError(
+            'Error! upgrade needs filebeat installed with install_method '
+            'tarball under {0}'.format(install_path))
+    if not os.path.isfile(FILEBEAT_CONFIG_FILE_DEFAULT):
+        raise ValueError("Can't upgrade filebeat. No config file found")
+    requested_version = _parse_filebeat_version(filebeat_version)
+    download_url = download_url or _default_download_url(
+        'tarball', requested_version)
+    _check_tarball(download_url)
+    requested_version = requested_version or versions.from_url(download_url)
+    _check_upgradable(requested_version)
+    if requested_version == previous:
+        ctx.logger.info('filebeat {0} is already installed.'.format(
+            versions.to_string(previous)))
+        return False
+
+    installation_file = download_filebeat(download_url, install_path,
+                                          download_checksum, None,
+                                          download_mirrors)
+    target, version = _unpack_tarball(
+        os.path.join(install_path, installation_file), install_path)
+    _check_upgradable(version)
+    executable = os.path.join(target, 'filebeat')
+    outcome = {'from': versions.to_string(previous),
+               'to': versions.to_string(version),
+               'before': None, 'after': None,
+               'rolled_back': False, 'reason': None}
+    _runtime_properties()[UPGRADE_PROPERTY] = outcome
+    if _service_running():
+        outcome['before'] = _measure_shipping(verify_seconds)
+    config_backup = os.path.join(FILEBEAT_STATE_DIR_DEFAULT,
+                                 UPGRADE_CONFIG_BACKUP_FILE)
+    if not os.path.isdir(FILEBEAT_STATE_DIR_DEFAULT):
+        os.makedirs(FILEBEAT_STATE_DIR_DEFAULT)
+    with open(config_backup, 'w') as f:
+        f.write(_read_privileged(FILEBEAT_CONFIG_FILE_DEFAULT))
+    # configure rewrites the prospector files in the new layout.
+    fragments_backup = None
+    if filebeat_config_dir:
+        fragments_backup = _backup_fragments(filebeat_config_dir)
+
+    activated = False
+    error = None
+    try:
+        # Tested with the new binary before the service can run it.
+        tested = False
+        if filebeat_config_inputs or filebeat_config_file:
+            tested = configure(filebeat_config_file, filebeat_config_inputs,
+                               filebeat_config_dir, strict_validation=True,
+                               version=version, executable=executable)
+        if not tested:
+            with metrics.phase('configtest'):
+                _run(_configtest_command(version, executable).format(
+                    FILEBEAT_CONFIG_FILE_DEFAULT))
+        _activate(install_path, target, version)
+        activated = True
+        with metrics.phase('restart'):
+            _restart_service()
+        outcome['after'] = _measure_shipping(verify_seconds)
+        if not _service_running():
+            outcome['reason'] = 'filebeat {0} is not running'.format(
+                outcome['to'])
+        else:
+            outcome['reason'] = health.regressed(
+                outcome['before'], outcome['after'], min_throughput_ratio)
+    except Exception as e:
+        error = e
+        outcome['reason'] = '{0}: {1}'.format(type(e).__name__, e)
+    if not outcome['reason']:
+        os.remove(config_backup)
+        ctx.logger.info('filebeat was upgraded from {0} to {1}.'.format(
+            outcome['from'], outcome['to']))
+        return True
+
+    ctx.logger.warning('Rolling filebeat back to {0}: {1}'.format(
+        outcome['from'], outcome['reason']))
+    with metrics.phase('rollback'):
+        _roll_back(install_path, previous, config_backup,
+                   (filebeat_config_inputs or {}).get('paths'), activated,
+                   filebeat_config_dir, fragments_backup)
+    outcome['rolled_back'] = True
+    if error is not None:
+        raise error
+    raise exceptions.NonRecoverableError(
+        'filebeat {0} was rolled back to {1}: {2}'.format(
+            outcome['to'], outcome['from'], outcome['reason']))
+
+
+def _check_upgradable(version):
+    """Raise NonRecoverableError for a version upgrade can not verify.
+
+    filebeat 7 keeps its registry as a directory, which the shipping
+    measure does not read.
+    """
+    if model.at_least(version, model.REGISTRY_PATH_VERSION):
+        raise exceptions.NonRecoverableError(
+            'Error! upgrade can not verify filebeat {0}: from {1} on the '
+            'registry is a directory, which is not read here'.format(
+                versions.to_string(version),
+                versions.to_string(model.REGISTRY_PATH_VERSION)))
+
+
+def _roll_back(install_path, previous, config_backup, paths,
+               activated=True, config_dir='', fragments_backup=None):
+    """Switch back to the previous version and its configuration.
+
+    The prospector files of fragments_backup are put back under
+    config_dir as well. The offsets the new version reached are kept, in
+    the registry format of the previous one. When the new version was not
+    activated, the previous one still runs and only its configuration is
+    restored.
+    """
+    if activated:
+        _activate(install_path, tarball.version_dir(install_path, previous),
+                  previous)
+    _install_root_file(config_backup, FILEBEAT_CONFIG_FILE_DEFAULT)
+    if fragments_backup is not None:
+        _put_fragments(config_dir, fragments_backup)
+    if not activated:
+        return
+    if _backup_registry(paths):
+        _restore_registry()
+    _restart_service()
+
+
+@_instrumented
+def download_filebeat(download_url='', filebeat_install_path='',
+                      download_checksum='', package_cache=None,
+                      download_mirrors=None, **kwargs):
     """Downloading filebeat package form your desire url.
 
     Default url set to be version 0.12.0
     anf downloaded from official influxdb site.
+    A package_cache hit is served without touching the network.
+    download_mirrors carrying the same package file are preferred,
+    fastest first, and download_url is the last resort.
     """
 
     if not os.path.exists(filebeat_install_path):
@@ -113,30 +487,39 @@ def download_filebeat(download_url='', filebeat_install_path='', **kwargs):
     ctx.logger.info('Downloading filebeat...')
 
     if not download_url:
-        if distro in ('ubuntu', 'debian'):
-            download_url = 'https://download.elastic.co/beats/filebeat/' + \
-                'filebeat_1.2.3_amd64.deb'
-        elif distro in ('centos', 'redhat'):
-            download_url = 'https://download.elastic.co/beats/filebeat/' + \
-                'filebeat-1.2.3-x86_64.rpm'
-        else:
+        download_url = _default_download_url()
+        if not download_url:
             raise exceptions.NonRecoverableError(
                 '''Error! distribution is not supported.
                 Ubuntu, Debian, Centos and Redhat are supported currently''')
-    installation_file = _download_file(download_url, filebeat_install_path)
+    installation_file = _download_file(download_url,
+                                       filebeat_install_path,
+                                       download_checksum,
+                                       package_cache,
+                                       download_mirrors)
 
     ctx.logger.info('filebeat downloaded.')
     return installation_file
 
 
+@_instrumented
 def install_filebeat(installation_file, filebeat_install_path, **kwargs):
-    """Depacking filebeat package."""
+    """Depacking filebeat package.
+
+    Tarballs are unpacked in place of a package manager install.
+    """
     ctx.logger.info('Installing filebeat...')
 
-    if distro in ('ubuntu', 'debian'):
+    if tarball.is_tarball(installation_file):
+        _install_tarball(
+            os.path.join(filebeat_install_path, installation_file),
+            filebeat_install_path)
+        ctx.logger.info('filebeat service was installed...')
+        return
+    if _distro() in ('ubuntu', 'debian'):
         install_cmd = 'sudo dpkg -i {0}'.format(
             os.path.join(filebeat_install_path, installation_file))
-    elif distro in ('centos', 'redhat'):
+    elif _distro() in ('centos', 'redhat'):
         install_cmd = 'sudo rpm -vi {0}'.format(
             os.path.join(filebeat_install_path, installation_file))
     else:
@@ -147,71 +530,850 @@ def install_filebeat(installation_file, filebeat_install_path, **kwargs):
     ctx.logger.info('filebeat service was installed...')
 
 
-def configure(filebeat_config_file='', filebeat_config='', **kwargs):
+def _install_tarball(archive, install_path):
+    """Unpack archive into its own version directory under install_path
+    and switch to it.
+    """
+    _activate(install_path, *_unpack_tarball(archive, install_path))
+
+
+def _unpack_tarball(archive, install_path):
+    """Unpack archive into its own version directory under install_path.
+
+    The directory is unpacked under a temporary name and renamed once
+    complete. Returns the directory and the version.
+    """
+    _check_tarball(archive)
+    version = versions.parse(os.path.basename(archive))
+    if not version:
+        raise exceptions.NonRecoverableError(
+            "Error! can't tell the filebeat version of {0}".format(archive))
+    target = tarball.version_dir(install_path, version)
+    if os.path.isdir(target):
+        ctx.logger.info('{0} is already unpacked.'.format(target))
+    else:
+        staging = target + '.partial'
+        _run('sudo rm -rf {0}'.format(staging))
+        _run('sudo mkdir -p {0}'.format(staging))
+        _run('sudo tar -xzf {0} -C {1} --strip-components=1'.format(
+            archive, staging))
+        _run('sudo mv {0} {1}'.format(staging, target))
+    return target, version
+
+
+def _check_tarball(location):
+    """Raise NonRecoverableError unless location, a url or a file, is
+    a tarball.
+    """
+    if not tarball.is_tarball(location.split('/')[-1]):
+        raise exceptions.NonRecoverableError(
+            'Error! install_method tarball needs a {0} file, got {1}'.format(
+                ' or '.join(tarball.SUFFIXES), location))
+
+
+def _activate(install_path, target, version):
+    """Switch the current link to target, with the service running
+    filebeat through that link.
+
+    Only the last tarball.VERSIONS_KEPT version directories are kept.
+    """
+    _switch_current(install_path, target)
+    _install_service(tarball.current_link(install_path), version)
+    for stale in tarball.stale_dirs(install_path):
+        _run('sudo rm -rf {0}'.format(stale))
+
+
+def _switch_current(install_path, target):
+    """Point the current link of install_path at target atomically."""
+    link = tarball.current_link(install_path)
+    _run('sudo ln -sfn {0} {1}.new'.format(target, link))
+    _run('sudo mv -T {0}.new {0}'.format(link))
+    _run('sudo ln -sfn {0} {1}'.format(os.path.join(link, 'filebeat'),
+                                       tarball.BINARY_LINK))
+    ctx.logger.info('{0} now points at {1}.'.format(link, target))
+
+
+def _install_service(home, version):
+    """Write the systemd unit, or the init script, running home/filebeat."""
+    _run('sudo mkdir -p {0} {1} {2}'.format(
+        tarball.DATA_DIR, tarball.LOGS_DIR,
+        os.path.dirname(FILEBEAT_CONFIG_FILE_DEFAULT)))
+    if os.path.exists('/usr/bin/systemctl'):
+        _write_root_file(tarball.SYSTEMD_UNIT_FILE, tarball.systemd_unit(
+            home, FILEBEAT_CONFIG_FILE_DEFAULT, version))
+        _run('sudo systemctl daemon-reload')
+        _run('sudo systemctl enable filebeat')
+        return
+    _write_root_file(tarball.INIT_SCRIPT_FILE, tarball.init_script(
+        home, FILEBEAT_CONFIG_FILE_DEFAULT, version), 0o755)
+    if os.path.exists('/usr/sbin/update-rc.d'):
+        _run('sudo update-rc.d filebeat defaults')
+    elif os.path.exists('/sbin/chkconfig'):
+        _run('sudo chkconfig --add filebeat')
+
+
+def _write_root_file(path, content, mode=ROOT_FILE_MODE):
+    with tempfile.NamedTemporaryFile('w', delete=False) as f:
+        f.write(content)
+    _install_root_file(f.name, path, mode)
+
+
+def _install_root_file(source, path, mode=ROOT_FILE_MODE):
+    """Move source to path, owned by root.
+
+    filebeat 6 and later refuse to load configuration files root does not
+    own, or which others can write to.
+    """
+    os.chmod(source, mode)
+    _run('sudo mv {0} {1}'.format(source, path))
+    _run('sudo chown root:root {0}'.format(path))
+
+
+@_instrumented
+def configure(filebeat_config_file='', filebeat_config='',
+              filebeat_config_dir='', auto_tune=False, plan_paths=False,
+              strict_validation=False, version=None, executable='filebeat',
+              registry_file='', **kwargs):
     """Generating configuration file from your own desire destination
     or from filebeat_plugin filebeat.conf file.
 
     Rendering your inputs/outputs definitions.
+    When the rendered configuration matches the installed one, which
+    passed configtest before, nothing is written or tested and the
+    filebeat_config_unchanged runtime property tells start that no
+    restart is needed.
+    With filebeat_config_dir, every document_type of paths is written as
+    its own prospector file there and only the changed files are touched.
+    With auto_tune, spool and output settings are derived from the host
+    and the logs it ships; see _tune.
+    The registry is kept in registry_file (a variable of user templates
+    as well); a registry found elsewhere is backed up for start to
+    restore there. A registry_file given, as for a filebeat other than
+    the service, is used as it is and nothing is backed up.
+    With plan_paths, the paths globs are expanded once to derive per
+    prospector options and to check the harvesters fit the open files
+    limit; see _plan_paths.
+    The rendered configuration is checked against the settings the
+    installed filebeat version knows, and filebeat's own configtest runs
+    on it before it is installed, only for configurations not validated
+    before, or with strict_validation; see _validate_config.
+    version and executable are those of the filebeat to configure, by
+    default the installed one.
     """
     ctx.logger.info('Configuring filebeat...')
+    if auto_tune:
+        filebeat_config = _tune(filebeat_config or {})
+    prospector_options = {}
+    if plan_paths:
+        prospector_options = _plan_paths(
+            (filebeat_config or {}).get('paths'), plan_paths)
+    if not registry_file:
+        registry_file = registry.REGISTRY_FILE_DEFAULT
+        _backup_registry((filebeat_config or {}).get('paths'),
+                         registry_file)
     dest_file = os.path.join(tempfile.gettempdir(), 'filebeat.yml')
-    if filebeat_config_file:
+    version = version or _filebeat_version()
+    config_reload = False
+    fragments_changed = False
+    if filebeat_config_dir:
+        config_reload = fragments.supports_reload(version)
+        fragments_changed = _sync_fragments(
+            filebeat_config_dir,
+            (filebeat_config or {}).get('paths'),
+            config_reload,
+            prospector_options,
+            version)
+    with metrics.phase('render') as measured:
+        _render_config(filebeat_config_file,
+                       dict(filebeat_config or {},
+                            config_dir=filebeat_config_dir,
+                            config_reload=config_reload,
+                            prospector_options=prospector_options,
+                            registry_file=registry_file,
+                            filebeat_version=version),
+                       dest_file)
+        measured['bytes'] = os.path.getsize(dest_file)
+    validated = schema.ResultCache(
+        os.path.join(FILEBEAT_STATE_DIR_DEFAULT, VALIDATED_CONFIGS_FILE))
+    with metrics.phase('validate'):
+        validation_key = _validate_config(dest_file, validated, version)
+    config_unchanged = os.path.isfile(FILEBEAT_CONFIG_FILE_DEFAULT) and \
+        cache.file_digest(dest_file) == \
+        cache.file_digest(FILEBEAT_CONFIG_FILE_DEFAULT)
+    # An installed configuration which never passed configtest, such as
+    # one left by a failed run, is tested again.
+    if config_unchanged and not fragments_changed and \
+            validation_key in validated:
+        os.remove(dest_file)
+        _runtime_properties()[CONFIG_UNCHANGED_PROPERTY] = True
+        ctx.logger.info('filebeat configuration is unchanged.')
+        return False
+    # Prospector files are not part of the key, so they are tested anew.
+    # The rendered file is tested before it is installed, so a rejected
+    # configuration never replaces the working one.
+    if strict_validation or fragments_changed or \
+            validation_key not in validated:
+        os.chmod(dest_file, ROOT_FILE_MODE)
         try:
-            ctx.download_resource_and_render(filebeat_config_file,
-                                             dest_file,
-                                             filebeat_config)
+            with metrics.phase('configtest'):
+                _run(_configtest_command(version, executable).format(
+                     dest_file))
         except:
+            os.remove(dest_file)
             raise ValueError(
-                "wrong inputs provided! can't redner configuration file")
+                "wrong inputs prodided! configuration file is unvalid")
+        validated.add(validation_key)
     else:
-        filebeat_config_file = pkg_resources.resource_string(
-            filebeat_plugin.__name__, 'resources/filebeat.yml')
-        configuration = jinja2.Template(filebeat_config_file)
-        try:
-            with open(dest_file, 'w') as f:
-                f.write(configuration.render(filebeat_config))
-        except:
-            raise ValueError(
-                "wrong inputs provided! can't redner configuration file")
-    _run('sudo mv {0} {1}'.format(dest_file, FILEBEAT_CONFIG_FILE_DEFAULT))
-    try:
-        _run('filebeat -c {0} -configtest'.format(
-             FILEBEAT_CONFIG_FILE_DEFAULT))
-    except:
-        raise ValueError(
-            "wrong inputs prodided! configuration file is unvalid")
+        ctx.logger.info('filebeat configuration was validated before, '
+                        'skipping configtest.')
+    if config_unchanged:
+        os.remove(dest_file)
+    else:
+        _install_root_file(dest_file, FILEBEAT_CONFIG_FILE_DEFAULT)
+    # A reloading filebeat picks changed prospector files up by itself.
+    _runtime_properties()[CONFIG_UNCHANGED_PROPERTY] = \
+        config_unchanged and config_reload
     ctx.logger.info('filebeat was configured...')
+    return True
+
 
+def _configtest_command(version, executable='filebeat'):
+    # filebeat 6.0 replaced the -configtest flag with a test command.
+    if model.at_least(version, CONFIGTEST_COMMAND_VERSION):
+        return executable + ' test config -c {0}'
+    return executable + ' -c {0} -configtest'
 
-def _download_file(url, destination):
+
+def _download_file(url, destination, sha256='', package_cache=None,
+                   download_mirrors=None):
     try:
         filename = url.split('/')[-1]
     except:
         raise ValueError("wrong url provided! can't _download_file")
+    target = os.path.join(destination, filename)
+    if package_cache:
+        with metrics.phase('cache_lookup') as measured:
+            cached_file = package_cache.lookup(url, sha256)
+            measured['hit'] = bool(cached_file)
+        if cached_file:
+            ctx.logger.info('Using cached package {0}'.format(cached_file))
+        else:
+            partial = package_cache.partial_path(url)
+            _fetch(url, partial, download_mirrors, sha256)
+            try:
+                cached_file = package_cache.store_file(url, partial, sha256)
+            except cache.ChecksumMismatch as e:
+                raise exceptions.NonRecoverableError(str(e))
+        if os.path.isfile(target) and \
+                cache.file_digest(target) == os.path.basename(cached_file):
+            return filename
+        _run('sudo cp {0} {1}'.format(cached_file, target))
+        return filename
+
     temp_dir = tempfile.gettempdir()
     local_filename = os.path.join(temp_dir, filename)
-    response = requests.get(url, stream=True)
-    with open(local_filename, 'wb') as temp_file:
-        for chunk in response.iter_content(chunk_size=512):
-            if chunk:
-                temp_file.write(chunk)
-    _run('sudo mv {0} {1}'.format(local_filename, os.path.join(destination,
-                                                               filename)))
+    _fetch(url, local_filename, download_mirrors, sha256)
+    _run('sudo mv {0} {1}'.format(local_filename, target))
     return filename
 
 
-def _run(command):
-    if isinstance(command, str):
-        command = shlex.split(command)
-    stderr = subprocess.PIPE
-    stdout = subprocess.PIPE
-
-    ctx.logger.debug('Running: {0}'.format(command))
-    proc = subprocess.Popen(command, stdout=stdout, stderr=stderr)
-    proc.aggr_stdout, proc.aggr_stderr = proc.communicate()
-    if proc.returncode != 0:
-        command_str = ' '.join(command)
-        ctx.logger.error('Failed running command: {0} ({1}).'.format(
-            command_str, proc.aggr_stderr))
-        sys.exit(1)
-    return proc
+def _fetch(url, target, download_mirrors=None, sha256=''):
+    """Fetch url into target, trying the fastest mirror carrying the same
+    file first and failing over to the next source on error.
+
+    With sha256, the file of every source is checked against it, so a
+    mirror with a stale or corrupt copy is failed over as well; a
+    mismatch of url itself raises NonRecoverableError.
+    """
+    filename = url.split('/')[-1]
+    sources = []
+    index = None
+    if download_mirrors:
+        if not os.path.isdir(FILEBEAT_STATE_DIR_DEFAULT):
+            os.makedirs(FILEBEAT_STATE_DIR_DEFAULT)
+        index = mirrors.MirrorIndex(
+            os.path.join(FILEBEAT_STATE_DIR_DEFAULT, 'mirrors.json'))
+        sources = index.rank(download_mirrors, filename)
+    sources.append(None)
+    try:
+        for mirror in sources:
+            source = mirrors.artifact_url(mirror, filename) if mirror else url
+            ctx.logger.info('Fetching {0}'.format(source))
+            try:
+                with metrics.phase('fetch', source=source) as measured:
+                    if source.startswith(mirrors.FILE_SCHEME):
+                        shutil.copyfile(source[len(mirrors.FILE_SCHEME):],
+                                        target)
+                        size = os.path.getsize(target)
+                    elif source.startswith(mirrors.MANAGER_SCHEME):
+                        ctx.download_resource(
+                            source[len(mirrors.MANAGER_SCHEME):], target)
+                        size = os.path.getsize(target)
+                    else:
+                        size = download.fetch(source, target)
+                    measured['bytes'] = size
+                if sha256 and cache.file_digest(target) != sha256.lower():
+                    os.remove(target)
+                    raise cache.ChecksumMismatch(
+                        'Checksum mismatch for {0}: expected {1}'.format(
+                            source, sha256))
+                return
+            except (cache.ChecksumMismatch, IOError, OSError,
+                    exceptions.HttpException) as e:
+                if not mirror and isinstance(e, cache.ChecksumMismatch):
+                    raise exceptions.NonRecoverableError(str(e))
+                if not mirror:
+                    raise
+                ctx.logger.warn('Mirror {0} failed: {1}'.format(mirror, e))
+                index.record(mirror, filename, None)
+    finally:
+        if index:
+            index.save()
+
+
+def _parse_filebeat_version(filebeat_version):
+    """Return the filebeat_version input as a tuple, None when not given.
+
+    Raises NonRecoverableError when it is not a full version, such as
+    6.3, rather than installing the default version instead.
+    """
+    if not filebeat_version:
+        return None
+    version = versions.parse(filebeat_version)
+    if not version:
+        raise exceptions.NonRecoverableError(
+            'Error! filebeat_version should be a full version such as '
+            '6.3.2, got {0}'.format(filebeat_version))
+    return version
+
+
+def _default_download_url(install_method='package', version=None):
+    if install_method == 'tarball':
+        return tarball.download_url(version or TARBALL_VERSION_DEFAULT)
+    if _distro() in ('ubuntu', 'debian'):
+        return 'https://download.elastic.co/beats/filebeat/' + \
+            'filebeat_1.2.3_amd64.deb'
+    elif _distro() in ('centos', 'redhat'):
+        return 'https://download.elastic.co/beats/filebeat/' + \
+            'filebeat-1.2.3-x86_64.rpm'
+    return ''
+
+
+def _installed_version():
+    """Return the installed filebeat version as a tuple, or None.
+
+    The package database is asked first since it answers without starting
+    the filebeat binary.
+    """
+    if _distro() in ('ubuntu', 'debian'):
+        command = ['dpkg-query', '-W', '-f=${Status} ${Version}', 'filebeat']
+    else:
+        command = ['rpm', '-q', '--qf', 'installed %{VERSION}', 'filebeat']
+    try:
+        with open(os.devnull, 'w') as devnull:
+            output = subprocess.check_output(command, stderr=devnull)
+    except (OSError, subprocess.CalledProcessError):
+        output = b''
+    output = output.decode('utf-8', 'replace')
+    if 'installed' in output and 'not-installed' not in output:
+        version = versions.parse(output)
+        if version:
+            return version
+    return _filebeat_version()
+
+
+def _render_config(filebeat_config_file, template_variables, dest_file):
+    """Render filebeat_config_file to dest_file.
+
+    A user template also gets ctx among its variables. Without one, the
+    configuration is built from the inputs and emitted as YAML.
+    """
+    if filebeat_config_file:
+        templates_cache = os.path.join(FILEBEAT_STATE_DIR_DEFAULT,
+                                       'templates')
+        if 'ctx' in template_variables:
+            raise exceptions.NonRecoverableError(
+                'Key not allowed - a key named ctx is in template_variables')
+        template_variables = dict(template_variables, ctx=ctx)
+        try:
+            configuration = templates.from_source(
+                ctx.get_resource(filebeat_config_file), templates_cache)
+            templates.render_to_file(configuration, template_variables,
+                                     dest_file)
+        except:
+            raise ValueError(
+                "wrong inputs provided! can't redner configuration file")
+    else:
+        model.from_inputs(template_variables).dump(dest_file)
+
+
+def _sync_fragments(directory, paths, config_reload, options=None,
+                    version=None):
+    write, remove = _put_fragments(
+        directory, fragments.render(paths, config_reload, options, version))
+    ctx.logger.info('Prospector files: {0} written, {1} removed.'.format(
+        len(write), len(remove)))
+    return bool(write or remove)
+
+
+def _fragments_manifest():
+    return fragments.Manifest(
+        os.path.join(FILEBEAT_STATE_DIR_DEFAULT, FRAGMENTS_MANIFEST_FILE))
+
+
+def _put_fragments(directory, contents):
+    """Make contents, {file name: content}, the prospector files the
+    plugin keeps under directory.
+
+    Returns the fragments written and the file names removed.
+    """
+    manifest = _fragments_manifest()
+    written = manifest.written(directory)
+    write, remove = fragments.plan(directory, contents, written)
+    # Recorded before they are written, so an interrupted run can not
+    # leave files behind which would never be removed.
+    manifest.record(directory, written | set(contents))
+    if not os.path.isdir(directory):
+        _run('sudo mkdir -p {0}'.format(directory))
+    commands = []
+    for name, content in write.items():
+        with tempfile.NamedTemporaryFile('w', delete=False) as f:
+            f.write(content)
+        # As for the configuration file, see _install_root_file.
+        os.chmod(f.name, ROOT_FILE_MODE)
+        commands.append('sudo mv {0} {1}'.format(
+            f.name, os.path.join(directory, name)))
+    for name in remove:
+        commands.append('sudo rm -f {0}'.format(os.path.join(directory, name)))
+    _run_all(commands)
+    _run_all(['sudo chown root:root {0}'.format(os.path.join(directory, name))
+              for name in write])
+    manifest.record(directory, contents)
+    return write, remove
+
+
+def _backup_fragments(directory):
+    """Return {file name: content} of the prospector files the plugin
+    wrote under directory, for _put_fragments to restore.
+    """
+    backup = {}
+    for name in _fragments_manifest().written(directory):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            backup[name] = _read_privileged(path)
+    return backup
+
+
+def _read_privileged(path):
+    """Return the content of path, which may be readable by root only."""
+    if os.access(path, os.R_OK):
+        with open(path) as f:
+            return f.read()
+    result = _call_privileged('sudo cat {0}'.format(path),
+                              {'action': 'read', 'path': path})
+    if result is not None:
+        return result.aggr_stdout
+    # cp keeps the owner of the file it overwrites, created here.
+    fd, copy = tempfile.mkstemp(prefix='filebeat-')
+    os.close(fd)
+    try:
+        _run('sudo cp {0} {1}'.format(path, copy))
+        with open(copy) as f:
+            return f.read()
+    finally:
+        os.remove(copy)
+
+
+def _installed_registry():
+    """Return where the installed configuration keeps the registry."""
+    if os.path.isfile(FILEBEAT_CONFIG_FILE_DEFAULT):
+        with open(FILEBEAT_CONFIG_FILE_DEFAULT) as f:
+            configured = registry.configured_registry(f.read())
+        if configured:
+            return configured
+    return registry.REGISTRY_FILE_DEFAULT
+
+
+def _backup_registry(paths, target=None):
+    """Back the existing registry up for start to restore.
+
+    Its states are matched by inode and device to the files paths matches
+    now, so moved logs keep their offsets. Nothing is backed up when no
+    registry is found, or when it already is at target.
+    """
+    found = registry.locate(registry.REGISTRY_CANDIDATES +
+                            (_installed_registry(),))
+    if not found or found == target:
+        return None
+    try:
+        states = registry.load(_read_privileged(found))
+    except ValueError as e:
+        ctx.logger.warning('Ignoring the registry {0}: {1}'.format(found, e))
+        return None
+    states = registry.migrate(states, paths)
+    if not os.path.isdir(FILEBEAT_STATE_DIR_DEFAULT):
+        os.makedirs(FILEBEAT_STATE_DIR_DEFAULT)
+    backup_file = os.path.join(FILEBEAT_STATE_DIR_DEFAULT,
+                               REGISTRY_BACKUP_FILE)
+    with open(backup_file, 'w') as f:
+        json.dump({'source': found, 'states': states}, f)
+    ctx.logger.info('Backed up the {0} files of the registry {1}.'.format(
+        len(states), found))
+    return backup_file
+
+
+def _restore_registry():
+    """Restore a backed up registry to where the configuration keeps it.
+
+    filebeat is stopped first, so it does not overwrite the restored
+    registry; the states it wrote itself are kept. The outcome is kept in
+    the filebeat_registry runtime property.
+    """
+    backup_file = os.path.join(FILEBEAT_STATE_DIR_DEFAULT,
+                               REGISTRY_BACKUP_FILE)
+    if not os.path.isfile(backup_file):
+        return False
+    with open(backup_file) as f:
+        backup = json.load(f)
+    try:
+        _stop_service()
+    except runner.CommandFailed:
+        pass
+    target = _installed_registry()
+    current = []
+    if os.path.isfile(target):
+        current = registry.load(_read_privileged(target))
+    states = registry.merge(current, backup['states'])
+    with tempfile.NamedTemporaryFile('w', prefix='filebeat-registry-',
+                                     delete=False) as f:
+        f.write(registry.dumps(states, _filebeat_version()))
+    _run('sudo mkdir -p {0}'.format(os.path.dirname(target)))
+    _run('sudo mv {0} {1}'.format(f.name, target))
+    os.remove(backup_file)
+    _runtime_properties()[REGISTRY_PROPERTY] = {
+        'source': backup['source'], 'target': target,
+        'files': len(states)}
+    ctx.logger.info('Restored the registry {0} to {1}.'.format(
+        backup['source'], target))
+    return True
+
+
+def _check_shipping(seconds, fail):
+    """Watch the registry and filebeat's log for seconds.
+
+    The bytes shipped meanwhile, the rate, the bytes still to be shipped
+    and the errors filebeat logged are kept in the filebeat_health runtime
+    property. When nothing shipped while logs wait to be, a warning is
+    logged, or NonRecoverableError raised if fail is set.
+    """
+    report = _measure_shipping(seconds)
+    _runtime_properties()[HEALTH_PROPERTY] = report
+    if report['shipping']:
+        ctx.logger.info(
+            'filebeat shipped {0} bytes/sec, {1} bytes behind.'.format(
+                report['bytes_per_second'], report['lag_bytes']))
+        return report
+    message = ('filebeat shipped nothing in {0} seconds while {1} bytes '
+               'wait to be shipped; stalled: {2}, errors: {3}'.format(
+                   seconds, report['lag_bytes'],
+                   ', '.join(report['stalled']),
+                   ' | '.join(report['errors']) or 'none'))
+    if fail:
+        raise exceptions.NonRecoverableError(message)
+    ctx.logger.warning(message)
+    return report
+
+
+def _measure_shipping(seconds):
+    """Return what filebeat shipped and logged as errors in seconds."""
+    target = _installed_registry()
+    log_offset = None
+    if os.path.isfile(health.LOG_FILE_DEFAULT):
+        log_offset = os.path.getsize(health.LOG_FILE_DEFAULT)
+    with metrics.phase('health_check'):
+        before = _registry_states(target)
+        time.sleep(seconds)
+        after = _registry_states(target)
+    report = health.measure(before, after, seconds)
+    report['errors'] = []
+    if log_offset is not None:
+        report['errors'] = health.errors(
+            _read_log_since(health.LOG_FILE_DEFAULT, log_offset))
+    return report
+
+
+def _registry_states(path):
+    if not os.path.isfile(path):
+        return []
+    try:
+        return registry.load(_read_privileged(path))
+    except ValueError:
+        # Read while filebeat was rewriting it.
+        return []
+
+
+def _read_log_since(path, offset):
+    """Return what was appended to the log at path after offset."""
+    if os.path.getsize(path) < offset:
+        # Rotated meanwhile.
+        offset = 0
+    if os.access(path, os.R_OK):
+        with open(path) as f:
+            f.seek(offset)
+            return f.read()
+    return _run('sudo tail -c +{0} {1}'.format(offset + 1, path)).aggr_stdout
+
+
+def _restart_service():
+    if os.path.exists('/usr/bin/systemctl'):
+        return _run('sudo systemctl restart filebeat')
+    return _run('sudo service filebeat restart')
+
+
+def _stop_service():
+    if os.path.exists('/usr/bin/systemctl'):
+        _run('sudo systemctl stop filebeat')
+    else:
+        _run('sudo service filebeat stop')
+
+
+def _validate_config(path, validated, version):
+    """Check the configuration at path against its filebeat version.
+
+    Raises ValueError for settings of the wrong type; unknown settings
+    are only logged, since filebeat ignores them. Returns the key of the
+    configuration in validated, the cache of validated configurations:
+    its content digest and the version it was checked against.
+    """
+    key = '{0}-{1}'.format(cache.file_digest(path),
+                           versions.to_string(version))
+    spec = schema.for_version(version)
+    if spec is None or key in validated:
+        return key
+    import yaml
+    try:
+        with open(path) as f:
+            config = yaml.load(f, Loader=getattr(yaml, 'CSafeLoader',
+                                                 yaml.SafeLoader))
+    except yaml.YAMLError as e:
+        raise ValueError(
+            "wrong inputs prodided! configuration file is unvalid: "
+            "{0}".format(e))
+    unknown = []
+    errors = schema.validate(config, spec, unknown=unknown)
+    if errors:
+        raise ValueError(
+            "wrong inputs prodided! configuration file is unvalid: "
+            "{0}".format('; '.join(sorted(errors))))
+    if unknown:
+        ctx.logger.warning(
+            'filebeat {0} does not know these settings: {1}'.format(
+                versions.to_string(version), ', '.join(sorted(unknown))))
+    return key
+
+
+def _filebeat_version():
+    """Return the installed filebeat version as a tuple, or None.
+
+    The version is kept in the state directory with the size and the
+    modification time of the filebeat executable, so it is asked from
+    filebeat again only once the executable changed.
+    """
+    executable = which('filebeat')
+    if not executable:
+        return None
+    stat = os.stat(executable)
+    identity = [os.path.realpath(executable), stat.st_size, stat.st_mtime]
+    version_file = os.path.join(FILEBEAT_STATE_DIR_DEFAULT, VERSION_FILE)
+    try:
+        with open(version_file) as f:
+            known = json.load(f)
+        if known['identity'] == identity:
+            return tuple(known['version'])
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        pass
+    version = _ask_filebeat_version()
+    if version:
+        if not os.path.isdir(FILEBEAT_STATE_DIR_DEFAULT):
+            os.makedirs(FILEBEAT_STATE_DIR_DEFAULT)
+        with open(version_file, 'w') as f:
+            json.dump({'identity': identity, 'version': version}, f)
+    return version
+
+
+def _ask_filebeat_version():
+    for command in (['filebeat', '-version'], ['filebeat', 'version']):
+        try:
+            output = subprocess.check_output(command,
+                                             stderr=subprocess.STDOUT)
+        except (OSError, subprocess.CalledProcessError):
+            continue
+        version = versions.parse(output.decode('utf-8', 'replace'))
+        if version:
+            return version
+    return None
+
+
+def _plan_paths(paths, action):
+    """Return the planned {document_type: prospector options}.
+
+    The matched files are summarized in the filebeat_path_plan runtime
+    property. When the expected harvesters do not fit the open files limit
+    a warning is logged, or NonRecoverableError raised if action is 'fail'.
+    """
+    if action not in (True, 'warn', 'fail'):
+        raise ValueError(
+            "plan_paths should be one of: false, true, 'warn', 'fail'")
+    options, summary = planner.plan(paths)
+    limit = planner.fd_limit()
+    _runtime_properties()[PATH_PLAN_PROPERTY] = {
+        'fd_limit': limit, 'prospectors': summary, 'options': options}
+    overflow = planner.harvester_overflow(summary, limit)
+    if overflow:
+        message = ('paths would open {0} descriptors more than the open '
+                   'files limit of {1}: {2}'.format(overflow, limit, summary))
+        if action == 'fail':
+            raise exceptions.NonRecoverableError(message)
+        ctx.logger.warning(message)
+    return options
+
+
+def _tune(filebeat_config):
+    """Return filebeat_config with settings derived from the host.
+
+    The values and the reasons for them are kept in the filebeat_tuning
+    runtime property; output options given in the inputs are kept.
+    """
+    host = tuning.inspect_host(filebeat_config.get('paths'))
+    settings, rationale = tuning.derive(host, filebeat_config.get('outputs'))
+    ctx.logger.info('filebeat tuned to {0}: {1}'.format(settings, rationale))
+    _runtime_properties()[TUNING_PROPERTY] = {
+        'host': host, 'settings': settings, 'rationale': rationale}
+    return tuning.apply(filebeat_config, settings)
+
+
+def _runtime_properties():
+    if ctx.type == context.NODE_INSTANCE:
+        return ctx.instance.runtime_properties
+    return {}
+
+
+def _service_running():
+    if os.path.exists('/usr/bin/systemctl'):
+        command = ['systemctl', 'is-active', '--quiet', 'filebeat']
+    else:
+        command = ['service', 'filebeat', 'status']
+    with open(os.devnull, 'w') as devnull:
+        return subprocess.call(command, stdout=devnull, stderr=devnull) == 0
+
+
+def _run(command, timeout=runner.TIMEOUT_DEFAULT):
+    """Run command, through the privileged helper of the operation when
+    it is run with sudo.
+
+    When the helper died, the command is run with sudo -n instead, unless
+    the helper got it done before.
+    """
+    helper = privileged.current()
+    if helper and command.startswith(privileged.SUDO + ' '):
+        action = privileged.action_for(shlex.split(command)[1:])
+        result = _call_privileged(command, action, timeout)
+        if result is not None:
+            return result
+        if helper.exited:
+            if privileged.completed(action):
+                ctx.logger.debug('Done before the privileged helper '
+                                 'exited: {0}'.format(command))
+                return runner.Result(command, 0, '', '', 0)
+            # Run again without the helper; sudo must not prompt either.
+            command = ' '.join([privileged.SUDO] +
+                               list(privileged.SUDO_FLAGS)) + \
+                command[len(privileged.SUDO):]
+    try:
+        result = runner.run(command, ctx.logger, timeout)
+    except runner.CommandFailed as e:
+        metrics.command(e.command, e.duration, e.code)
+        raise
+    metrics.command(result.command, result.duration, result.returncode)
+    return result
+
+
+def _call_privileged(command, action, timeout=runner.TIMEOUT_DEFAULT):
+    """Have the privileged helper run action, standing for command.
+
+    Returns None when there is no helper to run it.
+    """
+    helper = privileged.current()
+    if not helper:
+        return None
+    return _privileged_result(
+        command, helper.call(action, timeout, _output_logger(ctx.logger)))
+
+
+def _output_logger(logger):
+    """Return a privileged output callback logging like runner.run."""
+    return lambda stream, line: logger.debug(line.rstrip())
+
+
+def _privileged_result(command, response):
+    """Return the runner.Result of a helper response, or None without one.
+
+    Raises CommandTimeout or CommandFailed as runner.run does.
+    """
+    if response is None:
+        return None
+    code = response['returncode']
+    metrics.command(command, response['seconds'], code)
+    if code == 0:
+        return runner.Result(command, code, response['stdout'],
+                             response['stderr'], response['seconds'])
+    ctx.logger.error('Failed running command: {0} ({1}).'.format(
+        command, response['stderr']))
+    error = runner.CommandTimeout if response.get('timed_out') else \
+        runner.CommandFailed
+    raise error(command, response['stderr'], response['stdout'], code,
+                response['seconds'])
+
+
+def _run_all(commands, timeout=runner.TIMEOUT_DEFAULT):
+    helper = privileged.current()
+    if helper and len(commands) > 1:
+        # The helper runs them concurrently; the operation's helper and
+        # metrics are kept per thread, so the calls are made here and the
+        # responses recorded once all are in. Like run_all, the first
+        # failure is raised at the end.
+        output = _output_logger(ctx.logger)
+
+        def call(command):
+            if not command.startswith(privileged.SUDO + ' '):
+                return None
+            return helper.call(
+                privileged.action_for(shlex.split(command)[1:]), timeout,
+                output)
+
+        pool = ThreadPool(len(commands))
+        try:
+            responses = pool.map(call, commands)
+        finally:
+            pool.close()
+            pool.join()
+        results, error = [], None
+        for command, response in zip(commands, responses):
+            try:
+                result = _privileged_result(command, response)
+                results.append(result or _run(command, timeout))
+            except runner.CommandFailed as e:
+                error = error or e
+        if error:
+            raise error
+        return results
+    if helper:
+        return [_run(command, timeout) for command in commands]
+    try:
+        results = runner.run_all(commands, ctx.logger, timeout)
+    except runner.CommandFailed as e:
+        metrics.command(e.command, e.duration, e.code)
+        raise
+    for result in results:
+        metrics.command(result.command, result.duration, result.returncode)
+    return results
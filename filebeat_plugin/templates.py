@@ -0,0 +1,82 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+import io
+import os
+import errno
+import hashlib
+
+PLUGIN_DISTRIBUTION = 'cloudify-filebeat-plugin'
+# Template output chunks joined into one write.
+STREAM_BUFFER_SIZE = 64
+
+_environment = None
+_sources = {}
+
+
+def plugin_version():
+    import pkg_resources
+    try:
+        return pkg_resources.get_distribution(PLUGIN_DISTRIBUTION).version
+    except pkg_resources.DistributionNotFound:
+        return 'dev'
+
+
+def environment(cache_dir):
+    """Return the process wide template environment.
+
+    Templates are compiled once per process and their bytecode is kept
+    under cache_dir/<plugin version>, so other processes running the same
+    plugin version skip compilation too.
+    """
+    global _environment
+    if _environment is None:
+        import jinja2
+        bytecode_cache = None
+        directory = os.path.join(cache_dir, plugin_version())
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                directory = None
+        if directory:
+            bytecode_cache = jinja2.FileSystemBytecodeCache(directory)
+        _environment = jinja2.Environment(
+            loader=jinja2.FunctionLoader(_sources.get),
+            bytecode_cache=bytecode_cache,
+            auto_reload=False)
+    return _environment
+
+
+def from_source(source, cache_dir):
+    """Return a compiled template for source, cached by its content hash."""
+    if not isinstance(source, bytes):
+        source = source.encode('utf-8')
+    key = hashlib.sha256(source).hexdigest()
+    _sources.setdefault(key, source.decode('utf-8'))
+    return environment(cache_dir).get_template(key)
+
+
+def render_to_file(template, variables, path):
+    """Render template into path as it is generated.
+
+    The output is never held as a whole, so memory does not grow with the
+    number of prospectors or output hosts rendered.
+    """
+    stream = template.stream(variables)
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+    with io.open(path, 'w', encoding='utf-8') as f:
+        for chunk in stream:
+            f.write(chunk)
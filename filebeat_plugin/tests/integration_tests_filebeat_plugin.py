@@ -26,6 +26,7 @@ from mock import patch
 
 from cloudify.mocks import MockCloudifyContext
 from .. import tasks
+from .. import runner
 
 
 distro_id = distro.id()
@@ -154,11 +155,8 @@ class TestFilebeatPlugin(unittest.TestCase):
     @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
     @patch('filebeat_plugin.tasks.FILEBEAT_PATH_DEFAULT', TEMP_FILEBEAT)
     @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext())
-    @patch('cloudify.utils.get_manager_file_server_blueprints_root_url',
-           return_value='')
-    @patch('cloudify.manager.get_resource_from_manager',
-           return_value=mock_read_file(os.path.join(
-               'filebeat_plugin', 'tests', 'example_with_inputs.yml')))
+    @patch('cloudify.mocks.MockCloudifyContext.get_resource',
+           side_effect=mock_read_file)
     def test_04_configure_with_inputs_and_file(self, *args):
         '''Validate configuration with inputs and file
          rendered correctly and placed on the right place
@@ -190,11 +188,8 @@ class TestFilebeatPlugin(unittest.TestCase):
     @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
     @patch('filebeat_plugin.tasks.FILEBEAT_PATH_DEFAULT', TEMP_FILEBEAT)
     @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext())
-    @patch('cloudify.utils.get_manager_file_server_blueprints_root_url',
-           return_value='')
-    @patch('cloudify.manager.get_resource_from_manager',
-           return_value=mock_read_file(
-               os.path.join('filebeat_plugin', 'tests', 'example.yml')))
+    @patch('cloudify.mocks.MockCloudifyContext.get_resource',
+           side_effect=mock_read_file)
     def test_05_configure_with_file_without_inputs(self, *args):
         '''Validate configuration with file without inputs
          rendered correctly and placed on the right place
@@ -225,9 +220,9 @@ class TestFilebeatPlugin(unittest.TestCase):
         config = tempfile.NamedTemporaryFile(delete=False).name
         tasks._run('sudo mv {0} /etc/filebeat/filebeat.yml'.format(config))
 
-        with self.assertRaises(SystemExit) as err:
+        with self.assertRaises(runner.CommandFailed) as err:
             tasks.start()
-        self.assertEqual(err.exception.code, 1)
+        self.assertNotEqual(err.exception.code, 0)
 
 
 class TestFilebeatInstall(unittest.TestCase):
@@ -252,11 +247,8 @@ class TestFilebeatInstall(unittest.TestCase):
     @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
     @patch('filebeat_plugin.tasks.FILEBEAT_PATH_DEFAULT', TEMP_FILEBEAT)
     @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext())
-    @patch('cloudify.utils.get_manager_file_server_blueprints_root_url',
-           return_value='')
-    @patch('cloudify.manager.get_resource_from_manager',
-           return_value=mock_read_file(
-               os.path.join('filebeat_plugin', 'tests', 'example.yml')))
+    @patch('cloudify.mocks.MockCloudifyContext.get_resource',
+           side_effect=mock_read_file)
     def test_11_install_without_inputs(self, *args):
         """
         Verify Install function without inputs - only file
@@ -288,11 +280,8 @@ class TestFilebeatInstall(unittest.TestCase):
     @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
     @patch('filebeat_plugin.tasks.FILEBEAT_PATH_DEFAULT', TEMP_FILEBEAT)
     @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext())
-    @patch('cloudify.utils.get_manager_file_server_blueprints_root_url',
-           return_value='')
-    @patch('cloudify.manager.get_resource_from_manager',
-           return_value=mock_read_file(os.path.join(
-               'filebeat_plugin', 'tests', 'example_with_inputs.yml')))
+    @patch('cloudify.mocks.MockCloudifyContext.get_resource',
+           side_effect=mock_read_file)
     def test_13_install_with_file(self, *args):
         """
         Verify Install function with file and inputs
@@ -0,0 +1,97 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import os
+import shutil
+import hashlib
+import unittest
+import tempfile
+
+from mock import patch
+
+from cloudify.mocks import MockCloudifyContext
+from .. import cache
+from .. import tasks
+
+
+URL = 'http://mirror.local/filebeat_1.2.3_amd64.deb'
+
+
+def sha(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+class TestPackageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache = cache.PackageCache(self.root, max_bytes=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def store(self, url, content, sha256=None):
+        fd, path = tempfile.mkstemp(dir=self.root)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        return self.cache.store_file(url, path, sha256)
+
+    def test_store_and_lookup(self):
+        path = self.store(URL, b'abcdef')
+        self.assertEqual(os.path.basename(path), sha(b'abcdef'))
+        self.assertEqual(self.cache.lookup(URL), path)
+        self.assertEqual(self.cache.lookup(URL, sha(b'abcdef')), path)
+
+    def test_lookup_miss(self):
+        self.assertIsNone(self.cache.lookup(URL))
+        self.store(URL, b'abc')
+        self.assertIsNone(self.cache.lookup(URL, sha(b'other')))
+
+    def test_store_checksum_mismatch(self):
+        self.assertRaises(cache.ChecksumMismatch, self.store,
+                          URL, b'abc', sha(b'other'))
+        self.assertIsNone(self.cache.lookup(URL))
+        self.assertEqual(os.listdir(self.cache.blobs_dir), [])
+
+    def test_evicts_least_recently_used(self):
+        self.store('http://a/1.deb', b'aaaa')
+        self.store('http://a/2.deb', b'bbbb')
+        self.cache.lookup('http://a/1.deb')
+        self.store('http://a/3.deb', b'cccc')
+        self.assertIsNotNone(self.cache.lookup('http://a/1.deb'))
+        self.assertIsNone(self.cache.lookup('http://a/2.deb'))
+        self.assertIsNotNone(self.cache.lookup('http://a/3.deb'))
+
+    def test_lookup_missing_blob(self):
+        path = self.store(URL, b'abc')
+        os.remove(path)
+        self.assertIsNone(self.cache.lookup(URL))
+
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext())
+    @patch('filebeat_plugin.tasks._run')
+    @patch('filebeat_plugin.tasks.download.fetch',
+           side_effect=AssertionError('network used on cache hit'))
+    def test_download_file_cache_hit(self, _, mock_run):
+        path = self.store(URL, b'abc')
+        destination = tempfile.mkdtemp()
+        try:
+            filename = tasks._download_file(URL, destination,
+                                            package_cache=self.cache)
+        finally:
+            shutil.rmtree(destination)
+        self.assertEqual(filename, 'filebeat_1.2.3_amd64.deb')
+        mock_run.assert_called_once_with('sudo cp {0} {1}'.format(
+            path, os.path.join(destination, filename)))
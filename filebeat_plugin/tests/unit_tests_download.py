@@ -0,0 +1,160 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import os
+import re
+import shutil
+import unittest
+import tempfile
+import threading
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+from mock import patch
+
+from .. import download
+
+
+CONTENT = os.urandom(3 * 1024 * 1024 + 17)
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves CONTENT with optional Range support and injected failures."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        if not self.server.head:
+            self.send_response(405)
+            self.end_headers()
+            return
+        self._respond(head=True)
+
+    def do_GET(self):
+        self._respond(head=False)
+
+    def _respond(self, head):
+        server = self.server
+        server.requests.append(self.headers.get('Range'))
+        match = re.match(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+        if match and server.ranges:
+            start, end = int(match.group(1)), int(match.group(2)) + 1
+            self.send_response(206)
+        else:
+            start, end = 0, len(CONTENT)
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start))
+        if server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', '"v1"')
+        self.end_headers()
+        if head:
+            return
+        body = CONTENT[start:end]
+        if server.drop_after is not None:
+            body = body[:server.drop_after]
+            server.drop_after = None
+        self.wfile.write(body)
+
+
+class RangeServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, ranges=True):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), RangeHandler)
+        self.ranges = ranges
+        self.drop_after = None
+        self.head = True
+        self.requests = []
+        self.url = 'http://127.0.0.1:{0}/filebeat.deb'.format(
+            self.server_address[1])
+
+
+@patch('filebeat_plugin.download.SEGMENT_MIN_SIZE', 1024 * 1024)
+class TestDownload(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.target = os.path.join(self.temp_dir, 'filebeat.deb')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _serve(self, ranges=True):
+        server = RangeServer(ranges)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def _read_target(self):
+        with open(self.target, 'rb') as f:
+            return f.read()
+
+    def test_fetch_parallel_segments(self):
+        server = self._serve()
+        size = download.fetch(server.url, self.target, segments=3)
+        self.assertEqual(size, len(CONTENT))
+        self.assertEqual(self._read_target(), CONTENT)
+        self.assertEqual(len([r for r in server.requests if r]), 3)
+        self.assertFalse(os.path.exists(
+            self.target + download.PROGRESS_SUFFIX))
+
+    def _assert_resumed_near(self, server, dropped):
+        # The chunk being read when the connection closed may be lost.
+        offset = int(re.match(r'bytes=(\d+)-', server.requests[-1]).group(1))
+        self.assertTrue(
+            dropped - download.SEGMENT_CHUNK_SIZE < offset <= dropped,
+            server.requests)
+
+    def test_fetch_resumes_after_short_read(self):
+        server = self._serve()
+        server.drop_after = 200 * 1024
+        download.fetch(server.url, self.target, segments=1)
+        self.assertEqual(self._read_target(), CONTENT)
+        self._assert_resumed_near(server, 200 * 1024)
+
+    def test_fetch_resumes_from_partial_file(self):
+        server = self._serve()
+        server.drop_after = 300 * 1024
+        self.assertRaises(download.DownloadError, download.fetch,
+                          server.url, self.target, segments=1, retries=0)
+        self.assertTrue(os.path.exists(
+            self.target + download.PROGRESS_SUFFIX))
+        download.fetch(server.url, self.target, segments=1)
+        self.assertEqual(self._read_target(), CONTENT)
+        self._assert_resumed_near(server, 300 * 1024)
+
+    def test_fetch_when_head_is_rejected(self):
+        server = self._serve()
+        server.head = False
+        self.assertEqual(download.fetch(server.url, self.target),
+                         len(CONTENT))
+        self.assertEqual(self._read_target(), CONTENT)
+
+    def test_fetch_without_range_support(self):
+        server = self._serve(ranges=False)
+        download.fetch(server.url, self.target)
+        self.assertEqual(self._read_target(), CONTENT)
+        self.assertEqual([r for r in server.requests if r], [])
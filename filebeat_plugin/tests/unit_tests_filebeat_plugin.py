@@ -24,6 +24,8 @@ from mock import patch
 
 from cloudify.mocks import MockCloudifyContext
 from .. import tasks
+from .. import runner
+from . import run_locally
 
 
 distro_id = distro.id()
@@ -101,4 +103,85 @@ class TestFilebeatPlugin(unittest.TestCase):
     @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext())
     def test_run_command_failed(self):
         self.assertRaises(OSError, tasks._run, "invalid command")
-        self.assertRaises(SystemExit, tasks._run, "mkdir /opt/test")
+        self.assertRaises(runner.CommandFailed, tasks._run, "mkdir /opt/test")
+
+
+CONFIG_FILE = os.path.join(TEMP_FILEBEAT, 'filebeat.yml')
+CONFIG_INPUTS = {
+    'inputs': {'shipper': None},
+    'outputs': {'logstash': {'hosts': ['localhost:5044']}},
+    'paths': {'syslog': ['/var/log/syslog']}
+}
+
+
+class TestFilebeatIdempotentConfigure(unittest.TestCase):
+
+    def setUp(self):
+        os.mkdir(TEMP_FILEBEAT)
+
+    def tearDown(self):
+        if os.path.exists(TEMP_FILEBEAT):
+            shutil.rmtree(TEMP_FILEBEAT)
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_FILEBEAT)
+    @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(node_id='node'))
+    @patch('filebeat_plugin.tasks._run', side_effect=run_locally)
+    def test_configure_unchanged(self, mock_run):
+        self.assertTrue(tasks.configure('', CONFIG_INPUTS))
+        self.assertFalse(
+            tasks.ctx.instance.runtime_properties['filebeat_config_unchanged'])
+        self.assertEqual(mock_run.call_count, 3)
+        self.assertIn('-configtest', mock_run.call_args_list[0][0][0])
+        self.assertEqual(mock_run.call_args_list[2][0][0],
+                         'sudo chown root:root {0}'.format(CONFIG_FILE))
+        self.assertEqual(os.stat(CONFIG_FILE).st_mode & 0o777, 0o644)
+
+        self.assertFalse(tasks.configure('', CONFIG_INPUTS))
+        self.assertTrue(
+            tasks.ctx.instance.runtime_properties['filebeat_config_unchanged'])
+        self.assertEqual(mock_run.call_count, 3)
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_FILEBEAT)
+    @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(node_id='node'))
+    @patch('filebeat_plugin.tasks._run')
+    def test_configure_retries_rejected_config(self, mock_run):
+        def reject(command):
+            if 'configtest' in command:
+                raise runner.CommandFailed(command, 'bad', '', 1, 0)
+        mock_run.side_effect = reject
+        with open(CONFIG_FILE, 'w') as f:
+            f.write('working')
+
+        self.assertRaises(ValueError, tasks.configure, '', CONFIG_INPUTS)
+        with open(CONFIG_FILE) as f:
+            self.assertEqual(f.read(), 'working')
+        self.assertRaises(ValueError, tasks.configure, '', CONFIG_INPUTS)
+        self.assertEqual(mock_run.call_count, 2)
+
+        # An installed configuration not known to pass is tested again.
+        mock_run.side_effect = run_locally
+        tasks.configure('', CONFIG_INPUTS)
+        os.remove(os.path.join(TEMP_FILEBEAT, 'validated.json'))
+        mock_run.reset_mock()
+        mock_run.side_effect = reject
+        self.assertRaises(ValueError, tasks.configure, '', CONFIG_INPUTS)
+        self.assertFalse(tasks.ctx.instance.runtime_properties.get(
+            'filebeat_config_unchanged'))
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(
+        node_id='node',
+        runtime_properties={'filebeat_config_unchanged': True}))
+    @patch('filebeat_plugin.tasks._run')
+    def test_start_skips_restart_when_unchanged(self, mock_run):
+        open(CONFIG_FILE, 'w').close()
+        with patch('filebeat_plugin.tasks._service_running',
+                   return_value=True):
+            tasks.start()
+        self.assertFalse(mock_run.called)
+        with patch('filebeat_plugin.tasks._service_running',
+                   return_value=False):
+            tasks.start()
+        self.assertEqual(mock_run.call_count, 1)
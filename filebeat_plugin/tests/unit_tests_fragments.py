@@ -0,0 +1,130 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import os
+import json
+import shutil
+import unittest
+import tempfile
+
+from mock import patch
+
+from cloudify.mocks import MockCloudifyContext
+from .. import fragments
+from .. import tasks
+from . import run_all_locally, run_locally
+
+
+TEMP_FILEBEAT = os.path.join(tempfile.gettempdir(), 'filebeat_fragments')
+CONFIG_DIR = os.path.join(TEMP_FILEBEAT, 'conf.d')
+CONFIG_FILE = os.path.join(TEMP_FILEBEAT, 'filebeat.yml')
+PATHS = {'syslog': ['/var/log/syslog'], 'nginx/access': ['/var/log/n/*.log']}
+
+
+class TestFragments(unittest.TestCase):
+
+    def setUp(self):
+        os.mkdir(TEMP_FILEBEAT)
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_FILEBEAT)
+
+    def test_supports_reload(self):
+        self.assertFalse(fragments.supports_reload(None))
+        self.assertFalse(fragments.supports_reload((1, 2, 3)))
+        self.assertTrue(fragments.supports_reload((5, 3, 0)))
+        self.assertTrue(fragments.supports_reload((6, 0, 0)))
+
+    def test_render(self):
+        rendered = fragments.render(PATHS, reload=False)
+        self.assertEqual(sorted(rendered), ['nginx_access.yml', 'syslog.yml'])
+        self.assertEqual(
+            json.loads(rendered['syslog.yml']),
+            {'filebeat': {'prospectors': [
+                {'paths': ['/var/log/syslog'], 'document_type': 'syslog'}]}})
+        rendered = fragments.render(PATHS, reload=True)
+        self.assertEqual(
+            json.loads(rendered['syslog.yml']),
+            [{'paths': ['/var/log/syslog'], 'document_type': 'syslog'}])
+        self.assertRaises(ValueError, fragments.render,
+                          {'a b': ['/a'], 'a_b': ['/b']}, reload=True)
+
+    def test_plan_only_changed(self):
+        os.mkdir(CONFIG_DIR)
+        rendered = fragments.render(PATHS, reload=False)
+        with open(os.path.join(CONFIG_DIR, 'syslog.yml'), 'w') as f:
+            f.write(rendered['syslog.yml'])
+        open(os.path.join(CONFIG_DIR, 'old.yml'), 'w').close()
+        open(os.path.join(CONFIG_DIR, 'other.yml'), 'w').close()
+        write, remove = fragments.plan(CONFIG_DIR, rendered,
+                                       ['old.yml', 'syslog.yml'])
+        self.assertEqual(list(write), ['nginx_access.yml'])
+        self.assertEqual(remove, ['old.yml'])
+
+    def test_manifest(self):
+        path = os.path.join(TEMP_FILEBEAT, 'state', 'fragments.json')
+        manifest = fragments.Manifest(path)
+        self.assertEqual(manifest.written(CONFIG_DIR), set())
+        manifest.record(CONFIG_DIR, ['syslog.yml'])
+        self.assertEqual(fragments.Manifest(path).written(CONFIG_DIR + '/'),
+                         set(['syslog.yml']))
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_FILEBEAT)
+    @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(node_id='node'))
+    @patch('filebeat_plugin.tasks._filebeat_version', return_value=(5, 6, 0))
+    @patch('filebeat_plugin.tasks._run_all', side_effect=run_all_locally)
+    @patch('filebeat_plugin.tasks._run', side_effect=run_locally)
+    def test_configure_with_reload(self, mock_run, mock_run_all, _):
+        config = {'inputs': {}, 'outputs': {}, 'paths': dict(PATHS)}
+        tasks.configure('', config, CONFIG_DIR)
+        self.assertEqual(sorted(os.listdir(CONFIG_DIR)),
+                         ['nginx_access.yml', 'syslog.yml'])
+        with open(CONFIG_FILE) as f:
+            self.assertIn('reload.enabled: true', f.read())
+
+        config['paths']['auth'] = ['/var/log/auth.log']
+        mock_run.reset_mock()
+        self.assertTrue(tasks.configure('', config, CONFIG_DIR))
+        self.assertTrue(
+            tasks.ctx.instance.runtime_properties['filebeat_config_unchanged'])
+        moved, owned = [call[0][0] for call in
+                        mock_run_all.call_args_list[-2:]]
+        self.assertEqual(len(moved), 1)
+        self.assertEqual(owned, ['sudo chown root:root {0}'.format(
+            os.path.join(CONFIG_DIR, 'auth.yml'))])
+        self.assertEqual(
+            [call[0][0].split()[:2] for call in mock_run.call_args_list],
+            [['filebeat', '-c']])
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_FILEBEAT)
+    @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(node_id='node'))
+    @patch('filebeat_plugin.tasks._filebeat_version', return_value=(1, 2, 3))
+    @patch('filebeat_plugin.tasks._run_all', side_effect=run_all_locally)
+    @patch('filebeat_plugin.tasks._run', side_effect=run_locally)
+    def test_configure_without_reload(self, mock_run, mock_run_all, _):
+        config = {'inputs': {}, 'outputs': {}, 'paths': dict(PATHS)}
+        tasks.configure('', config, CONFIG_DIR)
+        with open(CONFIG_FILE) as f:
+            self.assertIn('config_dir: {0}'.format(CONFIG_DIR), f.read())
+        open(os.path.join(CONFIG_DIR, 'other.yml'), 'w').close()
+        del config['paths']['syslog']
+        self.assertTrue(tasks.configure('', config, CONFIG_DIR))
+        self.assertFalse(
+            tasks.ctx.instance.runtime_properties['filebeat_config_unchanged'])
+        self.assertEqual(sorted(os.listdir(CONFIG_DIR)),
+                         ['nginx_access.yml', 'other.yml'])
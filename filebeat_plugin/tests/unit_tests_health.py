@@ -0,0 +1,158 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import os
+import json
+import shutil
+import unittest
+import tempfile
+
+from mock import Mock, patch
+
+from cloudify import exceptions
+from cloudify.mocks import MockCloudifyContext
+from .. import health
+from .. import tasks
+
+
+TEMP_HEALTH = os.path.join(tempfile.gettempdir(), 'filebeat_health')
+REGISTRY = os.path.join(TEMP_HEALTH, 'registry')
+LOG_FILE = os.path.join(TEMP_HEALTH, 'filebeat.log')
+CONFIG_FILE = os.path.join(TEMP_HEALTH, 'filebeat.yml')
+
+
+def log_state(name, size, offset):
+    path = os.path.join(TEMP_HEALTH, name)
+    with open(path, 'w') as f:
+        f.write('x' * size)
+    stat = os.stat(path)
+    return {'source': path, 'offset': offset,
+            'FileStateOS': {'inode': stat.st_ino, 'device': stat.st_dev}}
+
+
+def write_registry(states):
+    with open(REGISTRY, 'w') as f:
+        json.dump(states, f)
+
+
+class TestHealth(unittest.TestCase):
+
+    def setUp(self):
+        os.mkdir(TEMP_HEALTH)
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_HEALTH)
+
+    def test_measure(self):
+        shipping = log_state('shipping.log', 1000, 200)
+        stalled = log_state('stalled.log', 500, 100)
+        after = [dict(shipping, offset=900), stalled,
+                 log_state('new.log', 50, 50)]
+        report = health.measure([shipping, stalled], after, 2)
+        self.assertEqual(report['shipped_bytes'], 750)
+        self.assertEqual(report['bytes_per_second'], 375)
+        self.assertEqual(report['lag_bytes'], 500)
+        self.assertEqual(report['files'], 3)
+        self.assertEqual(report['stalled'], [stalled['source']])
+        self.assertTrue(report['shipping'])
+
+        self.assertFalse(health.measure([stalled], [stalled], 2)['shipping'])
+        done = log_state('done.log', 10, 10)
+        self.assertTrue(health.measure([done], [done], 2)['shipping'])
+
+    def test_errors(self):
+        log = ('2017-01-01T00:00:00Z INFO Harvester started\n'
+               '2017-01-01T00:00:01Z ERR Connecting error publishing '
+               'events (retrying): dial tcp 10.0.0.1:5044: '
+               'getsockopt: connection refused\n')
+        self.assertEqual(health.errors(log), [log.splitlines()[1]])
+        self.assertEqual(health.errors(None), [])
+
+    def test_regressed(self):
+        before = {'seconds': 4, 'bytes_per_second': 1000, 'lag_bytes': 0,
+                  'files': 2, 'shipping': True}
+        self.assertIsNone(health.regressed(
+            before, dict(before, bytes_per_second=600, lag_bytes=100)))
+        self.assertIsNone(health.regressed(
+            before, dict(before, bytes_per_second=10)))
+        self.assertIn('below 0.5', health.regressed(
+            before, dict(before, bytes_per_second=400, lag_bytes=100)))
+        self.assertIn('nothing shipped', health.regressed(
+            None, dict(before, shipping=False)))
+        self.assertIn('could not be verified', health.regressed(
+            before, dict(before, files=0)))
+        self.assertIsNone(health.regressed(
+            dict(before, files=0), dict(before, files=0)))
+        self.assertIsNone(health.regressed(None, dict(before, files=0)))
+
+    @patch('filebeat_plugin.health.LOG_FILE_DEFAULT', LOG_FILE)
+    @patch('filebeat_plugin.registry.REGISTRY_FILE_DEFAULT', REGISTRY)
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_HEALTH)
+    @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(node_id='node'))
+    @patch('filebeat_plugin.tasks._run', return_value=Mock(aggr_stdout=''))
+    def test_start_checks_shipping(self, *_):
+        open(CONFIG_FILE, 'w').close()
+        with open(LOG_FILE, 'w') as f:
+            f.write('ERR old error\n')
+        state = log_state('app.log', 1000, 0)
+        write_registry([state])
+
+        def ship(seconds):
+            write_registry([dict(state, offset=400)])
+            with open(LOG_FILE, 'a') as f:
+                f.write('INFO Events sent: 4\n')
+
+        with patch('filebeat_plugin.tasks.time.sleep', side_effect=ship):
+            tasks.start(health_check_seconds=4)
+        report = tasks.ctx.instance.runtime_properties['filebeat_health']
+        self.assertEqual((report['bytes_per_second'], report['lag_bytes']),
+                         (100, 600))
+        self.assertEqual(report['errors'], [])
+
+        def stall(seconds):
+            with open(LOG_FILE, 'a') as f:
+                f.write('ERR Failed to publish events: timeout\n')
+
+        with patch('filebeat_plugin.tasks.time.sleep', side_effect=stall):
+            self.assertRaises(exceptions.NonRecoverableError, tasks.start,
+                              health_check_seconds=4,
+                              fail_when_not_shipping=True)
+        report = tasks.ctx.instance.runtime_properties['filebeat_health']
+        self.assertEqual(report['errors'],
+                         ['ERR Failed to publish events: timeout'])
+
+    @patch('filebeat_plugin.health.LOG_FILE_DEFAULT', LOG_FILE)
+    @patch('filebeat_plugin.registry.REGISTRY_FILE_DEFAULT', REGISTRY)
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_HEALTH)
+    @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(
+        node_id='node',
+        runtime_properties={'filebeat_config_unchanged': True}))
+    @patch('filebeat_plugin.tasks._service_running', return_value=True)
+    @patch('filebeat_plugin.tasks._run')
+    def test_start_checks_shipping_without_restart(self, mock_run, _):
+        open(CONFIG_FILE, 'w').close()
+        open(LOG_FILE, 'w').close()
+        write_registry([log_state('app.log', 1000, 0)])
+
+        with patch('filebeat_plugin.tasks.time.sleep'):
+            self.assertRaises(exceptions.NonRecoverableError, tasks.start,
+                              health_check_seconds=4,
+                              fail_when_not_shipping=True)
+        self.assertFalse(mock_run.called)
+        report = tasks.ctx.instance.runtime_properties['filebeat_health']
+        self.assertEqual(report['lag_bytes'], 1000)
@@ -0,0 +1,115 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import os
+import shutil
+import unittest
+import tempfile
+
+from mock import patch
+
+from cloudify.mocks import MockCloudifyContext
+from .. import journal
+from .. import tasks
+
+
+TEMP_STATE = os.path.join(tempfile.gettempdir(), 'filebeat_state')
+CONFIG_FILE = os.path.join(TEMP_STATE, 'filebeat.yml')
+PACKAGE = os.path.join(TEMP_STATE, 'filebeat_1.2.3_amd64.deb')
+
+
+def write(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+class TestStepJournal(unittest.TestCase):
+
+    def setUp(self):
+        os.mkdir(TEMP_STATE)
+        self.path = os.path.join(TEMP_STATE, 'journal', 'install.json')
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_STATE)
+
+    def test_complete_and_reload(self):
+        write(PACKAGE, 'package')
+        journal.StepJournal(self.path, 'key').complete(
+            'download', PACKAGE, installation_file='a.deb')
+        steps = journal.StepJournal(self.path, 'key')
+        self.assertEqual(steps.completed('download')['installation_file'],
+                         'a.deb')
+        self.assertIsNotNone(steps.completed('download', PACKAGE))
+
+    def test_changed_output_invalidates_step(self):
+        write(PACKAGE, 'package')
+        steps = journal.StepJournal(self.path, 'key')
+        steps.complete('download', PACKAGE)
+        write(PACKAGE, 'corrupted')
+        self.assertIsNone(steps.completed('download', PACKAGE))
+        os.remove(PACKAGE)
+        self.assertIsNone(steps.completed('download', PACKAGE))
+
+    def test_changed_key_forgets_steps(self):
+        journal.StepJournal(self.path, 'key').complete('install')
+        steps = journal.StepJournal(self.path, 'other')
+        self.assertIsNone(steps.completed('install'))
+
+    def test_redone_step_forgets_later_steps(self):
+        steps = journal.StepJournal(self.path, 'key')
+        steps.complete('download')
+        steps.complete('install')
+        steps.complete('download')
+        self.assertIsNotNone(steps.completed('download'))
+        self.assertIsNone(steps.completed('install'))
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_STATE)
+    @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext())
+    @patch('filebeat_plugin.tasks.configure',
+           side_effect=lambda *args: write(CONFIG_FILE, 'config'))
+    @patch('filebeat_plugin.tasks.install_filebeat')
+    @patch('filebeat_plugin.tasks.download_filebeat')
+    @patch('filebeat_plugin.tasks._installed_version')
+    def test_install_resumes_at_failed_step(self, mock_version,
+                                            mock_download, mock_install,
+                                            mock_configure):
+        installed = []
+
+        def download(*args):
+            write(PACKAGE, 'package')
+            return os.path.basename(PACKAGE)
+        mock_download.side_effect = download
+        mock_install.side_effect = RuntimeError('dpkg lock')
+        mock_version.side_effect = lambda: (1, 2, 3) if installed else None
+        # No version in the url, so the journal decides about install.
+        url = 'http://mirror/filebeat.deb'
+
+        self.assertRaises(RuntimeError, tasks.install, {},
+                          filebeat_install_path=TEMP_STATE,
+                          download_url=url)
+        mock_install.side_effect = lambda *args: installed.append(True)
+        tasks.install({}, filebeat_install_path=TEMP_STATE, download_url=url)
+        tasks.install({}, filebeat_install_path=TEMP_STATE, download_url=url)
+        self.assertEqual(mock_download.call_count, 1)
+        self.assertEqual(mock_install.call_count, 2)
+        self.assertEqual(mock_configure.call_count, 2)
+
+        # Removed behind the plugin's back, it is installed again.
+        del installed[:]
+        tasks.install({}, filebeat_install_path=TEMP_STATE, download_url=url)
+        self.assertEqual(mock_download.call_count, 1)
+        self.assertEqual(mock_install.call_count, 3)
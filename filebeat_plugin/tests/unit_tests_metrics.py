@@ -0,0 +1,107 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import os
+import json
+import shutil
+import unittest
+import tempfile
+
+from mock import patch
+
+from cloudify.mocks import MockCloudifyContext
+from .. import metrics
+from .. import runner
+from .. import tasks
+from . import run_locally
+
+
+TEMP_METRICS = os.path.join(tempfile.gettempdir(), 'filebeat_metrics')
+CONFIG_FILE = os.path.join(TEMP_METRICS, 'filebeat.yml')
+CONFIG_INPUTS = {
+    'inputs': {'shipper': None},
+    'outputs': {'logstash': {'hosts': ['localhost:5044']}},
+    'paths': {'syslog': ['/var/log/syslog']}
+}
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        os.mkdir(TEMP_METRICS)
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_METRICS)
+
+    def test_recorder(self):
+        with metrics.operation('install') as recorder:
+            with metrics.phase('fetch', source='http://a') as measured:
+                measured['bytes'] = 1000
+            with metrics.operation('configure') as nested:
+                self.assertIsNone(nested)
+                metrics.command('filebeat -c x -configtest', 0.5, 0)
+            try:
+                with metrics.phase('restart'):
+                    raise ValueError()
+            except ValueError:
+                pass
+        self.assertIsNone(metrics.current())
+
+        summary = recorder.summary(True)
+        self.assertEqual([(phase['name'], phase['ok'])
+                          for phase in summary['phases']],
+                         [('fetch', True), ('configure', True),
+                          ('restart', False)])
+        fetch = summary['phases'][0]
+        self.assertEqual(fetch['source'], 'http://a')
+        self.assertIn('bytes_per_second', fetch)
+        self.assertEqual(summary['commands'], [{
+            'command': 'filebeat -c x -configtest', 'seconds': 0.5,
+            'returncode': 0}])
+        event = metrics.event(summary)
+        self.assertTrue(event.startswith(metrics.EVENT_PREFIX))
+        self.assertEqual(json.loads(event[len(metrics.EVENT_PREFIX):]),
+                         json.loads(json.dumps(summary)))
+
+    def test_no_operation(self):
+        with metrics.phase('fetch') as measured:
+            measured['bytes'] = 1
+        metrics.command('true', 0.1, 0)
+        self.assertIsNone(metrics.current())
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_METRICS)
+    @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(node_id='node'))
+    @patch('filebeat_plugin.tasks.runner.run')
+    def test_configure_metrics(self, mock_run):
+        def run(command, logger, timeout):
+            if 'configtest' in command:
+                raise runner.CommandFailed(command, 'bad', '', 1, 0.25)
+            run_locally(command)
+            return runner.Result(command, 0, '', '', 0.125)
+        mock_run.side_effect = run
+
+        self.assertRaises(ValueError, tasks.configure, '', CONFIG_INPUTS)
+        summary = tasks.ctx.instance.runtime_properties[
+            'filebeat_metrics']['configure']
+        self.assertFalse(summary['ok'])
+        self.assertEqual([phase['name'] for phase in summary['phases']],
+                         ['render', 'validate', 'configtest'])
+        self.assertTrue(summary['phases'][0]['bytes'] > 0)
+        self.assertEqual(
+            [(command['seconds'], command['returncode'])
+             for command in summary['commands']],
+            [(0.25, 1)])
@@ -0,0 +1,127 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import os
+import shutil
+import unittest
+import tempfile
+
+from mock import patch
+
+from cloudify import exceptions
+from cloudify.mocks import MockCloudifyContext
+from .. import cache
+from .. import mirrors
+from .. import tasks
+
+
+TEMP_MIRRORS = os.path.join(tempfile.gettempdir(), 'filebeat_mirrors')
+FILENAME = 'filebeat_1.2.3_amd64.deb'
+URL = 'https://download.elastic.co/beats/filebeat/' + FILENAME
+
+
+class TestMirrors(unittest.TestCase):
+
+    def setUp(self):
+        self.full = os.path.join(TEMP_MIRRORS, 'full')
+        self.empty = os.path.join(TEMP_MIRRORS, 'empty')
+        os.makedirs(self.full)
+        os.makedirs(self.empty)
+        with open(os.path.join(self.full, FILENAME), 'w') as f:
+            f.write('package')
+        self.index_path = os.path.join(TEMP_MIRRORS, 'mirrors.json')
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_MIRRORS)
+
+    def test_probe_file_mirror(self):
+        self.assertEqual(mirrors.probe('file://' + self.full, FILENAME), 0.0)
+        self.assertIsNone(mirrors.probe('file://' + self.empty, FILENAME))
+
+    def test_rank_by_latency(self):
+        latencies = {'http://slow': 0.5, 'http://fast': 0.1,
+                     'http://down': None}
+        with patch('filebeat_plugin.mirrors.probe',
+                   side_effect=lambda mirror, *args: latencies[mirror]):
+            index = mirrors.MirrorIndex(self.index_path)
+            ranked = index.rank(sorted(latencies), FILENAME)
+        self.assertEqual(ranked, ['http://fast', 'http://slow'])
+
+    def test_rank_uses_saved_index(self):
+        index = mirrors.MirrorIndex(self.index_path)
+        index.rank(['file://' + self.full], FILENAME)
+        index.save()
+        with patch('filebeat_plugin.mirrors.probe') as mock_probe:
+            ranked = mirrors.MirrorIndex(self.index_path).rank(
+                ['file://' + self.full], FILENAME)
+        self.assertFalse(mock_probe.called)
+        self.assertEqual(ranked, ['file://' + self.full])
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_MIRRORS)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext())
+    @patch('filebeat_plugin.tasks.download.fetch')
+    def test_fetch_prefers_local_mirror(self, mock_fetch):
+        target = os.path.join(TEMP_MIRRORS, 'target')
+        tasks._fetch(URL, target, ['file://' + self.empty,
+                                   'file://' + self.full])
+        self.assertFalse(mock_fetch.called)
+        with open(target) as f:
+            self.assertEqual(f.read(), 'package')
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_MIRRORS)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext())
+    @patch('filebeat_plugin.tasks.download.fetch')
+    def test_fetch_fails_over(self, mock_fetch):
+        target = os.path.join(TEMP_MIRRORS, 'target')
+        index = mirrors.MirrorIndex(self.index_path)
+        index.record('http://stale', FILENAME, 0.01)
+        index.save()
+        mock_fetch.side_effect = [IOError('connection refused'), None]
+        tasks._fetch(URL, target, ['http://stale'])
+        self.assertEqual(
+            [call[0][0] for call in mock_fetch.call_args_list],
+            ['http://stale/' + FILENAME, URL])
+        self.assertEqual(
+            mirrors.MirrorIndex(self.index_path).lookup(
+                'http://stale', FILENAME), (True, None))
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_MIRRORS)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext())
+    @patch('filebeat_plugin.tasks.download.fetch')
+    def test_fetch_fails_over_on_checksum_mismatch(self, mock_fetch):
+        target = os.path.join(TEMP_MIRRORS, 'target')
+
+        def fetch(source, path):
+            with open(path, 'w') as f:
+                f.write('package' if source == URL else 'stale')
+        mock_fetch.side_effect = fetch
+        index = mirrors.MirrorIndex(self.index_path)
+        index.record('http://corrupt', FILENAME, 0.01)
+        index.save()
+        tasks._fetch(URL, target, ['http://corrupt'],
+                     cache.file_digest(os.path.join(self.full, FILENAME)))
+        self.assertEqual(
+            [call[0][0] for call in mock_fetch.call_args_list],
+            ['http://corrupt/' + FILENAME, URL])
+        with open(target) as f:
+            self.assertEqual(f.read(), 'package')
+        self.assertEqual(
+            mirrors.MirrorIndex(self.index_path).lookup(
+                'http://corrupt', FILENAME), (True, None))
+
+        self.assertRaises(exceptions.NonRecoverableError, tasks._fetch,
+                          URL, target, None, 'ff' * 32)
+        self.assertFalse(os.path.exists(target))
@@ -0,0 +1,165 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import os
+import unittest
+import tempfile
+
+import yaml
+
+from .. import model
+
+
+CONFIG_INPUTS = {
+    'inputs': {'shipper': None, 'logging': {'level': 'info'}},
+    'outputs': {'logstash': {'hosts': ['localhost:5044'],
+                             'loadbalance': True,
+                             'ssl': {'certificate_authorities': ['/ca.pem']}}},
+    'paths': {'syslog': ['/var/log/syslog'],
+              'nginx': ['/var/log/nginx/*.log']}
+}
+
+
+class TestModel(unittest.TestCase):
+
+    def test_emits_nested_options(self):
+        config = model.from_inputs(CONFIG_INPUTS)
+        self.assertEqual(yaml.safe_load(config.dumps()), {
+            'filebeat': {'prospectors': [
+                {'document_type': 'nginx',
+                 'paths': ['/var/log/nginx/*.log']},
+                {'document_type': 'syslog', 'paths': ['/var/log/syslog']}]},
+            'output': {'logstash': {
+                'hosts': ['localhost:5044'], 'loadbalance': True,
+                'ssl': {'certificate_authorities': ['/ca.pem']}}},
+            'logging': {'level': 'info'}})
+
+    def test_scalars_round_trip(self):
+        values = ['h:1', '1:20', '5s', '1.0', 'yes', 'Off', 'null', '',
+                  '0x1f', '1e5', '2016-01-01', 'a b', '*.log', 'C:\\logs',
+                  u'caf\u00e9', 1, 1.5, True, None, [], {}, [[1, 'a']]]
+        config = model.from_inputs({'outputs': {'o': {'v': values}}})
+        self.assertEqual(
+            yaml.safe_load(config.dumps())['output']['o']['v'], values)
+
+    def test_output_is_byte_stable(self):
+        config = model.from_inputs(CONFIG_INPUTS)
+        reordered = dict(reversed(list(CONFIG_INPUTS.items())))
+        reordered['paths'] = dict(reversed(list(
+            CONFIG_INPUTS['paths'].items())))
+        self.assertEqual(config.dumps(),
+                         model.from_inputs(reordered).dumps())
+
+    def test_dump(self):
+        config = model.from_inputs(CONFIG_INPUTS)
+        path = tempfile.mktemp()
+        try:
+            config.dump(path)
+            with open(path) as f:
+                self.assertEqual(f.read(), config.dumps())
+        finally:
+            os.remove(path)
+
+    def test_configure_variables(self):
+        config = model.from_inputs(dict(
+            CONFIG_INPUTS,
+            prospector_options={'syslog': {'ignore_older': '1h'}},
+            tuning={'spool_size': 2048},
+            registry_file='/var/lib/filebeat/registry'))
+        filebeat = yaml.safe_load(config.dumps())['filebeat']
+        self.assertEqual(filebeat['spool_size'], 2048)
+        self.assertEqual(filebeat['registry_file'],
+                         '/var/lib/filebeat/registry')
+        self.assertEqual(filebeat['prospectors'][1]['ignore_older'], '1h')
+
+        filebeat = model.from_inputs(dict(
+            CONFIG_INPUTS, config_dir='/etc/filebeat/conf.d',
+            config_reload=True)).to_dict()['filebeat']
+        self.assertEqual(filebeat['prospectors'], [])
+        self.assertEqual(filebeat['config']['prospectors']['path'],
+                         '/etc/filebeat/conf.d/*.yml')
+
+    def test_versioned_layout(self):
+        inputs = dict(CONFIG_INPUTS,
+                      inputs={'shipper': {'name': 'web1'}},
+                      tuning={'spool_size': 2048, 'idle_timeout': '1s'},
+                      outputs={'logstash': {'hosts': ['a:5044', 'b:5044'],
+                                            'pipelining': 2}})
+
+        config = yaml.safe_load(model.from_inputs(
+            dict(inputs, filebeat_version=[1, 2, 3])).dumps())
+        self.assertEqual(config['shipper'], {'name': 'web1'})
+        self.assertEqual(config['filebeat']['spool_size'], 2048)
+        self.assertEqual(config['filebeat']['prospectors'][0],
+                         {'document_type': 'nginx',
+                          'paths': ['/var/log/nginx/*.log']})
+        self.assertEqual(config['output']['logstash'],
+                         {'hosts': ['a:5044', 'b:5044'], 'loadbalance': True})
+        config = yaml.safe_load(model.from_inputs(inputs).dumps())
+        self.assertEqual(config['output']['logstash'],
+                         {'hosts': ['a:5044', 'b:5044'], 'loadbalance': True})
+
+        config = yaml.safe_load(model.from_inputs(
+            dict(inputs, filebeat_version=(6, 8, 0))).dumps())
+        self.assertEqual(config['name'], 'web1')
+        self.assertNotIn('shipper', config)
+        self.assertNotIn('prospectors', config['filebeat'])
+        self.assertEqual(config['filebeat']['inputs'][0],
+                         {'type': 'log', 'paths': ['/var/log/nginx/*.log'],
+                          'fields': {'document_type': 'nginx'}})
+        self.assertEqual(config['queue'], {'mem': {
+            'events': 4096, 'flush': {'min_events': 2048, 'timeout': '1s'}}})
+        self.assertNotIn('spool_size', config['filebeat'])
+        self.assertEqual(config['output']['logstash']['pipelining'], 2)
+
+        config = model.from_inputs(dict(
+            inputs, filebeat_version=(6, 2, 0), config_dir='/etc/fb',
+            config_reload=True,
+            prospector_options={'syslog': {'fields': {'env': 'prod'}}},
+            inputs={'queue': {'spool': {'file': {'path': '/q'}}}})).to_dict()
+        self.assertEqual(config['queue'], {'spool': {'file': {'path': '/q'}}})
+        self.assertIn('prospectors', config['filebeat']['config'])
+        self.assertEqual(model.Prospector(
+            'syslog', ['/s'], {'fields': {'env': 'prod'}}, (6, 0)).to_dict(),
+            {'type': 'log', 'paths': ['/s'],
+             'fields': {'env': 'prod', 'document_type': 'syslog'}})
+
+    def test_close_options_follow_the_version(self):
+        options = {'close_older': '5m', 'force_close_files': True}
+        self.assertEqual(model.Prospector(
+            'syslog', ['/s'], options, (1, 3)).to_dict(),
+            {'document_type': 'syslog', 'paths': ['/s'],
+             'close_older': '5m', 'force_close_files': True})
+        self.assertEqual(model.Prospector(
+            'syslog', ['/s'], options, (5, 6)).to_dict(),
+            {'document_type': 'syslog', 'paths': ['/s'],
+             'close_inactive': '5m', 'close_renamed': True,
+             'close_removed': True})
+        prospector = model.Prospector(
+            'syslog', ['/s'], dict(options, close_inactive='1m'),
+            (6, 8)).to_dict()
+        self.assertEqual(prospector['close_inactive'], '1m')
+        self.assertNotIn('close_older', prospector)
+        self.assertNotIn('force_close_files', prospector)
+
+    def test_wrong_inputs(self):
+        for inputs in ({'paths': ['/var/log/syslog']},
+                       {'paths': {'syslog': '/var/log/syslog'}},
+                       {'outputs': {'logstash': ['localhost:5044']}},
+                       {'inputs': {'output': {'file': {}}}},
+                       {'outputs': {'o': {'v': object()}}}):
+            self.assertRaises(ValueError,
+                              lambda: model.from_inputs(inputs).dumps())
@@ -0,0 +1,115 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import os
+import shutil
+import unittest
+import tempfile
+
+from mock import patch
+
+from cloudify import exceptions
+from cloudify.mocks import MockCloudifyContext
+from .. import planner
+from .. import tasks
+from . import run_locally
+
+
+TEMP_PLANNER = os.path.join(tempfile.gettempdir(), 'filebeat_planner')
+CONFIG_FILE = os.path.join(TEMP_PLANNER, 'filebeat.yml')
+NOW = 1500000000
+
+
+def touch(name, age, size=10):
+    path = os.path.join(TEMP_PLANNER, name)
+    with open(path, 'w') as f:
+        f.write('x' * size)
+    os.utime(path, (NOW - age, NOW - age))
+    return path
+
+
+class TestPlanner(unittest.TestCase):
+
+    def setUp(self):
+        os.mkdir(TEMP_PLANNER)
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_PLANNER)
+
+    def test_expand_indexes_each_file_once(self):
+        touch('a.log', 0)
+        touch('b.log', 0, size=5)
+        index = planner.expand({'app': [os.path.join(TEMP_PLANNER, '*.log'),
+                                        os.path.join(TEMP_PLANNER, 'a.*')],
+                                'none': ['/nonexistent/*.log']})
+        self.assertEqual([entry.size for entry in index['app']], [10, 5])
+        self.assertEqual(index['none'], [])
+
+    def test_duration(self):
+        self.assertEqual(planner.duration(7200), '2h')
+        self.assertEqual(planner.duration(300), '5m')
+        self.assertEqual(planner.duration(90), '90s')
+
+    def test_prospector_options(self):
+        entries = [planner.FileEntry('a', 1, NOW - 60),
+                   planner.FileEntry('b', 1, NOW - 600),
+                   planner.FileEntry('c', 1, NOW - 3 * 3600),
+                   planner.FileEntry('d', 1, NOW - 30 * 86400)]
+        options, harvesters = planner.prospector_options(entries, NOW)
+        self.assertEqual(options, {'ignore_older': '6h',
+                                   'close_older': '20m',
+                                   'scan_frequency': '10s'})
+        self.assertEqual(harvesters, 3)
+
+    def test_prospector_options_without_active_files(self):
+        options, harvesters = planner.prospector_options(
+            [planner.FileEntry('a', 1, NOW - 30 * 86400)] * 500, NOW)
+        self.assertEqual(options, {'ignore_older': '24h',
+                                   'close_older': '5m',
+                                   'scan_frequency': '15s'})
+        self.assertEqual(harvesters, 0)
+
+    def test_harvester_overflow(self):
+        summary = {'app': {'harvesters': 1000}}
+        self.assertEqual(planner.harvester_overflow(summary, 1024), 40)
+        self.assertEqual(planner.harvester_overflow(summary, 4096), 0)
+        self.assertEqual(planner.harvester_overflow(summary, None), 0)
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_PLANNER)
+    @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(node_id='node'))
+    @patch('filebeat_plugin.tasks._run', side_effect=run_locally)
+    def test_configure_plan_paths(self, mock_run):
+        touch('a.log', 0)
+        config = {'inputs': {'shipper': None},
+                  'outputs': {'logstash': {'hosts': ['a:5044']}},
+                  'paths': {'app': [os.path.join(TEMP_PLANNER, '*.log')]}}
+
+        with patch('filebeat_plugin.planner.time.time', return_value=NOW):
+            tasks.configure('', config, plan_paths=True)
+        with open(CONFIG_FILE) as f:
+            rendered = f.read()
+        self.assertIn('ignore_older: 1h', rendered)
+        self.assertIn('close_older: 5m', rendered)
+        self.assertIn('scan_frequency: 10s', rendered)
+        plan = tasks.ctx.instance.runtime_properties['filebeat_path_plan']
+        self.assertEqual(plan['prospectors']['app']['harvesters'], 1)
+
+        with patch('filebeat_plugin.planner.fd_limit', return_value=10):
+            self.assertRaises(exceptions.NonRecoverableError,
+                              tasks.configure, '', config, plan_paths='fail')
+            self.assertRaises(ValueError,
+                              tasks.configure, '', config, plan_paths='x')
@@ -0,0 +1,195 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import os
+import json
+import time
+import shutil
+import unittest
+import tempfile
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from mock import Mock, patch
+
+from cloudify.mocks import MockCloudifyContext
+from .. import metrics
+from .. import privileged
+from .. import runner
+from .. import tasks
+
+
+TEMP_PRIVILEGED = os.path.join(tempfile.gettempdir(), 'filebeat_privileged')
+
+
+def temp(*names):
+    return os.path.join(TEMP_PRIVILEGED, *names)
+
+
+class TestPrivileged(unittest.TestCase):
+
+    def setUp(self):
+        os.mkdir(TEMP_PRIVILEGED)
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_PRIVILEGED)
+
+    def test_action_for(self):
+        self.assertEqual(privileged.action_for(['mv', '-T', 'a', 'b']), {
+            'action': 'move', 'source': 'a', 'target': 'b', 'into': False})
+        self.assertEqual(privileged.action_for(['mkdir', '-p', 'a', 'b']),
+                         {'action': 'mkdir', 'paths': ['a', 'b']})
+        self.assertEqual(privileged.action_for(['rm', '-f', 'a']), {
+            'action': 'remove', 'paths': ['a'], 'recursive': False})
+        self.assertEqual(privileged.action_for(['ln', '-sfn', 'a', 'b']),
+                         {'action': 'symlink', 'source': 'a', 'link': 'b'})
+        for argv in (['dpkg', '-i', 'a.deb'], ['chmod', 'u+x', 'a'],
+                     ['mv', '-f', 'a', 'b'], ['systemctl', 'restart', 'a']):
+            self.assertEqual(privileged.action_for(argv),
+                             {'action': 'exec', 'argv': argv})
+
+    def test_handle(self):
+        def handle(command):
+            return privileged.handle(privileged.action_for(command.split()))
+
+        self.assertEqual(handle('mkdir -p {0}'.format(temp('a', 'b')))[
+            'returncode'], 0)
+        with open(temp('file'), 'w') as f:
+            f.write('content')
+        handle('mv {0} {1}'.format(temp('file'), temp('a')))
+        handle('ln -sfn {0} {1}'.format(temp('a'), temp('link')))
+        handle('ln -sfn {0} {1}'.format(temp('a', 'b'), temp('link')))
+        self.assertEqual(os.readlink(temp('link')), temp('a', 'b'))
+        handle('chmod 600 {0}'.format(temp('a', 'file')))
+        self.assertEqual(os.stat(temp('a', 'file')).st_mode & 0o777, 0o600)
+        self.assertEqual(handle('cat {0}'.format(temp('a', 'file')))[
+            'stdout'], 'content')
+        self.assertEqual(privileged.handle(
+            {'action': 'read', 'path': temp('a', 'file')})['stdout'],
+            'content')
+
+        failed = handle('rm -f {0}'.format(temp('a')))
+        self.assertNotEqual(failed['returncode'], 0)
+        self.assertIn('Is a directory', failed['stderr'])
+        self.assertEqual(handle('rm -rf {0}'.format(temp('a')))[
+            'returncode'], 0)
+        self.assertFalse(os.path.exists(temp('a')))
+        self.assertEqual(handle('false')['returncode'], 1)
+        self.assertTrue(privileged.handle(
+            {'action': 'exec', 'argv': ['sleep', '5'],
+             'timeout': 0.1})['timed_out'])
+
+        lines = []
+        response = privileged.handle(
+            {'action': 'exec', 'argv': ['sh', '-c', 'echo one; echo two >&2']},
+            lambda stream, line: lines.append((stream, line)))
+        self.assertEqual(sorted(lines),
+                         [('stderr', 'two\n'), ('stdout', 'one\n')])
+        self.assertEqual(response['stdout'], 'one\n')
+
+    def test_serve(self):
+        requests = StringIO('{0}\n{1}\n'.format(
+            json.dumps({'action': 'mkdir', 'paths': [temp('a')]}),
+            json.dumps({'action': 'exec', 'argv': ['true']})))
+        responses = StringIO()
+        privileged.serve(requests, responses)
+        lines = [json.loads(line)
+                 for line in responses.getvalue().splitlines()]
+        self.assertEqual(lines[0], privileged.READY)
+        self.assertEqual(sorted(line['returncode'] for line in lines[1:]),
+                         [0, 0])
+        self.assertTrue(os.path.isdir(temp('a')))
+
+    @patch('filebeat_plugin.privileged.SUDO', 'env')
+    @patch('filebeat_plugin.privileged.SUDO_FLAGS', ())
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(node_id='node'))
+    @patch('filebeat_plugin.tasks.runner.run')
+    def test_session(self, mock_run):
+        with metrics.operation('install') as recorder:
+            with privileged.session(Mock()) as helper:
+                tasks._run_all(['env mkdir -p {0}'.format(temp('a')),
+                                'env touch {0}'.format(temp('a', 'b'))])
+                tasks._run('env mv {0} {1}'.format(temp('a', 'b'),
+                                                   temp('c')))
+                self.assertRaises(runner.CommandFailed, tasks._run,
+                                  'env rm -f {0}'.format(temp('a')))
+                pid = helper.proc.pid
+            self.assertIsNone(privileged.current())
+        self.assertFalse(mock_run.called)
+        self.assertTrue(os.path.isfile(temp('c')))
+        self.assertRaises(OSError, os.kill, pid, 0)
+        self.assertEqual(
+            [command['returncode'] != 0
+             for command in recorder.summary(True)['commands']],
+            [False, False, False, True])
+
+    @patch('filebeat_plugin.privileged.SUDO', 'env')
+    @patch('filebeat_plugin.privileged.SUDO_FLAGS', ())
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(node_id='node'))
+    def test_session_streams_concurrently(self):
+        with privileged.session(Mock()) as helper:
+            lines = []
+            response = helper.call(
+                {'action': 'exec', 'argv': ['sh', '-c', 'echo a; echo b']},
+                output=lambda stream, line: lines.append(line))
+            self.assertEqual(lines, ['a\n', 'b\n'])
+            self.assertEqual(response['returncode'], 0)
+
+            started = time.time()
+            tasks._run_all(['env sleep 1', 'env sleep 1', 'env sleep 1'])
+            self.assertLess(time.time() - started, 2.5)
+
+    @patch('filebeat_plugin.privileged.SUDO', 'env')
+    @patch('filebeat_plugin.privileged.SUDO_FLAGS', ())
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(node_id='node'))
+    def test_helper_killed(self):
+        for name in ('a', 'b'):
+            open(temp(name), 'w').close()
+        with privileged.session(Mock()) as helper:
+            tasks._run('env mv {0} {1}'.format(temp('a'), temp('c')))
+            helper.proc.kill()
+            helper.reader.join()
+            self.assertIsNone(helper.call({'action': 'exec',
+                                           'argv': ['true']}))
+            # Run without the helper, or not again when it was done.
+            tasks._run('env mv {0} {1}'.format(temp('b'), temp('d')))
+            tasks._run('env mv {0} {1}'.format(temp('a'), temp('c')))
+        self.assertEqual(sorted(os.listdir(TEMP_PRIVILEGED)), ['c', 'd'])
+
+    def test_completed(self):
+        move = privileged.action_for(['mv', temp('a'), temp('b')])
+        self.assertFalse(privileged.completed(move))
+        open(temp('b'), 'w').close()
+        self.assertTrue(privileged.completed(move))
+        open(temp('a'), 'w').close()
+        self.assertFalse(privileged.completed(move))
+        self.assertFalse(privileged.completed(
+            privileged.action_for(['rm', '-f', temp('a')])))
+
+    @patch('filebeat_plugin.privileged.SUDO', 'false')
+    def test_helper_not_started(self):
+        helper = privileged.Helper(Mock())
+        self.assertIsNone(helper.call({'action': 'exec', 'argv': ['true']}))
+        self.assertTrue(helper.failed)
+
+    @patch('filebeat_plugin.privileged.subprocess.Popen',
+           side_effect=OSError('sudo: a password is required'))
+    def test_helper_never_prompts(self, mock_popen):
+        helper = privileged.Helper(Mock())
+        self.assertIsNone(helper.call({'action': 'exec', 'argv': ['true']}))
+        self.assertEqual(mock_popen.call_args[0][0][:2], ['sudo', '-n'])
@@ -0,0 +1,179 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import os
+import json
+import shutil
+import unittest
+import tempfile
+
+from mock import patch
+
+from cloudify.mocks import MockCloudifyContext
+from .. import registry
+from .. import tasks
+from . import run_locally
+
+
+TEMP_REGISTRY = os.path.join(tempfile.gettempdir(), 'filebeat_registry')
+OLD_REGISTRY = os.path.join(TEMP_REGISTRY, '.filebeat')
+NEW_REGISTRY = os.path.join(TEMP_REGISTRY, 'data', 'registry')
+CONFIG_FILE = os.path.join(TEMP_REGISTRY, 'filebeat.yml')
+
+
+def log_file(name, size):
+    path = os.path.join(TEMP_REGISTRY, name)
+    with open(path, 'w') as f:
+        f.write('x' * size)
+    stat = os.stat(path)
+    return path, {'inode': stat.st_ino, 'device': stat.st_dev}
+
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        os.mkdir(TEMP_REGISTRY)
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_REGISTRY)
+
+    def test_load_and_dump(self):
+        file_state = {'inode': 1, 'device': 2}
+        old = json.dumps({'/var/log/a.log': {
+            'source': '/var/log/a.log', 'offset': 10,
+            'FileStateOS': file_state}})
+        states = registry.load(old)
+        self.assertEqual(states, [{'source': '/var/log/a.log', 'offset': 10,
+                                   'FileStateOS': file_state}])
+        self.assertEqual(json.loads(registry.dumps(states, (1, 2, 3))),
+                         json.loads(old))
+        new = json.loads(registry.dumps(states, (6, 8, 0)))
+        self.assertEqual(new[0]['type'], 'log')
+        self.assertEqual(new[0]['ttl'], -1)
+        self.assertEqual(registry.load(json.dumps(new)), new)
+        self.assertEqual(registry.load(''), [])
+        self.assertRaises(ValueError, registry.load, '"registry"')
+
+    def test_configured_registry(self):
+        self.assertEqual(registry.configured_registry(
+            'filebeat:\n  registry_file: "/var/lib/fb/registry"\n'),
+            '/var/lib/fb/registry')
+        self.assertEqual(registry.configured_registry(
+            'filebeat.registry_file: /r # moved\n'), '/r')
+        self.assertIsNone(registry.configured_registry(
+            'filebeat:\n  #registry_file: .filebeat\n'))
+
+    def test_migrate_moved_files(self):
+        path, file_state = log_file('moved.log', 100)
+        _, truncated = log_file('truncated.log', 5)
+        states = [{'source': '/old/app.log', 'offset': 60,
+                   'FileStateOS': file_state},
+                  {'source': '/old/truncated.log', 'offset': 60,
+                   'FileStateOS': truncated},
+                  {'source': '/gone.log', 'offset': 7,
+                   'FileStateOS': {'inode': 0, 'device': 0}}]
+        migrated = registry.migrate(
+            states, {'app': [os.path.join(TEMP_REGISTRY, '*.log')]})
+        self.assertEqual([(state['source'], state['offset'])
+                          for state in migrated],
+                         [(path, 60),
+                          (os.path.join(TEMP_REGISTRY, 'truncated.log'), 0),
+                          ('/gone.log', 7)])
+
+    def test_merge_keeps_current_states(self):
+        current = [{'source': 'a', 'offset': 50,
+                    'FileStateOS': {'inode': 1, 'device': 1}}]
+        restored = [{'source': 'a', 'offset': 10,
+                     'FileStateOS': {'inode': 1, 'device': 1}},
+                    {'source': 'b', 'offset': 10,
+                     'FileStateOS': {'inode': 2, 'device': 1}}]
+        self.assertEqual([state['offset'] for state in
+                          registry.merge(current, restored)], [50, 10])
+
+    @patch('filebeat_plugin.registry.REGISTRY_CANDIDATES', (OLD_REGISTRY,))
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_REGISTRY)
+    @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(node_id='node'))
+    @patch('filebeat_plugin.tasks._filebeat_version', return_value=(5, 6, 0))
+    @patch('filebeat_plugin.tasks._service_running', return_value=True)
+    @patch('filebeat_plugin.tasks._run', side_effect=run_locally)
+    def test_upgrade_restores_registry(self, mock_run, *_):
+        path, file_state = log_file('app.log', 100)
+        with open(OLD_REGISTRY, 'w') as f:
+            json.dump({'/old/app.log': {'source': '/old/app.log',
+                                        'offset': 80,
+                                        'FileStateOS': file_state}}, f)
+        tasks._backup_registry({'app': [path]})
+        os.remove(OLD_REGISTRY)
+        with open(CONFIG_FILE, 'w') as f:
+            f.write('filebeat:\n  registry_file: {0}\n'.format(NEW_REGISTRY))
+
+        tasks.start()
+        with open(NEW_REGISTRY) as f:
+            states = json.load(f)
+        self.assertEqual([(state['source'], state['offset'])
+                          for state in states], [(path, 80)])
+        commands = [call[0][0] for call in mock_run.call_args_list
+                    if 'filebeat' in call[0][0].split()[-2:]]
+        self.assertEqual([command.split()[2] if 'systemctl' in command
+                          else command.split()[-1] for command in commands],
+                         ['stop', 'restart'])
+        self.assertEqual(
+            tasks.ctx.instance.runtime_properties['filebeat_registry'],
+            {'source': OLD_REGISTRY, 'target': NEW_REGISTRY, 'files': 1})
+
+        # Nothing is left to restore.
+        mock_run.reset_mock()
+        tasks.start()
+        self.assertFalse(any('stop' in call[0][0]
+                             for call in mock_run.call_args_list))
+
+    @patch('filebeat_plugin.registry.REGISTRY_CANDIDATES', (NEW_REGISTRY,))
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_REGISTRY)
+    @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(node_id='node'))
+    def test_no_backup_in_place(self):
+        self.assertIsNone(tasks._backup_registry({}))
+        os.makedirs(os.path.dirname(NEW_REGISTRY))
+        with open(NEW_REGISTRY, 'w') as f:
+            f.write('[]')
+        self.assertIsNone(tasks._backup_registry({}, NEW_REGISTRY))
+        self.assertTrue(tasks._backup_registry({}))
+
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(node_id='node'))
+    @patch('filebeat_plugin.tasks.os.access', return_value=False)
+    @patch('filebeat_plugin.tasks._run', side_effect=run_locally)
+    def test_read_privileged(self, mock_run, _):
+        with open(OLD_REGISTRY, 'w') as f:
+            f.write('[]')
+        self.assertEqual(tasks._read_privileged(OLD_REGISTRY), '[]')
+        copy = mock_run.call_args[0][0].split()[-1]
+        self.assertFalse(os.path.exists(copy))
+        self.assertEqual(mock_run.call_count, 1)
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_REGISTRY)
+    @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(node_id='node'))
+    @patch('filebeat_plugin.tasks._backup_registry')
+    @patch('filebeat_plugin.tasks._run', side_effect=run_locally)
+    def test_configure_own_registry(self, _, mock_backup):
+        tasks.configure('', {'inputs': {}, 'outputs': {},
+                             'paths': {'syslog': ['/var/log/syslog']}},
+                        registry_file=NEW_REGISTRY)
+        with open(CONFIG_FILE) as f:
+            self.assertEqual(registry.configured_registry(f.read()),
+                             NEW_REGISTRY)
+        self.assertFalse(mock_backup.called)
@@ -0,0 +1,71 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import os
+import time
+import signal
+import unittest
+
+from mock import MagicMock, call, patch
+
+from .. import runner
+
+
+class TestRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = MagicMock()
+
+    def test_run_streams_output(self):
+        result = runner.run(['sh', '-c', 'echo one; echo two >&2'],
+                            self.logger)
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.aggr_stdout, 'one\n')
+        self.assertEqual(result.aggr_stderr, 'two\n')
+        self.assertIn(call('one'), self.logger.debug.call_args_list)
+        self.assertIn(call('two'), self.logger.debug.call_args_list)
+
+    @patch('filebeat_plugin.runner.OUTPUT_TAIL_LINES', 2)
+    def test_run_failed(self):
+        with self.assertRaises(runner.CommandFailed) as err:
+            runner.run('sh -c "seq 1 5 >&2; exit 3"', self.logger)
+        self.assertEqual(err.exception.code, 3)
+        self.assertEqual(err.exception.error, '4\n5\n')
+        self.assertGreaterEqual(err.exception.duration, 0)
+
+    def test_run_timeout_kills_process_group(self):
+        started = time.time()
+        with self.assertRaises(runner.CommandTimeout):
+            runner.run(['sh', '-c', 'sleep 30 & sleep 30; wait'],
+                       self.logger, timeout=0.5)
+        self.assertLess(time.time() - started, 10)
+
+    @patch('filebeat_plugin.runner.READER_GRACE_PERIOD', 0.5)
+    def test_run_leaves_daemon_holding_pipes(self):
+        started = time.time()
+        result = runner.run(['sh', '-c', 'sleep 30 & echo $!'], self.logger)
+        os.kill(int(result.aggr_stdout), signal.SIGKILL)
+        self.assertLess(time.time() - started, 10)
+        self.assertEqual(result.returncode, 0)
+
+    def test_run_all_concurrently(self):
+        started = time.time()
+        results = runner.run_all(['sleep 1', 'sleep 1', 'sleep 1'],
+                                 self.logger)
+        self.assertLess(time.time() - started, 2.5)
+        self.assertEqual([r.returncode for r in results], [0, 0, 0])
+        self.assertRaises(runner.CommandFailed, runner.run_all,
+                          ['true', 'false'], self.logger)
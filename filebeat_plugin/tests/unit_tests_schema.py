@@ -0,0 +1,144 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import os
+import shutil
+import unittest
+import tempfile
+
+from mock import patch
+
+from cloudify.mocks import MockCloudifyContext
+from .. import model
+from .. import schema
+from .. import tasks
+from . import run_locally
+
+
+TEMP_SCHEMA = os.path.join(tempfile.gettempdir(), 'filebeat_schema')
+CONFIG_FILE = os.path.join(TEMP_SCHEMA, 'filebeat.yml')
+CONFIG_INPUTS = {
+    'inputs': {'shipper': None, 'logging': {'level': 'info'}},
+    'outputs': {'logstash': {'hosts': ['localhost:5044'], 'worker': 2}},
+    'paths': {'syslog': ['/var/log/syslog']}
+}
+
+
+class TestSchema(unittest.TestCase):
+
+    def setUp(self):
+        os.mkdir(TEMP_SCHEMA)
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_SCHEMA)
+
+    def test_for_version(self):
+        self.assertIsNone(schema.for_version(None))
+        self.assertIsNone(schema.for_version((0, 12, 0)))
+        self.assertIs(schema.for_version((1, 2, 3)), schema.SCHEMA_1)
+        self.assertIs(schema.for_version((5, 6, 0)), schema.SCHEMA_5)
+        self.assertIs(schema.for_version((6, 2, 4)), schema.SCHEMA_6)
+        self.assertIs(schema.for_version((6, 8, 0)), schema.SCHEMA_6_3)
+        self.assertIs(schema.for_version((7, 17, 0)), schema.SCHEMA_7)
+
+    def test_validate(self):
+        config = model.from_inputs(CONFIG_INPUTS).to_dict()
+        for spec in (schema.SCHEMA_1, schema.SCHEMA_5):
+            self.assertEqual(schema.validate(config, spec), [])
+
+        config['output']['logstash'].update(worker='2', loadbalance=1)
+        config['filebeat']['prospectors'][0]['paths'] = '/var/log/syslog'
+        config['output.logstash.timeout'] = True
+        self.assertEqual(sorted(schema.validate(config, schema.SCHEMA_5)), [
+            'filebeat.prospectors[0].paths: expected a list',
+            'output.logstash.loadbalance: expected a boolean, got 1',
+            'output.logstash.timeout: expected a duration, got a boolean',
+            "output.logstash.worker: expected an integer, got '2'"])
+
+    def test_model_layouts(self):
+        inputs = dict(CONFIG_INPUTS, tuning={'spool_size': 2048,
+                                             'idle_timeout': '1s'},
+                      prospector_options={'syslog': {
+                          'ignore_older': '1h', 'close_older': '5m',
+                          'force_close_files': True}},
+                      registry_file='/var/lib/filebeat/registry')
+        for version in ((1, 2, 3), (5, 6, 0), (6, 2, 4), (6, 8, 0),
+                        (7, 17, 0)):
+            unknown = []
+            config = model.from_inputs(
+                dict(inputs, filebeat_version=version)).to_dict()
+            self.assertEqual(schema.validate(
+                config, schema.for_version(version), unknown=unknown), [])
+            self.assertEqual(unknown, [], version)
+
+    def test_unknown_settings(self):
+        unknown = []
+        config = {'filebeat': {'registry_file': '/r', 'typo': 1},
+                  'name': 'host'}
+        self.assertEqual(
+            schema.validate(config, schema.SCHEMA_1, unknown=unknown), [])
+        self.assertEqual(sorted(unknown), ['filebeat.typo', 'name'])
+
+    def test_result_cache(self):
+        path = os.path.join(TEMP_SCHEMA, 'state', 'validated.json')
+        validated = schema.ResultCache(path, kept=2)
+        for key in ('a', 'b', 'a', 'c'):
+            validated.add(key)
+        validated = schema.ResultCache(path)
+        self.assertEqual(validated.keys, ['a', 'c'])
+        self.assertNotIn('b', validated)
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_SCHEMA)
+    @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(node_id='node'))
+    @patch('filebeat_plugin.tasks._filebeat_version', return_value=(5, 6, 0))
+    @patch('filebeat_plugin.tasks._run', side_effect=run_locally)
+    def test_configure_skips_known_configtest(self, mock_run, _):
+        tasks.configure('', CONFIG_INPUTS)
+        self.assertEqual(mock_run.call_count, 3)
+        # The same configuration again, once it was replaced.
+        os.remove(CONFIG_FILE)
+        tasks.configure('', CONFIG_INPUTS)
+        self.assertEqual(mock_run.call_count, 5)
+        os.remove(CONFIG_FILE)
+        tasks.configure('', CONFIG_INPUTS, strict_validation=True)
+        self.assertEqual(mock_run.call_count, 8)
+
+        wrong = dict(CONFIG_INPUTS,
+                     outputs={'logstash': {'hosts': 'localhost:5044'}})
+        self.assertRaises(ValueError, tasks.configure, '', wrong)
+        self.assertEqual(mock_run.call_count, 8)
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_SCHEMA)
+    @patch('filebeat_plugin.tasks._ask_filebeat_version',
+           return_value=(5, 6, 0))
+    @patch('filebeat_plugin.tasks.which')
+    def test_filebeat_version_is_cached(self, mock_which, mock_ask):
+        executable = os.path.join(TEMP_SCHEMA, 'filebeat')
+        with open(executable, 'w') as f:
+            f.write('#!/bin/sh\n')
+        mock_which.return_value = executable
+        self.assertEqual(tasks._filebeat_version(), (5, 6, 0))
+        self.assertEqual(tasks._filebeat_version(), (5, 6, 0))
+        self.assertEqual(mock_ask.call_count, 1)
+
+        with open(executable, 'a') as f:
+            f.write('exit 0\n')
+        tasks._filebeat_version()
+        self.assertEqual(mock_ask.call_count, 2)
+
+        mock_which.return_value = None
+        self.assertIsNone(tasks._filebeat_version())
@@ -0,0 +1,263 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import os
+import shutil
+import unittest
+import tempfile
+
+from mock import call, patch
+
+from cloudify import exceptions
+from cloudify.mocks import MockCloudifyContext
+from .. import runner
+from .. import tarball
+from .. import tasks
+from . import run_all_locally, run_locally
+
+
+TEMP_TARBALL = os.path.join(tempfile.gettempdir(), 'filebeat_tarball')
+SERVICE_FILE = os.path.join(TEMP_TARBALL, 'filebeat.service')
+CONFIG_FILE = os.path.join(TEMP_TARBALL, 'filebeat.yml')
+ARCHIVE = os.path.join(TEMP_TARBALL, 'filebeat-5.6.3-linux-x86_64.tar.gz')
+
+
+class TestTarball(unittest.TestCase):
+
+    def setUp(self):
+        os.mkdir(TEMP_TARBALL)
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_TARBALL)
+
+    @patch('filebeat_plugin.tarball.platform.machine', return_value='amd64')
+    def test_download_url(self, _):
+        self.assertEqual(
+            tarball.download_url((1, 2, 3)),
+            'https://download.elastic.co/beats/filebeat/'
+            'filebeat-1.2.3-x86_64.tar.gz')
+        self.assertEqual(
+            tarball.download_url((6, 0, 0, 'beta1')),
+            'https://artifacts.elastic.co/downloads/beats/filebeat/'
+            'filebeat-6.0.0-beta1-linux-x86_64.tar.gz')
+        self.assertTrue(tarball.is_tarball(tarball.download_url((5, 6, 3))))
+        self.assertFalse(tarball.is_tarball('filebeat_5.6.3_amd64.deb'))
+
+    def test_versions(self):
+        self.assertIsNone(tarball.current_version(TEMP_TARBALL))
+        for version in ('1.2.3', '5.6.2', '5.6.3', '6.0.0'):
+            os.mkdir(os.path.join(TEMP_TARBALL, 'filebeat-' + version))
+        os.mkdir(os.path.join(TEMP_TARBALL, 'filebeat-1.0.0.partial'))
+        os.symlink(os.path.join(TEMP_TARBALL, 'filebeat-1.2.3'),
+                   tarball.current_link(TEMP_TARBALL))
+        self.assertEqual(tarball.current_version(TEMP_TARBALL), (1, 2, 3))
+        self.assertEqual(tarball.stale_dirs(TEMP_TARBALL, kept=2), [
+            os.path.join(TEMP_TARBALL, 'filebeat-5.6.2')])
+        # A pre-release is older than its release.
+        os.mkdir(os.path.join(TEMP_TARBALL, 'filebeat-6.0.0-rc1'))
+        self.assertEqual(tarball.stale_dirs(TEMP_TARBALL, kept=2), [
+            os.path.join(TEMP_TARBALL, 'filebeat-5.6.3'),
+            os.path.join(TEMP_TARBALL, 'filebeat-5.6.2')])
+
+    def test_service_files(self):
+        home = tarball.current_link('/opt/filebeat')
+        unit = tarball.systemd_unit(home, '/etc/filebeat/filebeat.yml',
+                                    (5, 6, 3))
+        self.assertIn(
+            'ExecStart=/opt/filebeat/current/filebeat '
+            '-c /etc/filebeat/filebeat.yml -path.home /opt/filebeat/current '
+            '-path.config /etc/filebeat -path.data /var/lib/filebeat '
+            '-path.logs /var/log/filebeat\n', unit)
+        script = tarball.init_script(home, '/etc/filebeat/filebeat.yml',
+                                     (1, 2, 3))
+        self.assertIn('nohup /opt/filebeat/current/filebeat '
+                      '-c /etc/filebeat/filebeat.yml >/dev/null', script)
+
+    @patch('filebeat_plugin.tarball.SYSTEMD_UNIT_FILE', SERVICE_FILE)
+    @patch('filebeat_plugin.tarball.INIT_SCRIPT_FILE', SERVICE_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(node_id='node'))
+    @patch('filebeat_plugin.tasks._run')
+    def test_install_tarball(self, mock_run):
+        # Only the service file is really installed, nothing is unpacked.
+        mock_run.side_effect = lambda command: \
+            command.split()[-1] == SERVICE_FILE and run_locally(command)
+        for version in ('1.2.3', '5.6.0', '5.6.1', '5.6.2'):
+            os.mkdir(os.path.join(TEMP_TARBALL, 'filebeat-' + version))
+
+        tasks.install_filebeat(os.path.basename(ARCHIVE), TEMP_TARBALL)
+        target = os.path.join(TEMP_TARBALL, 'filebeat-5.6.3')
+        link = tarball.current_link(TEMP_TARBALL)
+        commands = [call[0][0] for call in mock_run.call_args_list]
+        self.assertEqual(commands[:7], [
+            'sudo rm -rf {0}.partial'.format(target),
+            'sudo mkdir -p {0}.partial'.format(target),
+            'sudo tar -xzf {0} -C {1}.partial --strip-components=1'.format(
+                ARCHIVE, target),
+            'sudo mv {0}.partial {0}'.format(target),
+            'sudo ln -sfn {0} {1}.new'.format(target, link),
+            'sudo mv -T {0}.new {0}'.format(link),
+            'sudo ln -sfn {0}/filebeat /usr/bin/filebeat'.format(link)])
+        with open(SERVICE_FILE) as f:
+            self.assertIn(tarball.command(
+                link, tasks.FILEBEAT_CONFIG_FILE_DEFAULT, (5, 6, 3)),
+                f.read())
+        self.assertEqual(commands[-1], 'sudo rm -rf {0}'.format(
+            os.path.join(TEMP_TARBALL, 'filebeat-1.2.3')))
+
+        self.assertRaises(exceptions.NonRecoverableError,
+                          tasks._install_tarball,
+                          os.path.join(TEMP_TARBALL, 'filebeat.tar.gz'),
+                          TEMP_TARBALL)
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_TARBALL)
+    @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(node_id='node'))
+    @patch('filebeat_plugin.tasks._backup_registry', return_value=None)
+    @patch('filebeat_plugin.tasks._service_running', return_value=True)
+    @patch('filebeat_plugin.tasks._measure_shipping')
+    @patch('filebeat_plugin.tasks._activate')
+    @patch('filebeat_plugin.tasks._unpack_tarball')
+    @patch('filebeat_plugin.tasks.download_filebeat',
+           return_value=os.path.basename(ARCHIVE))
+    @patch('filebeat_plugin.tasks._run')
+    def test_upgrade(self, mock_run, _, mock_unpack, mock_activate,
+                     mock_measure, *__):
+        mock_run.side_effect = run_locally
+        previous = os.path.join(TEMP_TARBALL, 'filebeat-5.6.2')
+        target = os.path.join(TEMP_TARBALL, 'filebeat-5.6.3')
+        os.mkdir(previous)
+        os.symlink(previous, tarball.current_link(TEMP_TARBALL))
+        with open(CONFIG_FILE, 'w') as f:
+            f.write('previous')
+        mock_unpack.return_value = (target, (5, 6, 3))
+        before = {'seconds': 1, 'bytes_per_second': 1000, 'lag_bytes': 10,
+                  'files': 1, 'shipping': True}
+
+        self.assertFalse(tasks.upgrade(filebeat_version='5.6.2',
+                                       filebeat_install_path=TEMP_TARBALL))
+        self.assertRaises(exceptions.NonRecoverableError, tasks.upgrade,
+                          filebeat_version='7.17.0',
+                          filebeat_install_path=TEMP_TARBALL)
+        self.assertRaises(exceptions.NonRecoverableError, tasks.upgrade,
+                          download_url='http://m/filebeat_5.6.3_amd64.deb',
+                          filebeat_install_path=TEMP_TARBALL)
+        self.assertFalse(mock_unpack.called)
+        mock_measure.side_effect = [
+            before, dict(before, bytes_per_second=300)]
+        self.assertRaises(exceptions.NonRecoverableError, tasks.upgrade,
+                          filebeat_version='5.6.3',
+                          filebeat_install_path=TEMP_TARBALL,
+                          verify_seconds=1)
+        outcome = tasks.ctx.instance.runtime_properties['filebeat_upgrade']
+        self.assertEqual((outcome['from'], outcome['to']),
+                         ('5.6.2', '5.6.3'))
+        self.assertTrue(outcome['rolled_back'])
+        self.assertIn('below 0.5', outcome['reason'])
+        self.assertEqual(mock_activate.call_args_list, [
+            call(TEMP_TARBALL, target, (5, 6, 3)),
+            call(TEMP_TARBALL, previous, (5, 6, 2))])
+        self.assertIn('{0} -c {1} -configtest'.format(
+            os.path.join(target, 'filebeat'), CONFIG_FILE),
+            [c[0][0] for c in mock_run.call_args_list])
+        with open(CONFIG_FILE) as f:
+            self.assertEqual(f.read(), 'previous')
+
+        mock_activate.reset_mock()
+        mock_measure.side_effect = [before, dict(before, files=0)]
+        self.assertRaises(exceptions.NonRecoverableError, tasks.upgrade,
+                          filebeat_version='5.6.3',
+                          filebeat_install_path=TEMP_TARBALL)
+        self.assertEqual(mock_activate.call_count, 2)
+
+        # A configuration the new binary rejects never gets it activated.
+        mock_activate.reset_mock()
+        mock_measure.side_effect = [before]
+        configtest = '{0} -c {1} -configtest'.format(
+            os.path.join(target, 'filebeat'), CONFIG_FILE)
+
+        def reject(command):
+            if command == configtest:
+                raise runner.CommandFailed(command, 'bad', '', 1, 0)
+            run_locally(command)
+        mock_run.side_effect = reject
+        mock_run.reset_mock()
+        self.assertRaises(runner.CommandFailed, tasks.upgrade,
+                          filebeat_version='5.6.3',
+                          filebeat_install_path=TEMP_TARBALL)
+        self.assertFalse(mock_activate.called)
+        self.assertNotIn('restart', ' '.join(
+            c[0][0] for c in mock_run.call_args_list))
+        self.assertTrue(tasks.ctx.instance.runtime_properties[
+            'filebeat_upgrade']['rolled_back'])
+        with open(CONFIG_FILE) as f:
+            self.assertEqual(f.read(), 'previous')
+
+        mock_run.side_effect = run_locally
+        mock_measure.side_effect = [before, before]
+        self.assertTrue(tasks.upgrade(filebeat_version='5.6.3',
+                                      filebeat_install_path=TEMP_TARBALL,
+                                      verify_seconds=1))
+        self.assertFalse(tasks.ctx.instance.runtime_properties[
+            'filebeat_upgrade']['rolled_back'])
+        self.assertFalse(os.path.exists(os.path.join(
+            TEMP_TARBALL, tasks.UPGRADE_CONFIG_BACKUP_FILE)))
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_TARBALL)
+    @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(node_id='node'))
+    @patch('filebeat_plugin.tasks._backup_registry', return_value=None)
+    @patch('filebeat_plugin.tasks._service_running', return_value=True)
+    @patch('filebeat_plugin.tasks._measure_shipping')
+    @patch('filebeat_plugin.tasks._activate')
+    @patch('filebeat_plugin.tasks._unpack_tarball')
+    @patch('filebeat_plugin.tasks.download_filebeat',
+           return_value=os.path.basename(ARCHIVE))
+    @patch('filebeat_plugin.tasks._run_all')
+    @patch('filebeat_plugin.tasks._run')
+    def test_upgrade_restores_fragments(self, mock_run, mock_run_all, _,
+                                        mock_unpack, __, mock_measure, *___):
+        mock_run.side_effect = run_locally
+        mock_run_all.side_effect = run_all_locally
+        config_dir = os.path.join(TEMP_TARBALL, 'conf.d')
+        os.mkdir(config_dir)
+        for name in ('app.yml', 'other.yml'):
+            with open(os.path.join(config_dir, name), 'w') as f:
+                f.write('previous')
+        tasks._fragments_manifest().record(config_dir, ['app.yml'])
+        previous = os.path.join(TEMP_TARBALL, 'filebeat-5.6.2')
+        os.mkdir(previous)
+        os.symlink(previous, tarball.current_link(TEMP_TARBALL))
+        with open(CONFIG_FILE, 'w') as f:
+            f.write('previous')
+        mock_unpack.return_value = (
+            os.path.join(TEMP_TARBALL, 'filebeat-5.6.3'), (5, 6, 3))
+        before = {'seconds': 1, 'bytes_per_second': 1000, 'lag_bytes': 10,
+                  'files': 1, 'shipping': True}
+        mock_measure.side_effect = [before, dict(before, shipping=False)]
+
+        self.assertRaises(exceptions.NonRecoverableError, tasks.upgrade,
+                          filebeat_version='5.6.3',
+                          filebeat_install_path=TEMP_TARBALL,
+                          filebeat_config_inputs={
+                              'inputs': {}, 'outputs': {},
+                              'paths': {'app': ['/a'], 'web': ['/w']}},
+                          filebeat_config_dir=config_dir)
+        self.assertEqual(sorted(os.listdir(config_dir)),
+                         ['app.yml', 'other.yml'])
+        with open(os.path.join(config_dir, 'app.yml')) as f:
+            self.assertEqual(f.read(), 'previous')
+        self.assertEqual(tasks._fragments_manifest().written(config_dir),
+                         set(['app.yml']))
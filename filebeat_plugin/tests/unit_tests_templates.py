@@ -0,0 +1,73 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import os
+import shutil
+import unittest
+import tempfile
+
+from mock import patch
+
+from .. import templates
+
+
+TEMP_CACHE = os.path.join(tempfile.gettempdir(), 'filebeat_templates')
+SOURCE = '''prospectors:
+{%- for elem, list in paths|dictsort %}
+  - document_type: {{ elem }}
+    paths: {{ list }}
+{%- endfor %}
+'''
+
+
+@patch('filebeat_plugin.templates._environment', None)
+class TestTemplates(unittest.TestCase):
+
+    def tearDown(self):
+        if os.path.exists(TEMP_CACHE):
+            shutil.rmtree(TEMP_CACHE)
+
+    def test_template_compiled_once(self):
+        template = templates.from_source(SOURCE, TEMP_CACHE)
+        self.assertIs(templates.from_source(SOURCE, TEMP_CACHE), template)
+        self.assertTrue(os.listdir(os.path.join(
+            TEMP_CACHE, templates.plugin_version())))
+
+    def test_source_cached_by_content(self):
+        template = templates.from_source('a: {{ a }}', TEMP_CACHE)
+        self.assertIs(templates.from_source(b'a: {{ a }}', TEMP_CACHE),
+                      template)
+        self.assertIsNot(templates.from_source('b: {{ a }}', TEMP_CACHE),
+                         template)
+        self.assertEqual(template.render(a=1), 'a: 1')
+
+    def test_bytecode_reused_across_environments(self):
+        templates.from_source(SOURCE, TEMP_CACHE)
+        with patch('filebeat_plugin.templates._environment', None):
+            with patch('jinja2.Environment._parse') as mock_parse:
+                templates.from_source(SOURCE, TEMP_CACHE)
+        self.assertFalse(mock_parse.called)
+
+    def test_render_to_file(self):
+        template = templates.from_source(SOURCE, TEMP_CACHE)
+        variables = {'paths': dict(('type{0}'.format(index),
+                                    ['/var/log/{0}.log'.format(index)])
+                                   for index in range(500))}
+        path = os.path.join(TEMP_CACHE, 'filebeat.yml')
+        with patch('filebeat_plugin.templates.STREAM_BUFFER_SIZE', 4):
+            templates.render_to_file(template, variables, path)
+        with open(path) as f:
+            self.assertEqual(f.read(), template.render(variables))
@@ -0,0 +1,126 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import os
+import shutil
+import unittest
+import tempfile
+
+from mock import patch
+
+from cloudify.mocks import MockCloudifyContext
+from .. import tasks
+from .. import tuning
+from . import run_locally
+
+
+TEMP_TUNING = os.path.join(tempfile.gettempdir(), 'filebeat_tuning')
+CONFIG_FILE = os.path.join(TEMP_TUNING, 'filebeat.yml')
+GiB = 1024 ** 3
+
+
+def host(bytes_per_second=0.0, cpu_count=4, memory_bytes=8 * GiB):
+    return {'cpu_count': cpu_count, 'memory_bytes': memory_bytes,
+            'file_count': 2, 'bytes_per_second': bytes_per_second}
+
+
+class TestTuning(unittest.TestCase):
+
+    def setUp(self):
+        os.mkdir(TEMP_TUNING)
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_TUNING)
+
+    def test_memory_bytes(self):
+        meminfo = os.path.join(TEMP_TUNING, 'meminfo')
+        with open(meminfo, 'w') as f:
+            f.write('MemTotal:        2048 kB\nMemFree:  1024 kB\n')
+        self.assertEqual(tuning.memory_bytes(meminfo), 2048 * 1024)
+        self.assertIsNone(tuning.memory_bytes(meminfo + '.missing'))
+
+    def test_inspect_host_measures_growth(self):
+        log = os.path.join(TEMP_TUNING, 'app.log')
+        with open(log, 'w') as f:
+            f.write('x' * 100)
+
+        def grow(seconds):
+            with open(log, 'a') as f:
+                f.write('x' * 1000)
+        with patch('filebeat_plugin.tuning.time.sleep', side_effect=grow):
+            measured = tuning.inspect_host(
+                {'app': [os.path.join(TEMP_TUNING, '*.log')]}, 0.5)
+        self.assertEqual(measured['file_count'], 1)
+        self.assertEqual(measured['bytes_per_second'], 2000)
+
+    def test_quiet_host(self):
+        settings, rationale = tuning.derive(host(), {'logstash': {}})
+        self.assertEqual(settings['spool_size'], tuning.SPOOL_SIZE_MIN)
+        self.assertEqual(settings['idle_timeout'], '5s')
+        self.assertEqual(settings['outputs'],
+                         {'logstash': {'worker': 2, 'bulk_max_size': 1024,
+                                       'pipelining': 2}})
+        self.assertEqual(set(rationale), set(['spool_size', 'idle_timeout',
+                                              'worker', 'bulk_max_size',
+                                              'pipelining']))
+
+    def test_busy_host(self):
+        settings, _ = tuning.derive(host(bytes_per_second=2000000.0),
+                                    {'elasticsearch': {}})
+        self.assertEqual(settings['spool_size'], 16384)
+        self.assertEqual(settings['idle_timeout'], '1s')
+        self.assertEqual(settings['outputs']['elasticsearch'],
+                         {'worker': 2, 'bulk_max_size': 1024,
+                          'flush_interval': '1s'})
+        settings, _ = tuning.derive(host(cpu_count=8), {'elasticsearch': {}})
+        self.assertEqual(
+            settings['outputs']['elasticsearch']['compression_level'], 1)
+
+    def test_spool_bounded_by_memory(self):
+        settings, _ = tuning.derive(
+            host(bytes_per_second=2000000.0, memory_bytes=256 * 1024 ** 2),
+            {})
+        self.assertEqual(settings['spool_size'], 5242)
+
+    def test_apply_keeps_given_options(self):
+        settings, _ = tuning.derive(host(cpu_count=16), {'logstash': {}})
+        config = tuning.apply(
+            {'outputs': {'logstash': {'worker': 1, 'hosts': ['a:5044']}}},
+            settings)
+        self.assertEqual(config['outputs']['logstash'],
+                         {'worker': 1, 'bulk_max_size': 1024,
+                          'pipelining': 2, 'hosts': ['a:5044']})
+        self.assertEqual(config['tuning']['spool_size'], 1024)
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_TUNING)
+    @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext(node_id='node'))
+    @patch('filebeat_plugin.tuning.inspect_host', return_value=host())
+    @patch('filebeat_plugin.tasks._run', side_effect=run_locally)
+    def test_configure_auto_tune(self, mock_run, _):
+        tasks.configure('', {'inputs': {'shipper': None},
+                             'outputs': {'logstash': {'hosts': ['a:5044']}},
+                             'paths': {'syslog': ['/var/log/syslog']}},
+                        auto_tune=True)
+        with open(CONFIG_FILE) as f:
+            rendered = f.read()
+        self.assertIn('spool_size: 1024', rendered)
+        self.assertIn('idle_timeout: 5s', rendered)
+        self.assertIn('worker: 2', rendered)
+        self.assertIn(
+            'spool_size',
+            tasks.ctx.instance.runtime_properties['filebeat_tuning'][
+                'rationale'])
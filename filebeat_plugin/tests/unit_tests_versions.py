@@ -0,0 +1,142 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import os
+import shutil
+import unittest
+import tempfile
+
+from mock import patch
+
+from cloudify import exceptions
+from cloudify.mocks import MockCloudifyContext
+from .. import tasks
+from .. import versions
+
+
+TEMP_STATE = os.path.join(tempfile.gettempdir(), 'filebeat_versions')
+CONFIG_FILE = os.path.join(TEMP_STATE, 'filebeat.yml')
+URL = 'http://mirror/filebeat-5.6.0-amd64.deb'
+
+
+class TestVersions(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(versions.parse('filebeat version 1.2.3 (amd64)'),
+                         (1, 2, 3))
+        self.assertEqual(versions.parse('install ok installed 5.0.0~alpha5'),
+                         (5, 0, 0, 'alpha5'))
+        self.assertIsNone(versions.parse('filebeat'))
+        self.assertIsNone(versions.parse(''))
+
+    def test_sort_key(self):
+        ordered = [(5, 6, 3), (6, 0, 0, 'alpha9'), (6, 0, 0, 'alpha10'),
+                   (6, 0, 0, 'beta1'), (6, 0, 0, 'rc1'), (6, 0, 0)]
+        self.assertEqual(sorted(reversed(ordered), key=versions.sort_key),
+                         ordered)
+
+    def test_from_url(self):
+        self.assertEqual(versions.from_url(
+            'https://download.elastic.co/beats/filebeat/'
+            'filebeat_1.2.3_amd64.deb'), (1, 2, 3))
+        self.assertEqual(versions.from_url(
+            'https://download.elastic.co/beats/filebeat/'
+            'filebeat-5.0.0-alpha5-amd64.deb'), (5, 0, 0, 'alpha5'))
+        self.assertEqual(versions.from_url(
+            'http://mirror/filebeat-1.2.3-x86_64.rpm'), (1, 2, 3))
+
+    def test_to_string(self):
+        self.assertEqual(versions.to_string((5, 0, 0, 'alpha5')),
+                         '5.0.0-alpha5')
+        self.assertEqual(versions.to_string(None), '')
+
+
+class TestInstallFastPath(unittest.TestCase):
+
+    def setUp(self):
+        os.mkdir(TEMP_STATE)
+        open(CONFIG_FILE, 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_STATE)
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_STATE)
+    @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext())
+    @patch('filebeat_plugin.tasks.configure')
+    @patch('filebeat_plugin.tasks.install_filebeat')
+    @patch('filebeat_plugin.tasks.download_filebeat')
+    def test_install_skips_installed_version(self, mock_download,
+                                             mock_install, mock_configure):
+        with patch('filebeat_plugin.tasks._installed_version',
+                   return_value=(5, 6, 0)):
+            tasks.install({}, filebeat_install_path=TEMP_STATE,
+                          download_url=URL)
+            tasks.install({}, filebeat_install_path=TEMP_STATE,
+                          filebeat_version='5.6.0')
+        self.assertFalse(mock_download.called)
+        self.assertFalse(mock_install.called)
+        self.assertEqual(mock_configure.call_count, 2)
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_STATE)
+    @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext())
+    @patch('filebeat_plugin.tasks.configure')
+    @patch('filebeat_plugin.tasks.install_filebeat')
+    @patch('filebeat_plugin.tasks.download_filebeat',
+           return_value='filebeat-5.6.0-amd64.deb')
+    def test_install_other_version(self, mock_download, mock_install, _):
+        open(os.path.join(TEMP_STATE, 'filebeat-5.6.0-amd64.deb'), 'w').close()
+        with patch('filebeat_plugin.tasks._installed_version',
+                   return_value=(1, 2, 3)):
+            tasks.install({}, filebeat_install_path=TEMP_STATE,
+                          download_url=URL)
+        self.assertTrue(mock_download.called)
+        self.assertTrue(mock_install.called)
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_STATE)
+    @patch('filebeat_plugin.tasks.FILEBEAT_CONFIG_FILE_DEFAULT', CONFIG_FILE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext())
+    @patch('filebeat_plugin.tasks.configure')
+    @patch('filebeat_plugin.tasks.install_filebeat')
+    @patch('filebeat_plugin.tasks.download_filebeat')
+    @patch('filebeat_plugin.tasks.tarball.current_version', return_value=None)
+    def test_install_tarball_of_other_version(self, _, mock_download,
+                                              mock_install, __):
+        def download(url, *args):
+            name = url.split('/')[-1]
+            open(os.path.join(TEMP_STATE, name), 'w').close()
+            return name
+        mock_download.side_effect = download
+        for version in ('5.0.0', '6.0.0'):
+            tasks.install({}, filebeat_install_path=TEMP_STATE,
+                          filebeat_version=version, install_method='tarball')
+        self.assertEqual(
+            [versions.from_url(call[0][0])
+             for call in mock_download.call_args_list],
+            [(5, 0, 0), (6, 0, 0)])
+        self.assertEqual(mock_install.call_count, 2)
+
+    @patch('filebeat_plugin.tasks.FILEBEAT_STATE_DIR_DEFAULT', TEMP_STATE)
+    @patch('filebeat_plugin.tasks.ctx', MockCloudifyContext())
+    @patch('filebeat_plugin.tasks.download_filebeat')
+    def test_install_partial_version(self, mock_download):
+        for install_method in ('package', 'tarball'):
+            self.assertRaises(exceptions.NonRecoverableError, tasks.install,
+                              {}, filebeat_install_path=TEMP_STATE,
+                              filebeat_version='6.3',
+                              install_method=install_method)
+        self.assertFalse(mock_download.called)
@@ -0,0 +1,78 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+
+import unittest
+
+from mock import MagicMock, patch
+
+from cloudify import exceptions
+from .. import workflows
+
+
+def mock_instance(instance_id, fail_on=None):
+    instance = MagicMock(id=instance_id, node_id='vm')
+    instance.node.operations = workflows.OPERATIONS_DEFAULT
+
+    def execute_operation(operation, kwargs=None):
+        result = MagicMock()
+        if operation == fail_on:
+            result.get.side_effect = RuntimeError('failed')
+        instance.executed.append(operation)
+        return result
+    instance.executed = []
+    instance.execute_operation.side_effect = execute_operation
+    return instance
+
+
+class TestRolloutWorkflow(unittest.TestCase):
+
+    def test_plan_waves(self):
+        waves = workflows.plan_waves(range(8), parallelism=3, canary_size=1)
+        self.assertEqual(waves, [[0], [1, 2, 3], [4, 5, 6], [7]])
+        self.assertEqual(workflows.plan_waves([], 3, 1), [])
+        self.assertRaises(ValueError, workflows.plan_waves, [1], 0, 1)
+
+    def test_rollout_all_waves(self):
+        instances = [mock_instance('vm_{0}'.format(i)) for i in range(5)]
+        with patch('filebeat_plugin.workflows.ctx') as ctx:
+            ctx.node_instances = instances
+            workflows.rollout(parallelism=2)
+        for instance in instances:
+            self.assertEqual(instance.executed, workflows.OPERATIONS_DEFAULT)
+
+    def test_rollout_stops_on_failed_canary(self):
+        instances = [mock_instance('vm_0', fail_on=(
+            workflows.OPERATIONS_DEFAULT[0]))]
+        instances += [mock_instance('vm_{0}'.format(i)) for i in range(1, 4)]
+        with patch('filebeat_plugin.workflows.ctx') as ctx:
+            ctx.node_instances = instances
+            self.assertRaises(exceptions.NonRecoverableError,
+                              workflows.rollout, parallelism=2)
+        self.assertEqual(instances[0].executed,
+                         workflows.OPERATIONS_DEFAULT[:1])
+        for instance in instances[1:]:
+            self.assertEqual(instance.executed, [])
+
+    def test_rollout_tolerates_failure_rate(self):
+        instances = [mock_instance('vm_0')]
+        instances += [mock_instance('vm_1', fail_on=(
+            workflows.OPERATIONS_DEFAULT[1]))]
+        instances += [mock_instance('vm_{0}'.format(i)) for i in range(2, 6)]
+        with patch('filebeat_plugin.workflows.ctx') as ctx:
+            ctx.node_instances = instances
+            workflows.rollout(parallelism=5, max_failure_rate=0.5)
+        self.assertEqual(instances[-1].executed,
+                         workflows.OPERATIONS_DEFAULT)
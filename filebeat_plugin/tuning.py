@@ -0,0 +1,166 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+import time
+import multiprocessing
+
+from filebeat_plugin import planner
+
+SAMPLE_SECONDS_DEFAULT = 1.0
+# Rough size of one log line, used to turn byte growth into events.
+LINE_BYTES = 200
+# Rough in-memory size of one spooled event.
+EVENT_MEMORY_BYTES = 1024
+# Share of the host memory the spooler may take.
+SPOOL_MEMORY_SHARE = 0.02
+SPOOL_SIZE_MIN = 1024
+SPOOL_SIZE_MAX = 65536
+BUSY_EVENTS_PER_SECOND = 1000
+WORKERS_MAX = 8
+BULK_MAX_SIZE = {'logstash': 4096, 'elasticsearch': 1024}
+# Batches a logstash worker keeps in flight while waiting for acks.
+PIPELINING = 2
+# Hosts with this many cpus can spare one for compressing bulk requests.
+COMPRESSION_MIN_CPUS = 8
+
+
+def memory_bytes(meminfo='/proc/meminfo'):
+    try:
+        with open(meminfo) as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+
+def _sizes(files):
+    sizes = {}
+    for path in files:
+        try:
+            with open(path, 'rb') as f:
+                f.seek(0, 2)
+                sizes[path] = f.tell()
+        except (IOError, OSError):
+            continue
+    return sizes
+
+
+def inspect_host(paths, sample_seconds=SAMPLE_SECONDS_DEFAULT):
+    """Collect what the tuning depends on.
+
+    paths is the {document_type: [globs]} input; the matched files are
+    sampled twice, sample_seconds apart, to measure how fast they grow.
+    """
+    files = set(entry.path for entries in planner.expand(paths).values()
+                for entry in entries)
+    before = _sizes(files)
+    if sample_seconds and before:
+        time.sleep(sample_seconds)
+    after = _sizes(files)
+    growth = sum(max(0, after[path] - before.get(path, after[path]))
+                 for path in after)
+    return {'cpu_count': multiprocessing.cpu_count(),
+            'memory_bytes': memory_bytes(),
+            'file_count': len(after),
+            'bytes_per_second': growth / sample_seconds
+            if sample_seconds else 0.0}
+
+
+def _power_of_two(value):
+    power = 1
+    while power < value:
+        power *= 2
+    return power
+
+
+def derive(host, outputs):
+    """Derive shipper and output settings from inspect_host's result.
+
+    Returns (settings, rationale) where settings holds spool_size,
+    idle_timeout and an {output: {option: value}} mapping under 'outputs',
+    and rationale explains each value.
+    """
+    events_per_second = host['bytes_per_second'] / LINE_BYTES
+    busy = events_per_second > BUSY_EVENTS_PER_SECOND
+    idle_seconds = 1 if busy else 5
+    rationale = {}
+
+    spool_max = SPOOL_SIZE_MAX
+    if host.get('memory_bytes'):
+        spool_max = int(host['memory_bytes'] * SPOOL_MEMORY_SHARE /
+                        EVENT_MEMORY_BYTES)
+        spool_max = max(SPOOL_SIZE_MIN, min(SPOOL_SIZE_MAX, spool_max))
+    spool_size = max(SPOOL_SIZE_MIN, min(
+        spool_max, _power_of_two(events_per_second * idle_seconds)))
+    rationale['spool_size'] = (
+        '{0:.0f} events/s over {1} files flushed every {2}s, capped at {3} '
+        'events ({4:.0%} of memory)'.format(
+            events_per_second, host['file_count'], idle_seconds, spool_max,
+            SPOOL_MEMORY_SHARE))
+    rationale['idle_timeout'] = (
+        'busy host, flush every second' if busy
+        else 'quiet host, flush every 5 seconds')
+
+    workers = max(1, min(WORKERS_MAX, host['cpu_count'] // 2))
+    tuned_outputs = {}
+    for output in (outputs or {}):
+        values = {'worker': workers}
+        if output in BULK_MAX_SIZE:
+            values['bulk_max_size'] = min(spool_size, BULK_MAX_SIZE[output])
+        if output == 'logstash':
+            values['pipelining'] = PIPELINING
+        if output == 'elasticsearch' and busy:
+            values['flush_interval'] = '1s'
+        if output == 'elasticsearch' and \
+                host['cpu_count'] >= COMPRESSION_MIN_CPUS:
+            values['compression_level'] = 1
+        tuned_outputs[output] = values
+    rationale['worker'] = 'half of {0} cpus, at most {1}'.format(
+        host['cpu_count'], WORKERS_MAX)
+    rationale['bulk_max_size'] = 'one spool, at most {0}'.format(
+        BULK_MAX_SIZE)
+    if 'logstash' in tuned_outputs:
+        rationale['pipelining'] = (
+            '{0} batches in flight per logstash worker, from filebeat 5.0 '
+            'on'.format(PIPELINING))
+    if host['cpu_count'] >= COMPRESSION_MIN_CPUS and \
+            'elasticsearch' in tuned_outputs:
+        rationale['compression_level'] = (
+            'at least {0} cpus, compress bulk requests, from filebeat 5.0 '
+            'on'.format(COMPRESSION_MIN_CPUS))
+
+    settings = {'spool_size': spool_size,
+                'idle_timeout': '{0}s'.format(idle_seconds),
+                'outputs': tuned_outputs}
+    return settings, rationale
+
+
+def apply(filebeat_config, settings):
+    """Return a copy of filebeat_config with the tuned output options.
+
+    Options set explicitly in the outputs input are kept as they are.
+    """
+    config = dict(filebeat_config)
+    outputs = {}
+    for output, options in (config.get('outputs') or {}).items():
+        merged = dict(settings['outputs'].get(output, {}))
+        merged.update(options or {})
+        outputs[output] = merged
+    config['outputs'] = outputs
+    config['tuning'] = {'spool_size': settings['spool_size'],
+                        'idle_timeout': settings['idle_timeout']}
+    return config
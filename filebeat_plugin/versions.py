@@ -0,0 +1,67 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+import re
+
+# Matches 1.2.3, 5.0.0-alpha5 (package file names) and 5.0.0~alpha5 (dpkg).
+VERSION_PATTERN = re.compile(
+    r'(\d+)\.(\d+)\.(\d+)(?:[-~_.]?((?:alpha|beta|rc)\d+))?')
+PRE_RELEASE_PATTERN = re.compile(r'(alpha|beta|rc)(\d+)')
+PRE_RELEASES = ('alpha', 'beta', 'rc')
+
+
+def parse(text):
+    """Return the first version found in text as a tuple, or None.
+
+    The tuple is (major, minor, patch) with the pre-release tag, such as
+    'alpha5', appended when there is one.
+    """
+    if not text:
+        return None
+    match = VERSION_PATTERN.search(text)
+    if not match:
+        return None
+    version = tuple(int(part) for part in match.groups()[:3])
+    if match.group(4):
+        version += (match.group(4),)
+    return version
+
+
+def sort_key(version):
+    """Return a key ordering versions as released.
+
+    A pre-release comes before its release, and alpha10 after alpha9.
+    """
+    key = tuple(version[:3])
+    if len(version) < 4:
+        return key + (len(PRE_RELEASES), 0)
+    match = PRE_RELEASE_PATTERN.match(version[3])
+    return key + (PRE_RELEASES.index(match.group(1)), int(match.group(2)))
+
+
+def from_url(url):
+    """Return the version of the package a download url points at."""
+    if not url:
+        return None
+    return parse(url.split('/')[-1])
+
+
+def to_string(version):
+    if not version:
+        return ''
+    text = '.'.join(str(part) for part in version[:3])
+    if len(version) > 3:
+        text += '-' + version[3]
+    return text
@@ -0,0 +1,109 @@
+########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+########
+import time
+
+from cloudify import exceptions
+from cloudify.decorators import workflow
+from cloudify.workflows import ctx
+
+MONITORING_AGENT_INTERFACE = 'cloudify.interfaces.monitoring_agent'
+OPERATIONS_DEFAULT = [MONITORING_AGENT_INTERFACE + '.install',
+                      MONITORING_AGENT_INTERFACE + '.start']
+
+
+def plan_waves(instances, parallelism, canary_size):
+    """Split instances into a canary wave followed by parallelism sized
+    waves.
+    """
+    if parallelism < 1:
+        raise ValueError('parallelism must be at least 1')
+    instances = list(instances)
+    waves = []
+    if canary_size > 0:
+        waves.append(instances[:canary_size])
+        instances = instances[canary_size:]
+    for start in range(0, len(instances), parallelism):
+        waves.append(instances[start:start + parallelism])
+    return [wave for wave in waves if wave]
+
+
+def _run_wave(wave, operations, operation_kwargs):
+    """Run operations in order on every instance of the wave concurrently.
+
+    An instance whose operation failed is not given the next operations.
+    Returns {instance id: error} for the failed instances.
+    """
+    failed = {}
+    remaining = list(wave)
+    for operation in operations:
+        results = [(instance, instance.execute_operation(
+            operation, kwargs=operation_kwargs.get(operation)))
+            for instance in remaining]
+        remaining = []
+        for instance, result in results:
+            try:
+                result.get()
+            except Exception as e:
+                failed[instance.id] = '{0}: {1}'.format(operation, e)
+            else:
+                remaining.append(instance)
+    return failed
+
+
+@workflow
+def rollout(node_ids=None,
+            operations=None,
+            operation_kwargs=None,
+            parallelism=10,
+            canary_size=1,
+            max_failure_rate=0.0,
+            **kwargs):
+    """Run the filebeat monitoring agent operations across node instances.
+
+    Instances are processed in waves: a canary wave of canary_size
+    instances first, then waves of at most parallelism instances, so the
+    download mirror and the outputs never see the whole fleet at once.
+    The rollout stops once the failure rate over all processed instances
+    exceeds max_failure_rate. Every wave reports its timing.
+    """
+    operations = operations or OPERATIONS_DEFAULT
+    operation_kwargs = operation_kwargs or {}
+    instances = [instance for instance in ctx.node_instances
+                 if (not node_ids or instance.node_id in node_ids) and
+                 operations[0] in instance.node.operations]
+    waves = plan_waves(instances, parallelism, canary_size)
+    ctx.logger.info('Rolling out filebeat to {0} instances in {1} waves.'
+                    .format(len(instances), len(waves)))
+
+    processed = 0
+    failed = {}
+    for number, wave in enumerate(waves, 1):
+        started = time.time()
+        wave_failed = _run_wave(wave, operations, operation_kwargs)
+        processed += len(wave)
+        failed.update(wave_failed)
+        ctx.logger.info(
+            'Wave {0}/{1}: {2} instances, {3} failed, {4:.1f} seconds.'
+            .format(number, len(waves), len(wave), len(wave_failed),
+                    time.time() - started))
+        for instance_id, error in sorted(wave_failed.items()):
+            ctx.logger.error('{0} failed: {1}'.format(instance_id, error))
+        if float(len(failed)) / processed > max_failure_rate:
+            raise exceptions.NonRecoverableError(
+                'Rollout stopped after wave {0}: {1} of {2} instances failed'
+                .format(number, len(failed), processed))
+    ctx.logger.info('Rollout finished: {0} instances, {1} failed.'.format(
+        processed, len(failed)))